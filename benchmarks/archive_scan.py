@@ -0,0 +1,78 @@
+"""Compare loading a library from an archive with loading it from disk.
+
+Generates a synthetic library, zips it and tars it, and times a cold scan
+of the extracted files, of the zip and of the tar.gz, then a re-scan of
+the zip through a LibraryManifest before and after one member changes.
+
+Usage:
+    python benchmarks/archive_scan.py [--planes N] [--checklists N]
+        [--steps N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+from fileio import search_directory_for_planes  # noqa: E402
+from generate_library import generate_library  # noqa: E402
+from manifest import LibraryManifest  # noqa: E402
+
+
+def timed_scan(label: str, path: str, manifest=None):
+    """Scan a directory or archive and print how long it took."""
+    start = time.perf_counter()
+    library = search_directory_for_planes(path, manifest)
+    elapsed = time.perf_counter() - start
+    stats = '' if manifest is None else '  ' + str(manifest.stats)
+    print('{:<22} {:>6} planes  {:8.3f} s{}'.format(label, len(library),
+                                                     elapsed, stats))
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=2000)
+    parser.add_argument('--checklists', type=int, default=5)
+    parser.add_argument('--steps', type=int, default=20)
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='flysimchk_archive_')
+    try:
+        library_directory = os.path.join(directory, 'library')
+        generate_library(library_directory, arguments.planes,
+                         arguments.checklists, arguments.steps)
+        names = sorted(os.listdir(library_directory))
+        zip_path = os.path.join(directory, 'bundle.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for name in names:
+                bundle.write(os.path.join(library_directory, name), name)
+        tar_path = os.path.join(directory, 'bundle.tar.gz')
+        with tarfile.open(tar_path, 'w:gz') as bundle:
+            for name in names:
+                bundle.add(os.path.join(library_directory, name), name)
+        timed_scan('extracted files', library_directory)
+        timed_scan('zip', zip_path)
+        timed_scan('tar.gz', tar_path)
+        manifest = LibraryManifest(os.path.join(directory, 'manifest'))
+        timed_scan('zip, cold manifest', zip_path, manifest)
+        timed_scan('zip, unchanged', zip_path, manifest)
+        with zipfile.ZipFile(zip_path, 'a') as bundle:
+            bundle.writestr('zz_added.json', open(os.path.join(
+                library_directory, names[0])).read())
+        timed_scan('zip, one member added', zip_path, manifest)
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Measure the cold start time of the non-interactive commands.
+
+Runs each command in a fresh interpreter several times and reports the
+median wall time, then fails if any command is over the budget or if
+PyInquirer or prompt_toolkit were imported along the way.
+
+Usage:
+    python benchmarks/cold_start.py [--runs N] [--budget-ms MS]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src')
+COLD_START_BUDGET_MS = 100.0
+COMMANDS = [['list-planes'],
+            ['show', 'CRJ700-family FlightGear', 'Engine Start'],
+            ['dump', 'Template Plane File']]
+PROMPT_MODULES = ('PyInquirer', 'prompt_toolkit')
+
+
+def time_command(command, runs: int):
+    """Return the median wall time of a command in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'flysimchk.py'] + command,
+                       cwd=SOURCE_DIRECTORY, check=True,
+                       stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def imported_prompt_modules(command):
+    """Return the prompt modules a command imports, using -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime',
+                             'flysimchk.py'] + command,
+                            cwd=SOURCE_DIRECTORY, check=True,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    found = set()
+    for line in result.stderr.splitlines():
+        module = line.rsplit('|', 1)[-1].strip()
+        if module.split('.')[0] in PROMPT_MODULES:
+            found.add(module.split('.')[0])
+    return sorted(found)
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float,
+                        default=COLD_START_BUDGET_MS)
+    arguments = parser.parse_args()
+    baseline = time_command(['--help'], arguments.runs)
+    print('{:<60} {:>8.1f} ms'.format('flysimchk.py --help', baseline))
+    failed = False
+    for command in COMMANDS:
+        median = time_command(command, arguments.runs)
+        prompt_modules = imported_prompt_modules(command)
+        status = 'ok'
+        if median > arguments.budget_ms:
+            status = 'OVER BUDGET'
+            failed = True
+        if prompt_modules:
+            status = 'imports ' + ', '.join(prompt_modules)
+            failed = True
+        print('{:<60} {:>8.1f} ms  {}'.format(
+            'flysimchk.py ' + ' '.join(command), median, status))
+    print('budget: {:.1f} ms'.format(arguments.budget_ms))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
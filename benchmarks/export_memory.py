@@ -0,0 +1,90 @@
+"""Check that exporting a library runs in constant memory.
+
+Generates two synthetic libraries, one ten times the size of the other,
+exports each in every format with export_planes and
+fileio.iter_plane_files, and reports the time taken and the peak memory
+traced by tracemalloc. Only the sorted list of file names grows with the
+library, so the peak may only grow by a few bytes per extra plane.
+
+Usage:
+    python benchmarks/export_memory.py [--planes N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+from export import EXPORTERS  # noqa: E402
+from export import export_planes  # noqa: E402
+from fileio import iter_plane_files  # noqa: E402
+from generate_library import generate_library  # noqa: E402
+
+# How much the peak may grow for each extra plane, for its file name.
+GROWTH_BYTES_PER_PLANE = 256
+
+
+def measure_export(directory: str, export_format: str):
+    """Export a library to /dev/null and return its peak bytes and seconds.
+
+    The export is timed on its own and then run again under tracemalloc,
+    which slows it down too much to time.
+
+    """
+    with open(os.devnull, 'w') as output_file:
+        start = time.perf_counter()
+        export_planes(iter_plane_files(directory), output_file, export_format)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        export_planes(iter_plane_files(directory), output_file, export_format)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak_bytes, elapsed
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=5000,
+                        help='planes in the larger library')
+    parser.add_argument('--checklists', type=int, default=5)
+    parser.add_argument('--steps', type=int, default=20)
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='flysimchk_export_')
+    failed = False
+    try:
+        sizes = [max(1, arguments.planes // 10), arguments.planes]
+        for plane_count in sizes:
+            generate_library(os.path.join(directory, str(plane_count)),
+                             plane_count, arguments.checklists,
+                             arguments.steps)
+        for export_format in EXPORTERS:
+            peaks = []
+            for plane_count in sizes:
+                peak_bytes, elapsed = measure_export(
+                    os.path.join(directory, str(plane_count)), export_format)
+                peaks.append(peak_bytes)
+                print('{:<9} {:>6} planes  peak {:8.1f} KiB  {:6.2f} s'.format(
+                    export_format, plane_count, peak_bytes / 1024, elapsed))
+            growth = (peaks[1] - peaks[0]) / (sizes[1] - sizes[0])
+            print('{:<9} {:+.0f} bytes per extra plane'.format(export_format,
+                                                              growth))
+            if growth > GROWTH_BYTES_PER_PLANE:
+                print('{}: memory grew with the library size'.format(
+                    export_format))
+                failed = True
+    finally:
+        shutil.rmtree(directory)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Time importing a large FlightGear hangar and check its memory use.
+
+Generates a synthetic tree of FlightGear aircraft, each with a -set.xml
+padded with unrelated properties, an included checklists index and a
+Checklists directory, and imports it serially, with worker processes and
+again unchanged. Then measures the peak memory of reading one aircraft
+whose -set.xml is many megabytes, to show it is not held as a whole.
+
+Usage:
+    python benchmarks/flightgear_import.py [--aircraft N] [--checklists N]
+        [--items N] [--padding N] [--workers N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+from flightgear import AircraftReader  # noqa: E402
+from flightgear import ImportState  # noqa: E402
+from flightgear import import_flightgear  # noqa: E402
+from generate_library import CHECKLIST_NAMES  # noqa: E402
+from generate_library import STEP_TEXTS  # noqa: E402
+from generate_library import STEP_TITLES  # noqa: E402
+
+
+def write_aircraft(directory: str, name: str, checklists: int, items: int,
+                   padding: int):
+    """Write one synthetic aircraft directory."""
+    checklist_directory = os.path.join(directory, name, 'Checklists')
+    os.makedirs(checklist_directory)
+    set_path = os.path.join(directory, name, name + '-set.xml')
+    with open(set_path, 'w') as set_file:
+        set_file.write('<?xml version="1.0"?>\n<PropertyList>\n<sim>\n'
+                       '<description>' + name + '</description>\n'
+                       '<author>flightgear_import.py</author>\n'
+                       '<checklists include="Checklists/checklists.xml"/>\n')
+        for number in range(padding):
+            set_file.write('<property-' + str(number % 50) + '><value>'
+                           + str(number) + '</value></property-'
+                           + str(number % 50) + '>\n')
+        set_file.write('</sim>\n</PropertyList>\n')
+    with open(os.path.join(checklist_directory, 'checklists.xml'),
+              'w') as index_file:
+        index_file.write('<PropertyList>\n')
+        for number in range(checklists):
+            index_file.write('<checklist include="checklist-' + str(number)
+                             + '.xml"/>\n')
+        index_file.write('</PropertyList>\n')
+    for number in range(checklists):
+        lines = ['<PropertyList>', '<title>'
+                 + CHECKLIST_NAMES[number % len(CHECKLIST_NAMES)] + ' '
+                 + str(number) + '</title>', '<page>']
+        for item in range(items):
+            lines.append('<item><name>' + STEP_TITLES[item % len(STEP_TITLES)]
+                         + '</name><value>'
+                         + STEP_TEXTS[item % len(STEP_TEXTS)]
+                         + '</value><marker><x-m>0.1</x-m></marker></item>')
+        lines.extend(['</page>', '</PropertyList>'])
+        with open(os.path.join(checklist_directory,
+                               'checklist-' + str(number) + '.xml'),
+                  'w') as checklist_file:
+            checklist_file.write('\n'.join(lines))
+
+
+def timed_import(label: str, root: str, output: str, state: ImportState,
+                 workers: int):
+    """Import the tree and print how long it took."""
+    start = time.perf_counter()
+    report = import_flightgear(root, output, state, workers)
+    elapsed = time.perf_counter() - start
+    print('{:<22} {:8.3f} s  imported {}  unchanged {}  failed {}'.format(
+        label, elapsed, report['imported'], report['unchanged'],
+        len(report['failed'])))
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--aircraft', type=int, default=1000)
+    parser.add_argument('--checklists', type=int, default=8)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--padding', type=int, default=500,
+                        help='unrelated properties in each -set.xml')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='worker processes, 0 for one per CPU')
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='flysimchk_fgimport_')
+    try:
+        root = os.path.join(directory, 'Aircraft')
+        for number in range(arguments.aircraft):
+            write_aircraft(root, 'aircraft-' + str(number),
+                           arguments.checklists, arguments.items,
+                           arguments.padding)
+        output = os.path.join(directory, 'output')
+        print('{} aircraft'.format(arguments.aircraft))
+        timed_import('serial', root, output, ImportState(), 1)
+        state = ImportState(os.path.join(directory, 'state.pickle'))
+        timed_import('{} workers'.format(arguments.workers or os.cpu_count()),
+                     root, output, state, arguments.workers)
+        timed_import('unchanged', root, output,
+                     ImportState(state.state_path), arguments.workers)
+
+        large = os.path.join(directory, 'large')
+        write_aircraft(large, 'large', arguments.checklists, arguments.items,
+                       200000)
+        aircraft_directory = os.path.join(large, 'large')
+        set_size = os.path.getsize(os.path.join(aircraft_directory,
+                                                'large-set.xml'))
+        tracemalloc.start()
+        AircraftReader(aircraft_directory).read_aircraft()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('reading a {:.1f} MiB -set.xml peaked at {:.1f} MiB'.format(
+            set_size / 1048576, peak / 1048576))
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
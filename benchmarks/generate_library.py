@@ -0,0 +1,125 @@
+"""Write a synthetic library of plane data files for benchmarking.
+
+The files follow the same schema as plane_data_file_template.json. The
+same arguments always produce byte for byte the same files, so results
+from different commits can be compared.
+
+Usage:
+    python benchmarks/generate_library.py DIRECTORY [--planes N]
+        [--checklists N] [--steps N] [--no-shuffle] [--seed N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+STEP_TITLES = ['Beacon', 'APU', 'APU/Generator', 'Bleed Valves',
+               'Parking Brake', 'Throttle', 'Engine Area', 'ITT',
+               'Oil Pressure', 'Hydraulic Pump Switch', 'Flaps', 'Transponder',
+               'Fuel Pumps', 'Navigation Lights', 'Altimeter', 'Autobrake']
+STEP_TEXTS = ['ON', 'OFF', 'CHECK', 'SET', 'AUTO', 'IDLE', 'CLEAR', 'ARMED',
+              'CHECK AVAIL', 'PWR ON', 'START', 'CHECK OFF', 'AS REQUIRED',
+              'VERIFY NORMAL', 'CROSSCHECK', 'STANDBY']
+GAME_PLATFORMS = ['FlightGear', 'X-Plane', 'MSFS']
+CHECKLIST_NAMES = ['Preflight', 'Before Start', 'Engine Start', 'After Start',
+                   'Taxi', 'Before Takeoff', 'Climb', 'Cruise', 'Descent',
+                   'Approach', 'Landing', 'After Landing', 'Shutdown']
+
+
+def build_plane(plane_number: int, checklists: int, steps: int,
+                shuffle: bool, rng: random.Random):
+    """Build the decoded JSON of one synthetic plane file.
+
+    Args:
+        plane_number: The number of the plane, used in its name.
+        checklists: The number of checklists in the plane.
+        steps: The number of steps in each checklist.
+        shuffle: Write the steps out of order, so loading has to sort them.
+        rng: The random number generator to draw from.
+
+    Returns:
+        dict: The plane in the plane file layout.
+
+    """
+    plane_checklists = []
+    for checklist_number in range(checklists):
+        checklist_steps = []
+        for step_number in range(1, steps + 1):
+            checklist_steps.append({
+                'step_number': str(step_number),
+                'step_title': rng.choice(STEP_TITLES),
+                'step_text': rng.choice(STEP_TEXTS)})
+        if shuffle:
+            rng.shuffle(checklist_steps)
+        checklist_name = (CHECKLIST_NAMES[checklist_number
+                                          % len(CHECKLIST_NAMES)]
+                          + ' ' + str(checklist_number // len(CHECKLIST_NAMES)
+                                      + 1))
+        plane_checklists.append({
+            'checklist_name': checklist_name,
+            'checklist_message': 'Complete the ' + checklist_name
+                                 + ' checklist',
+            'checklist_steps': checklist_steps})
+    return {'plane_name': 'Synthetic Plane ' + str(plane_number),
+            'plane_info': [{'Author': 'generate_library.py'},
+                           {'Seed': str(plane_number)},
+                           {'game_platform': GAME_PLATFORMS[
+                               plane_number % len(GAME_PLATFORMS)]},
+                           {'game_version': str(2018 + plane_number % 4)}],
+            'checklists': plane_checklists}
+
+
+def generate_library(directory: str, planes: int = 20, checklists: int = 10,
+                     steps: int = 30, shuffle: bool = True, seed: int = 0):
+    """Write a synthetic library of plane files into a directory.
+
+    Args:
+        directory: Where to write the files. It is created if needed.
+        planes (Optional): The number of plane files.
+        checklists (Optional): The number of checklists in each plane.
+        steps (Optional): The number of steps in each checklist.
+        shuffle (Optional): Write the steps out of order.
+        seed (Optional): The seed for the random choices.
+
+    Returns:
+        list of str: The paths of the files written.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for plane_number in range(planes):
+        path = os.path.join(directory,
+                            'synthetic_{:05d}.json'.format(plane_number))
+        with open(path, 'w') as plane_file:
+            json.dump(build_plane(plane_number, checklists, steps, shuffle,
+                                  rng),
+                      plane_file, indent=4)
+        paths.append(path)
+    return paths
+
+
+def main():
+    """Write a library from the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--planes', type=int, default=20)
+    parser.add_argument('--checklists', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--no-shuffle', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+    paths = generate_library(arguments.directory, arguments.planes,
+                             arguments.checklists, arguments.steps,
+                             not arguments.no_shuffle, arguments.seed)
+    print('Wrote ' + str(len(paths)) + ' plane files to '
+          + arguments.directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Measure the memory the string pool saves on a resident library.
+
+Loads a generated library twice, once with STRING_POOL switched off and
+once with it on, and reports the bytes still allocated while the whole
+library is held in memory, along with the pool's counters.
+
+Usage:
+    python benchmarks/interning_memory.py [--planes N] [--checklists N]
+        [--steps N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import interning  # noqa: E402
+from fileio import search_directory_for_planes  # noqa: E402
+from generate_library import generate_library  # noqa: E402
+
+
+def resident_bytes(directory: str):
+    """Load a library and return the bytes it keeps allocated."""
+    gc.collect()
+    tracemalloc.start()
+    library = search_directory_for_planes(directory)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del library
+    return retained
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=200)
+    parser.add_argument('--checklists', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=30)
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='flysimchk_intern_')
+    try:
+        generate_library(directory, arguments.planes, arguments.checklists,
+                         arguments.steps)
+        pool_intern = interning.StringPool.intern
+        interning.StringPool.intern = lambda pool, value: value
+        try:
+            without_pool = resident_bytes(directory)
+        finally:
+            interning.StringPool.intern = pool_intern
+        interning.STRING_POOL.reset()
+        with_pool = resident_bytes(directory)
+    finally:
+        shutil.rmtree(directory)
+    steps = arguments.planes * arguments.checklists * arguments.steps
+    print('steps:            {}'.format(steps))
+    print('without the pool: {:10.1f} KiB  {:6.1f} bytes per step'.format(
+        without_pool / 1024, without_pool / steps))
+    print('with the pool:    {:10.1f} KiB  {:6.1f} bytes per step'.format(
+        with_pool / 1024, with_pool / steps))
+    print('pool: ' + str(interning.STRING_POOL))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Show that a PlaneCache keeps memory bounded on a large library.
+
+Generates a synthetic library and, in a fresh process for each run, scans
+it lazily and then cycles through every plane, loading its checklists and
+going back to the plane before, while sampling the resident set size. The
+run without a cache keeps every plane it has opened loaded; the cached
+runs unload the least recently used planes once over the budget. Reports
+how far the RSS grew above what it was after the scan, next to the
+budget, and the cache's counters. Fails if a byte budget run grows past
+its budget, or a plane budget run ever holds more planes than it allows.
+
+Usage:
+    python benchmarks/plane_cache_rss.py [--planes N] [--checklists N]
+        [--steps N] [--cache-planes N] [--cache-mb MB] [--cycles N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+from generate_library import generate_library  # noqa: E402
+
+# How many planes are opened between two RSS samples.
+SAMPLE_EVERY = 100
+# Room above the budget for the allocator and for the plane being decoded.
+RSS_ALLOWANCE = 8 * 1024 * 1024
+
+
+def resident_set_size():
+    """Return the current RSS in bytes, or the peak if it is unavailable."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_child(directory: str, max_planes: int, max_bytes: int, cycles: int):
+    """Cycle through the library and print the results as JSON."""
+    from fileio import search_directory_for_planes
+    from planecache import PlaneCache
+    cache = None
+    if max_planes or max_bytes:
+        cache = PlaneCache(max_planes or None, max_bytes or None).install()
+    library = search_directory_for_planes(directory, lazy=True)
+    baseline = resident_set_size()
+    peak = baseline
+    steps = 0
+    most_planes = 0
+    start = time.perf_counter()
+    planes = list(library)
+    for _ in range(cycles):
+        for plane_number, plane in enumerate(planes):
+            plane.materialize()
+            steps += sum(len(checklist.steps)
+                         for checklist in plane.checklists)
+            if plane_number:
+                # Going back to the previous plane, as from the menus.
+                planes[plane_number - 1].materialize()
+            if cache is not None:
+                most_planes = max(most_planes, len(cache))
+            if plane_number % SAMPLE_EVERY == 0:
+                peak = max(peak, resident_set_size())
+    peak = max(peak, resident_set_size())
+    print(json.dumps({'baseline': baseline, 'peak': peak, 'steps': steps,
+                      'seconds': time.perf_counter() - start,
+                      'cache': None if cache is None else str(cache),
+                      'resident_bytes': 0 if cache is None
+                      else cache.resident_bytes,
+                      'most_planes': most_planes}))
+    return 0
+
+
+def measure(directory: str, max_planes: int, max_bytes: int, cycles: int):
+    """Run one measurement in a fresh process and return its results."""
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--child', directory,
+         '--cache-planes', str(max_planes), '--cache-mb',
+         str(max_bytes / (1024 * 1024)), '--cycles', str(cycles)],
+        universal_newlines=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=10000)
+    parser.add_argument('--checklists', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--cache-planes', type=int, default=100,
+                        help='plane budget of the first cached run')
+    parser.add_argument('--cache-mb', type=float, default=4,
+                        help='byte budget of the second cached run')
+    parser.add_argument('--cycles', type=int, default=2,
+                        help='passes over the whole library')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    max_bytes = int(arguments.cache_mb * 1024 * 1024)
+    if arguments.child:
+        return run_child(arguments.child, arguments.cache_planes, max_bytes,
+                         arguments.cycles)
+    directory = tempfile.mkdtemp(prefix='flysimchk_cache_')
+    over_budget = False
+    try:
+        generate_library(directory, arguments.planes, arguments.checklists,
+                         arguments.steps)
+        runs = [('no cache', 0, 0),
+                (str(arguments.cache_planes) + ' planes',
+                 arguments.cache_planes, 0),
+                ('{:g} MiB'.format(arguments.cache_mb), 0, max_bytes)]
+        print('{} planes, {} passes'.format(arguments.planes,
+                                            arguments.cycles))
+        for label, run_planes, run_bytes in runs:
+            result = measure(directory, run_planes, run_bytes,
+                             arguments.cycles)
+            growth = result['peak'] - result['baseline']
+            print('{:<12} RSS after scan {:7.1f} MiB  growth {:7.1f} MiB  '
+                  '{:6.2f} s'.format(label, result['baseline'] / 1048576,
+                                     growth / 1048576, result['seconds']))
+            if result['cache'] is not None:
+                print('             estimated resident {:.1f} MiB  {}'.format(
+                    result['resident_bytes'] / 1048576, result['cache']))
+            if run_bytes and growth > run_bytes + RSS_ALLOWANCE:
+                over_budget = True
+                print('             RSS grew past the budget')
+            if run_planes and result['most_planes'] > run_planes:
+                over_budget = True
+                print('             held {} planes, over the budget'.format(
+                    result['most_planes']))
+    finally:
+        shutil.rmtree(directory)
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
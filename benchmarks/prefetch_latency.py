@@ -0,0 +1,170 @@
+"""Measure how much background prefetching speeds up picking from a menu.
+
+Generates a synthetic library and plays the same scripted session twice,
+once with a PrefetchWorker and once without. For every plane the user
+waits at the plane menu, picks the plane the cursor starts on, waits at
+its checklist page and picks one of its checklists. The waits stand in
+for PyInquirer prompts: they tick every millisecond and record how late
+each tick is, to show the prompt stays responsive while the worker runs.
+Reports the time from each pick to the next screen being ready, and the
+tail of the tick lateness: its 99th and 99.9th percentiles, its maximum
+and how many ticks were later than LATE_TICK. The sessions are repeated,
+taking turns, so noise from the rest of the machine lands on both.
+
+Building checklist prompts needs PyInquirer. Without it only the plane
+loads are measured.
+
+Usage:
+    python benchmarks/prefetch_latency.py [--planes N] [--checklists N]
+        [--steps N] [--think SECONDS] [--repeat N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import bisect
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+from fileio import search_directory_for_planes  # noqa: E402
+from generate_library import generate_library  # noqa: E402
+from prefetch import PrefetchWorker  # noqa: E402
+from progress import ChecklistProgress  # noqa: E402
+
+TICK = 0.001
+# A tick this late, in seconds, is one a user could notice as a stall.
+LATE_TICK = 0.004
+
+
+def wait_at_prompt(seconds: float, lateness: list):
+    """Tick like a prompt's event loop and record how late each tick is."""
+    deadline = time.perf_counter() + seconds
+    while True:
+        expected = time.perf_counter() + TICK
+        time.sleep(TICK)
+        now = time.perf_counter()
+        lateness.append(now - expected)
+        if now >= deadline:
+            return
+
+
+def play_session(directory: str, think: float, prefetch: bool, seed: int):
+    """Play the scripted session and return the latencies.
+
+    Returns:
+        tuple of (list, list, list): The plane pick latencies, the
+        checklist pick latencies and the prompt tick lateness, in seconds.
+
+    """
+    try:
+        from cli_controls import ChecklistJSONObject
+        from cli_controls import ChecklistPayloadCache
+    except ImportError:
+        ChecklistJSONObject = None
+    payload_cache = None
+    warm = None
+    if ChecklistJSONObject is not None:
+        payload_cache = ChecklistPayloadCache()
+        warm = payload_cache.warm
+    library = search_directory_for_planes(directory, lazy=True)
+    worker = PrefetchWorker(warm).start() if prefetch else None
+    rng = random.Random(seed)
+    plane_latencies = []
+    checklist_latencies = []
+    lateness = []
+    for plane in library.filter({}):
+        if worker is not None:
+            worker.prefetch_planes([plane])
+        wait_at_prompt(think, lateness)
+        start = time.perf_counter()
+        if worker is not None:
+            worker.cancel()
+        plane.materialize()
+        plane_latencies.append(time.perf_counter() - start)
+        if ChecklistJSONObject is None:
+            continue
+        if worker is not None:
+            worker.prefetch_checklists(plane)
+        wait_at_prompt(think, lateness)
+        checklist = rng.choice(plane.checklists)
+        start = time.perf_counter()
+        if worker is not None:
+            worker.cancel()
+        progress = ChecklistProgress(len(checklist.steps))
+        ChecklistJSONObject(checklist, progress,
+                            payload_cache).return_json_instructions()
+        checklist_latencies.append(time.perf_counter() - start)
+    if worker is not None:
+        worker.stop()
+    return plane_latencies, checklist_latencies, lateness
+
+
+def percentile(values: list, fraction: float):
+    """Return a percentile of some sorted values."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary(values: list):
+    """Format the percentiles and the maximum of some durations in ms."""
+    if not values:
+        return 'skipped, PyInquirer is not installed'
+    values = sorted(values)
+    return 'p50 {:7.3f} ms  p99 {:7.3f} ms  max {:7.3f} ms'.format(
+        percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000,
+        values[-1] * 1000)
+
+
+def tail_summary(values: list):
+    """Format the tail of the tick lateness in ms."""
+    values = sorted(values)
+    late = len(values) - bisect.bisect_right(values, LATE_TICK)
+    return ('p99 {:7.3f} ms  p99.9 {:7.3f} ms  max {:7.3f} ms  '
+            'over {:g} ms {} of {}').format(
+                percentile(values, 0.99) * 1000,
+                percentile(values, 0.999) * 1000, values[-1] * 1000,
+                LATE_TICK * 1000, late, len(values))
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=40)
+    parser.add_argument('--checklists', type=int, default=13)
+    parser.add_argument('--steps', type=int, default=60)
+    parser.add_argument('--think', type=float, default=0.1,
+                        help='seconds spent at each prompt')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='sessions played with and without prefetch')
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='flysimchk_prefetch_')
+    try:
+        generate_library(directory, arguments.planes, arguments.checklists,
+                         arguments.steps)
+        modes = (('without prefetch', False), ('with prefetch', True))
+        # label: (plane latencies, checklist latencies, lateness)
+        results = {label: ([], [], []) for label, _ in modes}
+        for _ in range(arguments.repeat):
+            for label, prefetch in modes:
+                for total, values in zip(results[label], play_session(
+                        directory, arguments.think, prefetch, 0)):
+                    total.extend(values)
+        for label, _ in modes:
+            plane_latencies, checklist_latencies, lateness = results[label]
+            print(label)
+            print('  plane picked      ' + summary(plane_latencies))
+            print('  checklist picked  ' + summary(checklist_latencies))
+            print('  prompt tick late  ' + tail_summary(lateness))
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
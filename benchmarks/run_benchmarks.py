@@ -0,0 +1,244 @@
+"""Time and measure the memory of the hot paths of FlySimChk.
+
+Generates a deterministic synthetic library with generate_library.py and
+runs a benchmark for each hot path: scanning the directory, loading one
+plane file, sorting checklists, building the __str__ and __repr__ text of
+a plane, filtering the library by plane_info and counting its facets, and
+building the ChecklistJSONObject for a checklist. The results are printed
+and saved as JSON in benchmarks/results, named after the current commit.
+Give an earlier results file with --compare to see the change and fail on
+regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--planes N] [--checklists N]
+        [--steps N] [--repeat N] [--compare RESULTS.json]
+        [--threshold RATIO] [--output FILE]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SRC_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'src')
+RESULTS_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, 'results')
+sys.path.insert(0, SRC_DIRECTORY)
+
+from fileio import load_plane_file  # noqa: E402
+from fileio import search_directory_for_planes  # noqa: E402
+from generate_library import generate_library  # noqa: E402
+from model import Checklist  # noqa: E402
+
+RESULTS_VERSION = 1
+REGRESSION_THRESHOLD = 1.25
+
+
+def current_commit():
+    """Return the short hash of the checked out commit, or 'unknown'."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIRECTORY,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmark(function, setup=None, repeat: int = 5):
+    """Time a function and measure the memory it allocates.
+
+    Args:
+        function: The code to measure. Called with the result of setup.
+        setup (Optional): Called before every run, outside of the timing.
+        repeat (Optional): How many timed runs to make.
+
+    Returns:
+        dict: The min and median seconds of the timed runs, and the peak
+        bytes allocated during one more run traced by tracemalloc.
+
+    """
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    argument = setup() if setup is not None else None
+    gc.collect()
+    tracemalloc.start()
+    function(argument)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'min_s': min(timings), 'median_s': statistics.median(timings),
+            'runs': repeat, 'peak_bytes': peak_bytes}
+
+
+def shuffled_checklists(plane, seed: int = 0):
+    """Copy a plane's checklists with their steps in a random order."""
+    rng = random.Random(seed)
+    checklists = []
+    for checklist in plane.checklists:
+        steps = list(checklist.steps)
+        rng.shuffle(steps)
+        checklists.append(Checklist(checklist.name, checklist.message, steps))
+    return checklists
+
+
+def sort_all(checklists):
+    """Sort every checklist in a list."""
+    for checklist in checklists:
+        checklist.sort_checklist()
+
+
+def build_json_objects(plane):
+    """Build the ChecklistJSONObject of every checklist in a plane."""
+    # Imported here because it needs PyInquirer.
+    from cli_controls import ChecklistJSONObject
+    for checklist in plane.checklists:
+        ChecklistJSONObject(checklist).return_json_instructions()
+
+
+def run_suite(directory: str, repeat: int):
+    """Run every benchmark against a generated library.
+
+    Args:
+        directory: The directory holding the generated library.
+        repeat: How many timed runs to make of each benchmark.
+
+    Returns:
+        dict of str: dict: The results keyed by benchmark name. A benchmark
+        that can't run here has a 'skipped' reason instead.
+
+    """
+    first_file = sorted(os.listdir(directory))[0]
+    plane_path = os.path.join(directory, first_file)
+    plane = load_plane_file(plane_path)
+    results = {}
+    results['search_directory_for_planes'] = run_benchmark(
+        lambda _: search_directory_for_planes(directory), repeat=repeat)
+    results['load_plane_file'] = run_benchmark(
+        lambda _: load_plane_file(plane_path), repeat=repeat)
+    results['sort_checklist'] = run_benchmark(
+        sort_all, lambda: shuffled_checklists(plane), repeat=repeat)
+    results['plane_str'] = run_benchmark(lambda _: str(plane), repeat=repeat)
+    results['plane_repr'] = run_benchmark(lambda _: repr(plane),
+                                          repeat=repeat)
+    library = search_directory_for_planes(directory)
+    selection = {'game_platform': 'X-Plane', 'game_version': '2019'}
+    results['filter_planes'] = run_benchmark(
+        lambda _: library.filter(selection), repeat=repeat)
+    results['facet_counts'] = run_benchmark(
+        lambda _: library.facet_counts(selection), repeat=repeat)
+    try:
+        import cli_controls  # noqa: F401
+    except ImportError as import_error:
+        results['checklist_json_object'] = {'skipped': str(import_error)}
+    else:
+        results['checklist_json_object'] = run_benchmark(
+            lambda _: build_json_objects(plane), repeat=repeat)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Print how the results changed from a baseline.
+
+    Args:
+        results: The results of this run.
+        baseline: The results of an earlier run.
+        threshold: The ratio of median times counted as a regression.
+
+    Returns:
+        list of str: The names of the benchmarks that regressed.
+
+    """
+    if baseline.get('parameters') != results['parameters']:
+        print('warning: the baseline used different parameters: '
+              + json.dumps(baseline.get('parameters')))
+    print('compared with ' + str(baseline.get('commit')) + ':')
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if (before is None or 'skipped' in before or 'skipped' in result):
+            continue
+        time_ratio = result['median_s'] / before['median_s']
+        memory_ratio = (result['peak_bytes'] / before['peak_bytes']
+                        if before['peak_bytes'] else 1.0)
+        status = ''
+        if time_ratio > threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        print('  {:<30} time x{:5.2f}  memory x{:5.2f}  {}'.format(
+            name, time_ratio, memory_ratio, status))
+    return regressions
+
+
+def main():
+    """Run the suite and save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=20)
+    parser.add_argument('--checklists', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Where to save the results. '
+                        'Defaults to benchmarks/results/COMMIT.json.')
+    parser.add_argument('--compare', help='An earlier results file.')
+    parser.add_argument('--threshold', type=float,
+                        default=REGRESSION_THRESHOLD)
+    arguments = parser.parse_args()
+    parameters = {'planes': arguments.planes,
+                  'checklists': arguments.checklists,
+                  'steps': arguments.steps, 'seed': arguments.seed}
+
+    directory = tempfile.mkdtemp(prefix='flysimchk_bench_')
+    try:
+        generate_library(directory, arguments.planes, arguments.checklists,
+                         arguments.steps, True, arguments.seed)
+        benchmarks = run_suite(directory, arguments.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    commit = current_commit()
+    results = {'version': RESULTS_VERSION, 'commit': commit,
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'parameters': parameters, 'benchmarks': benchmarks}
+    for name, result in benchmarks.items():
+        if 'skipped' in result:
+            print('{:<30} skipped: {}'.format(name, result['skipped']))
+        else:
+            print('{:<30} {:10.3f} ms  peak {:10.1f} KiB'.format(
+                name, result['median_s'] * 1000, result['peak_bytes'] / 1024))
+
+    output = arguments.output
+    if output is None:
+        output = os.path.join(RESULTS_DIRECTORY, commit + '.json')
+    output_directory = os.path.dirname(output)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=4, sort_keys=True)
+    print('saved ' + output)
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, arguments.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
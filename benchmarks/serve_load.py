@@ -0,0 +1,276 @@
+"""Load test the HTTP serve mode on localhost.
+
+Generates a synthetic library, starts a server for it in a subprocess on a
+free port, and then runs many concurrent asyncio clients against it. Most
+clients repeat conditional GETs of the plane list and of planes, like
+tablets polling for changes. Others listen with server-sent events and
+long-polling while a writer posts checks and unchecks. Reports the
+requests per second, the latency percentiles and whether every listener
+saw every update.
+
+Usage:
+    python benchmarks/serve_load.py [--planes N] [--clients N]
+        [--requests N] [--listeners N] [--updates N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, '..', 'src'))
+
+from generate_library import generate_library  # noqa: E402
+
+# How long the listeners may take to see the last update once it is posted.
+SETTLE_TIMEOUT = 10.0
+
+
+def run_child(directory: str):
+    """Serve a library on a free port. Runs in the server subprocess."""
+    from fileio import search_directory_for_planes
+    from progress import ProgressJournal
+    from server import serve
+    library = search_directory_for_planes(os.path.join(directory, 'data'))
+    journal = ProgressJournal(os.path.join(directory, 'progress')).open()
+    try:
+        serve(library, journal, '127.0.0.1', 0)
+    finally:
+        journal.close()
+    return 0
+
+
+async def request(port: int, method: str, path: str, body: bytes = b'',
+                  headers: dict = None, connection=None):
+    """Send one request and read the response.
+
+    Args:
+        connection: A (reader, writer) pair to reuse, or None to connect.
+
+    Returns:
+        tuple of (int, dict, bytes, tuple): The status, the headers, the
+        body and the connection, for the next request.
+
+    """
+    if connection is None:
+        connection = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+    lines = [method + ' ' + path + ' HTTP/1.1', 'Host: 127.0.0.1',
+             'Content-Length: ' + str(len(body))]
+    for name, value in (headers or {}).items():
+        lines.append(name + ': ' + value)
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+    head = await reader.readuntil(b'\r\n\r\n')
+    head_lines = head.decode('latin-1').split('\r\n')
+    status = int(head_lines[0].split(' ')[1])
+    response_headers = {}
+    for line in head_lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+    length = int(response_headers.get('content-length', 0))
+    response_body = await reader.readexactly(length) if length else b''
+    return status, response_headers, response_body, connection
+
+
+async def polling_client(port: int, paths: list, request_count: int,
+                         latencies: list, statuses: dict):
+    """Repeat conditional GETs over one keep-alive connection."""
+    etags = {}
+    connection = None
+    for request_index in range(request_count):
+        path = paths[request_index % len(paths)]
+        headers = {'If-None-Match': etags[path]} if path in etags else {}
+        start = time.perf_counter()
+        status, response_headers, _, connection = await request(
+            port, 'GET', path, headers=headers, connection=connection)
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+        if 'etag' in response_headers:
+            etags[path] = response_headers['etag']
+    connection[1].close()
+
+
+async def sse_listener(port: int, last_version: int, seen: list):
+    """Collect server-sent event versions until the last one arrives."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /api/events HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                 b'Last-Event-ID: 0\r\n\r\n')
+    await reader.readuntil(b'\r\n\r\n')
+    try:
+        while not seen or seen[-1] < last_version:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'id: '):
+                seen.append(int(line[4:]))
+    finally:
+        writer.close()
+
+
+async def long_poll_listener(port: int, last_version: int, seen: list):
+    """Collect long-poll update versions until the last one arrives."""
+    since = 0
+    connection = None
+    while since < last_version:
+        _, _, body, connection = await request(
+            port, 'GET', '/api/updates?since=' + str(since) + '&timeout=5',
+            connection=connection)
+        payload = json.loads(body.decode('utf-8'))
+        for update in payload['updates']:
+            seen.append(update['version'])
+        since = payload['version']
+    connection[1].close()
+
+
+async def writer_client(port: int, progress_path: str, update_count: int,
+                        step_count: int, latencies: list):
+    """Post alternating checks and unchecks, one at a time."""
+    connection = None
+    for update_index in range(update_count):
+        # Each round of step_count checks is followed by a round of unchecks
+        # so every post changes a step.
+        body = json.dumps({'index': update_index % step_count,
+                           'checked': (update_index // step_count) % 2 == 0})
+        start = time.perf_counter()
+        status, _, _, connection = await request(
+            port, 'POST', progress_path, body.encode(), connection=connection)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            raise RuntimeError('POST failed with status ' + str(status))
+        await asyncio.sleep(0)
+    connection[1].close()
+
+
+def percentile(values: list, fraction: float):
+    """Return a value from a sorted list at a fraction of its length."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(port: int, arguments):
+    """Run the clients and print the results."""
+    _, _, body, connection = await request(port, 'GET', '/api/planes')
+    plane_names = json.loads(body.decode('utf-8'))['planes']
+    _, _, body, connection = await request(
+        port, 'GET', '/api/planes/' + quote(plane_names[0]),
+        connection=connection)
+    connection[1].close()
+    plane = json.loads(body.decode('utf-8'))
+    checklist = plane['checklists'][0]
+    progress_path = ('/api/planes/' + quote(plane_names[0]) + '/checklists/'
+                     + quote(checklist['checklist_name']) + '/progress')
+    step_count = len(checklist['checklist_steps'])
+    paths = ['/api/planes'] + ['/api/planes/' + quote(name)
+                               for name in plane_names]
+
+    # The writer's posts are the only updates, so their count is the
+    # version of the last one.
+    last_version = arguments.updates
+    sse_seen = [[] for _ in range(arguments.listeners)]
+    poll_seen = [[] for _ in range(arguments.listeners)]
+    listeners = [asyncio.ensure_future(sse_listener(port, last_version, seen))
+                 for seen in sse_seen]
+    listeners += [asyncio.ensure_future(
+        long_poll_listener(port, last_version, seen)) for seen in poll_seen]
+    await asyncio.sleep(0.2)
+
+    get_latencies = []
+    post_latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    await asyncio.gather(
+        writer_client(port, progress_path, arguments.updates, step_count,
+                      post_latencies),
+        *[polling_client(port, paths, arguments.requests, get_latencies,
+                         statuses)
+          for _ in range(arguments.clients)])
+    elapsed = time.perf_counter() - start
+    done, pending = await asyncio.wait(listeners, timeout=SETTLE_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        task.result()
+
+    total = len(get_latencies) + len(post_latencies)
+    print('clients:      {} polling, {} SSE, {} long-poll, 1 writer'.format(
+        arguments.clients, arguments.listeners, arguments.listeners))
+    print('requests:     {} in {:.2f} s, {:.0f} req/s'.format(
+        total, elapsed, total / elapsed))
+    print('GET statuses: ' + ', '.join('{}: {}'.format(status, count)
+                                       for status, count
+                                       in sorted(statuses.items())))
+    for label, latencies in (('GET', get_latencies),
+                             ('POST', post_latencies)):
+        latencies.sort()
+        print('{:<4} latency  p50 {:6.2f} ms  p90 {:6.2f} ms  '
+              'p99 {:6.2f} ms  max {:6.2f} ms'.format(
+                  label, percentile(latencies, 0.5) * 1000,
+                  percentile(latencies, 0.9) * 1000,
+                  percentile(latencies, 0.99) * 1000,
+                  latencies[-1] * 1000))
+    if post_latencies:
+        print('POST mean    {:6.2f} ms'.format(
+            statistics.mean(post_latencies) * 1000))
+    expected = list(range(1, arguments.updates + 1))
+    missed = 0
+    for label, seen_lists in (('SSE', sse_seen), ('long-poll', poll_seen)):
+        complete = sum(1 for seen in seen_lists if seen == expected)
+        missed += len(seen_lists) - complete
+        print('{:<9} listeners with every update: {}/{}'.format(
+            label, complete, len(seen_lists)))
+    return 1 if missed else 0
+
+
+def main():
+    """Start the server, run the load test and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--planes', type=int, default=20)
+    parser.add_argument('--checklists', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--clients', type=int, default=200,
+                        help='concurrent polling clients')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='GETs made by each polling client')
+    parser.add_argument('--listeners', type=int, default=20,
+                        help='SSE listeners, and as many long-poll listeners')
+    parser.add_argument('--updates', type=int, default=200,
+                        help='progress updates posted by the writer')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.child:
+        return run_child(arguments.child)
+    directory = tempfile.mkdtemp(prefix='flysimchk_serve_')
+    server = None
+    try:
+        generate_library(os.path.join(directory, 'data'), arguments.planes,
+                         arguments.checklists, arguments.steps)
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--child', directory],
+            stdout=subprocess.PIPE, universal_newlines=True)
+        # The server prints "Serving N planes on http://HOST:PORT/api/planes"
+        # once it is listening.
+        ready_line = server.stdout.readline()
+        if not ready_line.startswith('Serving'):
+            print('The server did not start.')
+            return 1
+        port = int(ready_line.rsplit(':', 1)[1].split('/')[0])
+        return asyncio.run(run_load(port, arguments))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Measure how many bytes each ChecklistStep costs in a loaded library.
+
+Builds a synthetic library of one million steps the same way
+load_plane_file does, with a fresh str object for every title and text
+as the JSON decoder would produce, and reports the bytes allocated per
+step for plain classes without __slots__, as the model was before, for
+the list of ChecklistStep objects and for the columnar StepColumns
+storage.
+
+Usage:
+    python benchmarks/step_memory.py [--steps N]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+from model import Checklist  # noqa: E402
+from model import ChecklistStep  # noqa: E402
+from model import Plane  # noqa: E402
+
+STEPS_PER_CHECKLIST = 50
+CHECKLISTS_PER_PLANE = 20
+STEP_TITLES = ['Beacon', 'APU', 'APU/Generator', 'Bleed Valves',
+               'Parking Brake', 'Throttle', 'Engine Area', 'ITT',
+               'Oil Pressure', 'Hydraulic Pump Switch', 'Flaps', 'Transponder']
+STEP_TEXTS = ['ON', 'OFF', 'CHECK', 'SET', 'AUTO', 'IDLE', 'CLEAR', 'ARMED',
+              'CHECK AVAIL', 'PWR ON', 'START', 'CHECK OFF']
+
+
+class PlainChecklistStep():
+    """ChecklistStep as it was before __slots__, for the baseline."""
+
+    def __init__(self, step_number: int, step_title: str, step_text: str):
+        """Class Constructor."""
+        self.step_number = step_number
+        self.step_title = step_title
+        self.step_text = step_text
+
+
+class PlainChecklist():
+    """Checklist as it was before __slots__, for the baseline."""
+
+    def __init__(self, checklist_name: str, checklist_message: str,
+                 steps: list):
+        """Class Constructor."""
+        self.checklist_name = checklist_name
+        self.checklist_message = checklist_message
+        self.steps = steps
+
+
+class PlainPlane():
+    """Plane as it was before __slots__, for the baseline."""
+
+    def __init__(self, plane_name: str, plane_info: list, checklists: list):
+        """Class Constructor."""
+        self.plane_name = plane_name
+        self.plane_info = plane_info
+        self.checklists = checklists
+
+
+# mode: (step class, checklist class, plane class)
+MODES = {'plain': (PlainChecklistStep, PlainChecklist, PlainPlane),
+         'objects': (ChecklistStep, Checklist, Plane),
+         'columnar': (ChecklistStep, Checklist, Plane)}
+
+
+def fresh(text: str):
+    """Return a new str object equal to text, as json.load would."""
+    return (text + '.')[:-1]
+
+
+def build_library(step_total: int, mode: str):
+    """Build a list of planes holding step_total steps in all."""
+    step_class, checklist_class, plane_class = MODES[mode]
+    planes = []
+    step_count = 0
+    plane_number = 0
+    while step_count < step_total:
+        checklists = []
+        for checklist_number in range(CHECKLISTS_PER_PLANE):
+            steps = []
+            for step_number in range(1, STEPS_PER_CHECKLIST + 1):
+                steps.append(step_class(
+                    step_number,
+                    fresh(STEP_TITLES[(step_number + checklist_number)
+                                      % len(STEP_TITLES)]),
+                    fresh(STEP_TEXTS[(step_number * 7 + plane_number)
+                                     % len(STEP_TEXTS)])))
+            checklist = checklist_class('Checklist ' + str(checklist_number),
+                                        'Message ' + str(checklist_number),
+                                        steps)
+            if mode == 'columnar':
+                checklist.compact()
+            checklists.append(checklist)
+            step_count += STEPS_PER_CHECKLIST
+        planes.append(plane_class('Plane ' + str(plane_number), None,
+                                  checklists))
+        plane_number += 1
+    return planes, step_count
+
+
+def measure(step_total: int, mode: str):
+    """Return the bytes allocated per step for one storage mode."""
+    gc.collect()
+    tracemalloc.start()
+    planes, step_count = build_library(step_total, mode)
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del planes
+    return allocated / step_count
+
+
+def main():
+    """Run the measurement and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=1000000)
+    arguments = parser.parse_args()
+    print('steps: ' + str(arguments.steps))
+    for mode in ('plain', 'objects', 'columnar'):
+        print('{:<9} {:.1f} bytes/step'.format(
+            mode + ':', measure(arguments.steps, mode)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Compare the peak memory of the whole-file and streaming plane loaders.
+
+Writes a synthetic plane file of about 50 MB, loads it in a fresh
+process with each loader and reports the peak resident set size of each
+process, then checks that both loaders built the same Plane.
+
+Usage:
+    python benchmarks/streaming_memory.py [--size-mb N] [--keep FILE]
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'src')
+sys.path.insert(0, SRC_DIRECTORY)
+
+from fileio import _load_plane_file_whole  # noqa: E402
+from fileio import load_plane_file_streaming  # noqa: E402
+from fileio import plane_to_dict  # noqa: E402
+
+LOADERS = {'whole': _load_plane_file_whole,
+           'streaming': load_plane_file_streaming}
+STEPS_PER_CHECKLIST = 40
+STEP_TITLES = ['Beacon', 'APU', 'APU/Generator', 'Bleed Valves',
+               'Parking Brake', 'Throttle', 'Engine Area', 'ITT',
+               'Oil Pressure', 'Hydraulic Pump Switch', 'Flaps', 'Transponder']
+STEP_TEXTS = ['ON', 'OFF', 'CHECK', 'SET', 'AUTO', 'IDLE', 'CLEAR', 'ARMED',
+              'CHECK AVAIL', 'PWR ON', 'START', 'CHECK OFF']
+
+
+def write_plane_file(filename: str, size_bytes: int):
+    """Write a type-rating sized plane file of at least size_bytes."""
+    with open(filename, 'w') as plane_file:
+        plane_file.write('{\n    "plane_name": "Synthetic Type Rating",\n'
+                         '    "plane_info": [{"Author": "benchmark"}],\n'
+                         '    "checklists": [\n')
+        checklist_number = 0
+        while plane_file.tell() < size_bytes:
+            if checklist_number:
+                plane_file.write(',\n')
+            steps = [{'step_number': str(step_number),
+                      'step_title': STEP_TITLES[(step_number
+                                                 + checklist_number)
+                                                % len(STEP_TITLES)],
+                      'step_text': STEP_TEXTS[(step_number * 7
+                                               + checklist_number)
+                                              % len(STEP_TEXTS)]}
+                     # Written in reverse so the loaders have to sort.
+                     for step_number in range(STEPS_PER_CHECKLIST, 0, -1)]
+            plane_file.write(json.dumps(
+                {'checklist_name': 'Checklist ' + str(checklist_number),
+                 'checklist_message': 'Complete checklist '
+                                      + str(checklist_number),
+                 'checklist_steps': steps}, indent=4))
+            checklist_number += 1
+        plane_file.write('\n    ]\n}\n')
+
+
+def peak_rss_kib():
+    """Return this process's peak resident set size in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def measure(loader_name: str, filename: str):
+    """Load the file with one loader and print the peak RSS as JSON."""
+    baseline = peak_rss_kib()
+    start = time.perf_counter()
+    plane = LOADERS[loader_name](filename)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'loader': loader_name,
+                      'checklists': len(plane.checklists),
+                      'seconds': elapsed,
+                      'baseline_kib': baseline,
+                      'peak_kib': peak_rss_kib()}))
+
+
+def run_measurement(loader_name: str, filename: str):
+    """Measure a loader in a fresh process so peaks don't mix."""
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      loader_name, filename])
+    return json.loads(output)
+
+
+def main():
+    """Run the comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size-mb', type=float, default=50)
+    parser.add_argument('--keep', help='Write the synthetic file here and '
+                        'keep it.')
+    parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.measure:
+        measure(*arguments.measure)
+        return 0
+
+    if arguments.keep:
+        filename = arguments.keep
+    else:
+        handle, filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+    try:
+        write_plane_file(filename, int(arguments.size_mb * 1024 * 1024))
+        print('file: {:.1f} MB'.format(os.path.getsize(filename)
+                                       / (1024 * 1024)))
+        for loader_name in LOADERS:
+            result = run_measurement(loader_name, filename)
+            print('{:<10} peak RSS {:8.1f} MB  (+{:.1f} MB over start)  '
+                  '{:.2f} s'.format(loader_name, result['peak_kib'] / 1024,
+                                    (result['peak_kib']
+                                     - result['baseline_kib']) / 1024,
+                                    result['seconds']))
+        identical = (plane_to_dict(_load_plane_file_whole(filename))
+                     == plane_to_dict(load_plane_file_streaming(filename)))
+        print('identical output: ' + str(identical))
+        return 0 if identical else 1
+    finally:
+        if not arguments.keep:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
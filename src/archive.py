@@ -0,0 +1,206 @@
+"""Reads plane files straight out of zip and tar archives.
+
+Checklist bundles are shipped as archives holding many small plane files.
+PlaneArchive opens one and hands out each member as a text stream read
+from the archive itself, so nothing is extracted to disk. A plane loaded
+from an archive is keyed by a path made of the archive's path followed by
+the member's name, for example data/bundle.zip/a320.json.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import io
+import os
+import tarfile
+import zipfile
+import zlib
+from typing import Dict
+from typing import List
+from typing import Optional
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                    '.tar.xz', '.txz')
+ARCHIVE_ERRORS = (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError)
+CHECKSUM_CHUNK_SIZE = 65536
+
+
+def is_plane_archive(filename: str):
+    """Check whether a file name is an archive that may hold plane files."""
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def member_path(archive_filename: str, member_name: str):
+    """Build the path a plane from an archive is known by.
+
+    Args:
+        archive_filename: The path of the archive.
+        member_name: The name of the member inside the archive.
+
+    Returns:
+        str: The absolute path of the archive joined with the member name.
+
+    """
+    return os.path.join(os.path.abspath(archive_filename),
+                        *member_name.split('/'))
+
+
+class ArchiveMember():
+    """A plane file inside an archive.
+
+    Attributes:
+        name (str): The name of the member inside the archive.
+        size (int): The uncompressed size of the member in bytes.
+        stamp (str): A value that changes whenever the member's content
+        does. The CRC-32 of the member, which tar archives only have when
+        members is asked for checksums. Otherwise it is a tar member's
+        mtime.
+        mtime (int): A tar member's mtime, so its CRC-32 can be reused while
+        its size and mtime stay the same. None for zip members.
+
+    """
+
+    __slots__ = ('name', 'size', 'stamp', 'mtime')
+
+    def __init__(self, name: str, size: int, stamp: str,
+                 mtime: Optional[int] = None):
+        """Class Constructor."""
+        self.name = name
+        self.size = size
+        self.stamp = stamp
+        self.mtime = mtime
+
+
+class PlaneArchive():
+    """An open zip or tar archive of plane files.
+
+    Compressed tar archives can only be read front to back, so their
+    members are cheapest to read in the order members returns them.
+
+    Attributes:
+        filename (str): The path of the archive.
+        random_access (bool): True for zip archives, whose members can be
+        read in any order and by several processes at once.
+
+    Args:
+        filename: The path of the archive.
+
+    Raises:
+        OSError: The archive could not be opened.
+        zipfile.BadZipFile, tarfile.TarError: The file is not a readable
+        archive.
+
+    """
+
+    def __init__(self, filename: str):
+        """Class Constructor."""
+        self.filename = filename
+        self._zip = None
+        self._tar = None
+        self._tar_members = {}  # type: Dict[str, tarfile.TarInfo]
+        self.random_access = zipfile.is_zipfile(filename)
+        if self.random_access:
+            self._zip = zipfile.ZipFile(filename)
+        else:
+            self._tar = tarfile.open(filename)
+
+    def __enter__(self):
+        """Use the archive in a with block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the archive at the end of a with block."""
+        self.close()
+
+    def close(self):
+        """Close the archive file."""
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+    def members(self, checksums: bool = False,
+                previous: Optional[List[ArchiveMember]] = None):
+        """List the plane files in the archive.
+
+        For a zip archive only the central directory is read.
+
+        Args:
+            checksums (Optional): Stamp each member of a tar archive with
+            its CRC-32. A tar header only has an mtime, which a rewritten
+            member can keep.
+            previous (Optional): The members listed the last time the
+            archive was read. A tar member whose size and mtime match its
+            previous listing keeps its CRC-32 rather than being read again.
+
+        Returns:
+            list of ArchiveMember: The members whose names end in .json, in
+            the order they are stored.
+
+        """
+        found = []
+        known = dict((member.name, member) for member in previous or [])
+        if self._zip is not None:
+            for info in self._zip.infolist():
+                if not info.is_dir() and info.filename.endswith('.json'):
+                    found.append(ArchiveMember(info.filename, info.file_size,
+                                               '%08x' % info.CRC))
+        else:
+            for info in self._tar.getmembers():
+                if info.isfile() and info.name.endswith('.json'):
+                    self._tar_members[info.name] = info
+                    stamp = str(info.mtime)
+                    if checksums:
+                        known_member = known.get(info.name)
+                        if (known_member is not None
+                                and known_member.mtime == info.mtime
+                                and known_member.size == info.size):
+                            stamp = known_member.stamp
+                        else:
+                            stamp = '%08x' % self._tar_checksum(info)
+                    found.append(ArchiveMember(info.name, info.size, stamp,
+                                               info.mtime))
+        return found
+
+    def _tar_checksum(self, info: tarfile.TarInfo):
+        """Calculate the CRC-32 of a tar member's content."""
+        checksum = 0
+        with self._tar.extractfile(info) as member_file:
+            for chunk in iter(lambda: member_file.read(CHECKSUM_CHUNK_SIZE),
+                              b''):
+                checksum = zlib.crc32(chunk, checksum)
+        return checksum
+
+    def member_size(self, name: str):
+        """Return the uncompressed size of a member in bytes.
+
+        Raises:
+            KeyError: There is no member by that name.
+
+        """
+        if self._zip is not None:
+            return self._zip.getinfo(name).file_size
+        info = self._tar_members.get(name)
+        if info is None:
+            info = self._tar.getmember(name)
+        return info.size
+
+    def open_member(self, name: str):
+        """Open a member for reading, decompressing it as it is read.
+
+        Args:
+            name: The name of the member.
+
+        Returns:
+            TextIO: The member's content as UTF-8 text.
+
+        Raises:
+            KeyError: There is no member by that name.
+
+        """
+        if self._zip is not None:
+            return io.TextIOWrapper(self._zip.open(name), encoding='utf-8')
+        info = self._tar_members.get(name)
+        if info is None:
+            info = self._tar.getmember(name)
+        return io.TextIOWrapper(self._tar.extractfile(info), encoding='utf-8')
+
@@ -3,13 +3,39 @@
 Copyright 2019 Jacqueline Button.
 
 """
-from typing import List, Optional
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional
 
 from PyInquirer import style_from_dict, Token, prompt, Separator
 
 from model import ChecklistStep
 from model import Checklist
 from model import Plane
+from model import PlaneLibrary
+from profiling import span
+from progress import ChecklistProgress
+from progress import ProgressJournal
+from search import SearchIndex
+from search import SearchResult
+
+# How many steps of choices are built between calls to a pause callback.
+CHOICES_CHUNK_STEPS = 32
+
+
+def timed_prompt(questions, style):
+    """Call the PyInquirer prompt inside a profiling span.
+
+    Args:
+        questions: The JSON instructions for the prompt.
+        style: The style to show the prompt with.
+
+    Returns:
+        dict: The answers from the prompt.
+
+    """
+    with span('cli_controls.prompt'):
+        return prompt(questions, style=style)
 
 
 class CliStyle():
@@ -140,6 +166,7 @@ class ChecklistSelectPageJSONObject(CliJSONObject):
         result = []
         for checklist in self.plane.checklists:
             result.append(checklist.name)
+        result.append('SEARCH THIS PLANE')
         result.append('RETURN TO PLANE SELECT')
         return result
 
@@ -166,20 +193,35 @@ class PlaneSelectPageJSONObject(CliJSONObject):
     command line prompt for the selection page for the list of known planes.
 
     Attributes:
-        planes (list of Plane): The list of Plane objects to select from.
-        choices (list of str): The choices part of the JSON data created by
-        this object.
+        planes (PlaneLibrary): The planes to select from.
+        selection (dict of str: str): The plane_info filter the planes were
+        chosen with. Empty when every plane is shown.
+        can_filter (bool): Whether to offer filtering the planes.
+        choices (list): The choices part of the JSON data created by this
+        object. A plane's choice has its position in planes as its value,
+        so a plane named like one of the menu actions can't be mistaken
+        for it.
 
     Args:
-        planes (list of Plane) The list of Plane objects to select from.
+        planes (PlaneLibrary) The planes to select from.
+        selection (Optional): See selection.
+        can_filter (Optional): See can_filter.
 
     """
 
-    def __init__(self, planes: List[Plane]):
+    def __init__(self, planes: List[Plane],
+                 selection: Optional[Dict[str, str]] = None,
+                 can_filter: bool = False):
         """Class Constructor."""
-        CliJSONObject.__init__(self, 'list', 'list_of_planes',
-                               'Planes to Select:')
+        self.selection = selection or {}
+        message = 'Planes to Select:'
+        if self.selection:
+            message = ('Planes to Select (' + ', '.join(
+                key + ': ' + value for key, value
+                in sorted(self.selection.items())) + '):')
+        CliJSONObject.__init__(self, 'list', 'list_of_planes', message)
         self.planes = planes
+        self.can_filter = can_filter
         self.choices = self.generate_choices_json()
 
     def generate_choices_json(self):
@@ -188,13 +230,18 @@ class PlaneSelectPageJSONObject(CliJSONObject):
         The choices are based based on the names of each plane.
 
         Returns:
-            An list of str representing the choices part of the JSON object
-            built by this class.
+            list: The choices part of the JSON object built by this class, a
+            dict for each plane followed by the menu actions as str.
 
         """
         result = []
-        for plane in self.planes:
-            result.append(plane.plane_name)
+        for index, plane in enumerate(self.planes):
+            result.append({'name': plane.plane_name, 'value': index})
+        if self.can_filter:
+            result.append('FILTER PLANES')
+        if self.selection:
+            result.append('CLEAR FILTER')
+        result.append('SEARCH ALL PLANES')
         result.append('EXIT')
         return result
 
@@ -214,11 +261,114 @@ class PlaneSelectPageJSONObject(CliJSONObject):
         return [result]
 
 
+class FacetSelectPageJSONObject(CliJSONObject):
+    """A subclass of CLIJSONObject for picking a plane_info key or value.
+
+    Attributes:
+        counts (dict of str: int): The number of planes for each option.
+        choices (list of dict): The choices part of the JSON data created by
+        this object. The value of each choice is its option.
+
+    Args:
+        message: The message shown above the options.
+        counts: The number of planes for each option.
+
+    """
+
+    def __init__(self, message: str, counts: Dict[str, int]):
+        """Class Constructor."""
+        CliJSONObject.__init__(self, 'list', 'facet_filter', message)
+        self.counts = counts
+        self.choices = self.generate_choices_json()
+
+    def generate_choices_json(self):
+        """Generate the choices section of the JSON instructions.
+
+        Returns:
+            list: The options with their plane counts, in name order,
+            followed by a choice to cancel.
+
+        """
+        result = []
+        for option in sorted(self.counts):
+            result.append({'name': option + ' (' + str(self.counts[option])
+                                   + ')',
+                           'value': option})
+        result.append('CANCEL FILTER')
+        return result
+
+    def return_json_instructions(self):
+        """Build the JSON instructions for the PyInquirer prompt() command.
+
+        Returns:
+            list of list: A JSON structure to be sent to the CLI as display
+            instructions.
+
+        """
+        result = {}
+        result['type'] = self.json_type
+        result['message'] = self.message
+        result['name'] = self.name
+        result['choices'] = self.choices
+        return [result]
+
+
+class SearchResultsPageJSONObject(CliJSONObject):
+    """A subclass of CLIJSONObject for the results of a search.
+
+    Attributes:
+        results (list of SearchResult): The search results to choose from.
+        choices (list of dict): The choices part of the JSON data created by
+        this object. The value of each choice is its index in results.
+
+    Args:
+        results (list of SearchResult): The search results to choose from.
+
+    """
+
+    def __init__(self, results: List[SearchResult]):
+        """Class Constructor."""
+        CliJSONObject.__init__(self, 'list', 'search_results',
+                               'Search Results:')
+        self.results = results
+        self.choices = self.generate_choices_json()
+
+    def generate_choices_json(self):
+        """Generate the choices section of the JSON instructions.
+
+        Returns:
+            list: The search results followed by a choice to cancel.
+
+        """
+        result = []
+        for index, search_result in enumerate(self.results):
+            result.append({'name': str(search_result), 'value': index})
+        result.append('CANCEL SEARCH')
+        return result
+
+    def return_json_instructions(self):
+        """Build the JSON instructions for the PyInquirer prompt() command.
+
+        Returns:
+            list of list: A JSON structure to be sent to the CLI as display
+            instructions.
+
+        """
+        result = {}
+        result['type'] = self.json_type
+        result['message'] = self.message
+        result['name'] = self.name
+        result['choices'] = self.choices
+        return [result]
+
+
 class ChecklistJSONObject(CliJSONObject):
     """A subclass of CLIJSONObject representing Checklist JSON instructions.
 
     The class represents the information that will be sent to a PyInquirer
     command line prompt for the selection page for a plane's Checklists.
+    The value of each choice is the position of its step, so the prompt
+    answers with the positions of the checked steps.
 
     Attributes:
         qmark (str): the character to display as part of the prompt.
@@ -228,24 +378,46 @@ class ChecklistJSONObject(CliJSONObject):
 
     Args:
         checklist (Checklist): An instance of a Checklist object.
-        selected_items (list of str) (optional): An list of steps that are
-        already selected.
+        progress (ChecklistProgress) (optional): The steps that are already
+        checked.
+        payload_cache (ChecklistPayloadCache) (optional): A cache to reuse
+        the choices from instead of building them again.
+        pause (Callable) (optional): Called after every CHOICES_CHUNK_STEPS
+        steps while the choices are built without a payload_cache, so a
+        build on another thread can let the prompt thread run.
 
     """
 
     def __init__(self, checklist: Checklist,
-                 selected_items: List[str] = None):
+                 progress: Optional[ChecklistProgress] = None,
+                 payload_cache: Optional['ChecklistPayloadCache'] = None,
+                 pause: Optional[Callable[[], None]] = None):
         """Class Constructor."""
         CliJSONObject.__init__(self, 'checkbox', checklist.name,
                                checklist.message)
         self.qmark = '?'
         self.step_count = 0
-        self.choices = self.generate_choices_json(checklist.steps,
-                                                  selected_items)
+        with span('cli_controls.build_payload', checklist.name):
+            if payload_cache is not None:
+                self.choices = payload_cache.get_choices(
+                    checklist, progress, self.generate_choices_json)
+                self.step_count = len(checklist.steps)
+            else:
+                self.choices = self.generate_choices_json(checklist.steps,
+                                                          progress, pause)
+        if progress is not None and self.step_count:
+            self.message += ' [' + str(progress)
+            next_index = progress.next_unchecked()
+            if next_index is not None:
+                next_step = checklist.steps[next_index]
+                self.message += (', next: ' + str(next_step.step_number)
+                                 + ': ' + next_step.step_title)
+            self.message += ']'
 
     def generate_choices_json(self,
                               checklist_steps: Optional[List[ChecklistStep]],
-                              selected_items: Optional[List[str]]):
+                              progress: Optional[ChecklistProgress],
+                              pause: Optional[Callable[[], None]] = None):
         """Generate the choices section of the JSON instructions.
 
         The choices are based based on the ChecklistSteps in the Checklist.
@@ -253,8 +425,10 @@ class ChecklistJSONObject(CliJSONObject):
         Args:
             checklist_steps (list of ChecklistStep): The list of the steps of
             a checklist.
-            selected_items (list of str) (optional): An list of options that
-            have already been selected.
+            progress (ChecklistProgress) (optional): The steps that have
+            already been checked.
+            pause (Callable) (optional): Called after every
+            CHOICES_CHUNK_STEPS steps.
 
         Returns:
             list: An list of str representing the choices part of the JSON
@@ -262,19 +436,18 @@ class ChecklistJSONObject(CliJSONObject):
 
         """
         result = []
-        if checklist_steps is not None and checklist_steps != []:
-            for step in checklist_steps:
+        if checklist_steps:
+            for index, step in enumerate(checklist_steps):
                 self.step_count += 1
                 result.append(Separator(str(step.step_number) + ': ' + step.step_title))
-                if selected_items is not None:
-                    if step.step_text in selected_items:
-                        result.append({'name': step.step_text,
-                                       'checked': True})
-                    else:
-                        name_to_append = str(step.step_number) + ': ' + str(step.step_text)
-                        result.append({'name': name_to_append})
-                else:
-                    result.append({'name': step.step_text})
+                choice = {'name': str(step.step_number) + ': ' + str(step.step_text),
+                          'value': index}
+                if progress is not None and progress.is_checked(index):
+                    choice['checked'] = True
+                result.append(choice)
+                if (pause is not None
+                        and self.step_count % CHOICES_CHUNK_STEPS == 0):
+                    pause()
         else:
             result.append({'name': 'There are no Steps'})
         return result
@@ -301,6 +474,119 @@ class ChecklistJSONObject(CliJSONObject):
         return [result, nav_controls]
 
 
+class ChecklistPayloadCache():
+    """Keeps the prompt choices built for each Checklist between redraws.
+
+    The Separators and choice dicts for a checklist are built once. On
+    later redraws only the checked flags of the steps whose state changed
+    since the last redraw are patched. Entries are held by weak reference
+    to their Checklist, so reloading a plane file, which builds new
+    Checklist objects, drops the old entries on its own.
+
+    The entries are locked so a PrefetchWorker can warm them from its own
+    thread.
+
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self._entries = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get_choices(self, checklist: Checklist,
+                    progress: Optional[ChecklistProgress],
+                    build: Callable):
+        """Return the choices for a checklist, patched to match progress.
+
+        Args:
+            checklist (Checklist): The checklist being shown.
+            progress (ChecklistProgress) (optional): The checked steps.
+            build (Callable): Builds the choices from the steps and progress
+            when the checklist is not cached yet.
+
+        Returns:
+            list: The choices part of the JSON instructions.
+
+        """
+        with self._lock:
+            return self._get_choices(checklist, progress, build)
+
+    def _get_choices(self, checklist: Checklist,
+                     progress: Optional[ChecklistProgress],
+                     build: Callable):
+        """Look up or build the choices for get_choices, under the lock."""
+        step_count = len(checklist.steps)
+        checked = progress.to_bytes() if progress is not None else b''
+        entry = self._entries.get(checklist)
+        if entry is None or entry[0] != step_count:
+            choices = build(checklist.steps, progress)
+            self._entries[checklist] = (step_count, choices, checked)
+            return choices
+        choices = entry[1]
+        if entry[2] != checked:
+            previous = entry[2].ljust(len(checked), b'\x00')
+            for byte_index, (old_byte, new_byte) in enumerate(
+                    zip(previous, checked)):
+                flipped = old_byte ^ new_byte
+                while flipped:
+                    bit = flipped & -flipped
+                    flipped ^= bit
+                    index = (byte_index << 3) | (bit.bit_length() - 1)
+                    # Each step has a Separator and then its choice.
+                    choice = choices[2 * index + 1]
+                    if new_byte & bit:
+                        choice['checked'] = True
+                    else:
+                        choice.pop('checked', None)
+            self._entries[checklist] = (step_count, choices, checked)
+        return choices
+
+    def warm(self, checklist: Checklist,
+             pause: Optional[Callable[[], None]] = None):
+        """Build the choices for a checklist before it is shown.
+
+        Checklists that are already cached are left alone, so choices that
+        may be on screen are never changed from another thread.
+
+        Args:
+            checklist (Checklist): The checklist to build the choices for.
+            pause (Callable) (optional): Called between chunks of steps, see
+            ChecklistJSONObject.
+
+        Returns:
+            bool: True if the choices were built.
+
+        """
+        with self._lock:
+            if checklist in self._entries:
+                return False
+        # Built outside the lock so the prompt thread is not held up. The
+        # choices start unchecked and get_choices patches in the progress.
+        choices = ChecklistJSONObject(checklist, pause=pause).choices
+        with self._lock:
+            self._entries.setdefault(checklist, (len(checklist.steps),
+                                                 choices, b''))
+        return True
+
+    def invalidate(self, plane: Optional[Plane] = None):
+        """Drop cached choices.
+
+        Args:
+            plane (Plane) (optional): Only drop the checklists of this plane.
+            Every entry is dropped when it is not given.
+
+        """
+        with self._lock:
+            if plane is None:
+                self._entries.clear()
+                return
+            for checklist in plane.checklists:
+                self._entries.pop(checklist, None)
+
+
+CHECKLIST_PAYLOAD_CACHE = ChecklistPayloadCache()
+
+
 def show_checklist_selection_page(plane, cli_cont_style: CliStyle):
     """Display a prompt that has a list of possible checklists from a plane.
 
@@ -315,12 +601,13 @@ def show_checklist_selection_page(plane, cli_cont_style: CliStyle):
     """
     chlst_sel_pg = ChecklistSelectPageJSONObject(plane)
     chlst_sel_json_res = chlst_sel_pg.return_json_instructions()
-    sel_chlst = prompt(chlst_sel_json_res,
-                       style=cli_cont_style.style)[chlst_sel_pg.name]
+    sel_chlst = timed_prompt(chlst_sel_json_res,
+                             style=cli_cont_style.style)[chlst_sel_pg.name]
     return sel_chlst
 
 
-def show_checklist(plane, checklist_name, cli_cont_style: CliStyle):
+def show_checklist(plane, checklist_name, cli_cont_style: CliStyle,
+                   journal: Optional[ProgressJournal] = None):
     """Display a prompt with a list of possible checklists from a plane.
 
     Args:
@@ -329,6 +616,8 @@ def show_checklist(plane, checklist_name, cli_cont_style: CliStyle):
         checklist_name (str): The string name of the checklist to be
         displayed.
         cli_cont_style (CliStyle): A CliStyle object to use as styling.
+        journal (ProgressJournal) (optional): Where the checked steps are
+        kept between visits to the checklist and between runs.
 
     Returns:
         str: The value returned by the prompt operation.
@@ -337,17 +626,26 @@ def show_checklist(plane, checklist_name, cli_cont_style: CliStyle):
     page_results = None
     page_json = [List]
     flag = False
-    selected_items = list('')
     results = None
-    checklist_obj = Checklist('none', 'none')
-    for checklist in plane.checklists:
-        if checklist.name == checklist_name:
-            checklist_obj = checklist
+    checklist_obj = plane.get_checklist(checklist_name)
+    if checklist_obj is None:
+        checklist_obj = Checklist('none', 'none')
+    if journal is not None:
+        progress = journal.get_progress(plane.plane_name, checklist_obj.name,
+                                        len(checklist_obj.steps))
+    else:
+        progress = ChecklistProgress(len(checklist_obj.steps))
     while not flag:
-        checklist_json_obj = ChecklistJSONObject(checklist_obj, selected_items)
+        checklist_json_obj = ChecklistJSONObject(checklist_obj, progress,
+                                                 CHECKLIST_PAYLOAD_CACHE)
         page_json = checklist_json_obj.return_json_instructions()
-        page_results = prompt(page_json, style=cli_cont_style.style)
-        selected_items = page_results[checklist_obj.name]
+        page_results = timed_prompt(page_json, style=cli_cont_style.style)
+        changed = progress.update_from(
+            [index for index in page_results[checklist_obj.name]
+             if isinstance(index, int)])
+        if journal is not None and changed:
+            journal.record(plane.plane_name, checklist_obj.name, progress,
+                           changed)
         nav_results = page_results['nav_controls']
         if nav_results in (['EXIT', 'RETURN TO LIST SELECT']):
             results = nav_results
@@ -355,23 +653,131 @@ def show_checklist(plane, checklist_name, cli_cont_style: CliStyle):
     return results
 
 
-def show_plane_select_menu(planes, cli_cont_style: CliStyle):
+def show_search_prompt(search_index: SearchIndex, cli_cont_style: CliStyle,
+                       plane_key: Optional[str] = None):
+    """Ask for a search query and let the user pick one of the results.
+
+    Args:
+        search_index (SearchIndex): The index to search.
+        cli_cont_style (CliStyle): The style to use for the PyInquirer prompt.
+        plane_key (str) (optional): Only search the plane with this key.
+
+    Returns:
+        SearchResult: The result chosen, or None if the search was cancelled
+        or nothing matched.
+
+    """
+    query = timed_prompt([{'type': 'input', 'name': 'search_query',
+                           'message': 'Search for:'}],
+                         style=cli_cont_style.style)['search_query']
+    if not query.strip():
+        return None
+    results = search_index.search(query, plane_key=plane_key)
+    if not results:
+        print('No steps matched: ' + query)
+        return None
+    results_json = SearchResultsPageJSONObject(results)
+    selected = timed_prompt(results_json.return_json_instructions(),
+                            style=cli_cont_style.style)[results_json.name]
+    if selected == 'CANCEL SEARCH':
+        return None
+    return results[selected]
+
+
+def show_facet_filter_prompt(planes: PlaneLibrary,
+                             selection: Dict[str, str],
+                             cli_cont_style: CliStyle):
+    """Ask for a plane_info key and one of its values to filter planes by.
+
+    The counts shown come from the library's facet index.
+
+    Args:
+        planes (PlaneLibrary): The planes being filtered.
+        selection (dict of str: str): The filter already chosen.
+        cli_cont_style (CliStyle): The style to use for the PyInquirer prompt.
+
+    Returns:
+        dict of str: str: The selection with the chosen key and value, or
+        None if the filter was cancelled.
+
+    """
+    facet_counts = planes.facet_counts(selection)
+    key_json = FacetSelectPageJSONObject(
+        'Filter planes by:', {key: sum(counts.values())
+                              for key, counts in facet_counts.items()
+                              if counts})
+    key = timed_prompt(key_json.return_json_instructions(),
+                       style=cli_cont_style.style)[key_json.name]
+    if key == 'CANCEL FILTER':
+        return None
+    value_json = FacetSelectPageJSONObject(key + ':', facet_counts[key])
+    value = timed_prompt(value_json.return_json_instructions(),
+                         style=cli_cont_style.style)[value_json.name]
+    if value == 'CANCEL FILTER':
+        return None
+    new_selection = dict(selection)
+    new_selection[key] = value
+    return new_selection
+
+
+def show_plane_select_menu(planes, cli_cont_style: CliStyle,
+                           search_index: Optional[SearchIndex] = None,
+                           selection: Optional[Dict[str, str]] = None):
     """Display a list of planes to select from.
 
     Args:
-        planes (list of Plane): The list of Plane objects to use as a list.
+        planes (PlaneLibrary): The planes to use as a list. A plain list of
+        Plane objects is also accepted.
         cli_cont_style (CliStyle): The style to use for the PyInquirer prompt.
+        search_index (SearchIndex) (optional): The index used when the user
+        searches all planes. It is brought up to date with planes first.
+        selection (dict of str: str) (optional): The plane_info filter to
+        start with. It is updated in place as the user changes the filter,
+        so passing the same dict again keeps the filter.
 
     Returns:
-        str: The name of the plane selected by the user.
+        tuple of (Plane, str): The plane selected by the user, or None if
+        they chose to exit, and the name of the checklist to open when the
+        plane was picked from a search result, otherwise None.
 
     """
     selected_plane = None
-    plane_lst_json = PlaneSelectPageJSONObject(planes)
-    sel_plane_nm = prompt(plane_lst_json.return_json_instructions(),
-                          style=cli_cont_style.style)[plane_lst_json.name]
-    if sel_plane_nm != 'EXIT':
-        for plane in planes:
-            if plane.plane_name == sel_plane_nm:
-                selected_plane = plane
-    return selected_plane
+    selected_checklist = None
+    if not isinstance(planes, PlaneLibrary):
+        planes = PlaneLibrary(planes)
+    if search_index is None:
+        search_index = SearchIndex()
+    if selection is None:
+        selection = {}
+
+    def build_page():
+        return PlaneSelectPageJSONObject(planes.filter(selection), selection,
+                                         bool(planes.facets.keys()))
+
+    plane_lst_json = build_page()
+    while selected_plane is None:
+        sel_plane_nm = timed_prompt(
+            plane_lst_json.return_json_instructions(),
+            style=cli_cont_style.style)[plane_lst_json.name]
+        if isinstance(sel_plane_nm, int):
+            selected_plane = plane_lst_json.planes[sel_plane_nm]
+        elif sel_plane_nm == 'EXIT':
+            break
+        elif sel_plane_nm == 'FILTER PLANES':
+            new_selection = show_facet_filter_prompt(planes, selection,
+                                                     cli_cont_style)
+            if new_selection is not None:
+                selection.update(new_selection)
+                plane_lst_json = build_page()
+        elif sel_plane_nm == 'CLEAR FILTER':
+            selection.clear()
+            plane_lst_json = build_page()
+        elif sel_plane_nm == 'SEARCH ALL PLANES':
+            search_index.sync(planes)
+            search_result = show_search_prompt(search_index, cli_cont_style)
+            if search_result is not None:
+                selected_plane = (planes.get_by_path(search_result.plane_key)
+                                  or planes.get_by_name(
+                                      search_result.plane_name))
+                selected_checklist = search_result.checklist_name
+    return selected_plane, selected_checklist
@@ -0,0 +1,243 @@
+"""Writes planes out as Markdown, plain text or printable HTML cards.
+
+The exporters write one plane at a time straight to a file handle and
+keep nothing once a plane is written, so a library of any size can be
+exported in constant memory as long as the planes are produced one at a
+time too, for example by fileio.iter_plane_files.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import html
+from abc import ABC
+from abc import abstractmethod
+from typing import Iterable
+from typing import TextIO
+
+from model import Checklist
+from model import Plane
+
+TEXT_WIDTH = 72
+HTML_HEADER = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>FlySimChk Checklists</title>
+<style>
+body { font-family: sans-serif; margin: 0.5in; }
+.plane { page-break-after: always; }
+.plane:last-child { page-break-after: auto; }
+.card { border: 2px solid #000; border-radius: 6px; margin: 0 0 0.25in 0;
+        padding: 0.1in 0.15in; width: 5in; page-break-inside: avoid; }
+.card h2 { font-size: 13pt; margin: 0 0 0.05in 0; text-transform: uppercase; }
+.card p { font-style: italic; margin: 0 0 0.08in 0; }
+.card table { border-collapse: collapse; width: 100%; font-size: 10pt; }
+.card td { padding: 1px 0; vertical-align: bottom; }
+.card td.number { width: 2.5em; }
+.card td.title { white-space: nowrap; }
+.card td.leader { border-bottom: 1px dotted #000; width: 100%; }
+.card td.text { white-space: nowrap; text-align: right; font-weight: bold; }
+.info { font-size: 9pt; color: #444; }
+</style>
+</head>
+<body>
+'''
+HTML_FOOTER = '''</body>
+</html>
+'''
+
+
+class PlaneExporter(ABC):
+    """Writes planes to a file handle in some format.
+
+    Subclasses write the document's start and end and each plane.
+
+    Attributes:
+        stream (TextIO): Where the output is written.
+
+    Args:
+        stream: A text file handle opened for writing.
+
+    """
+
+    def __init__(self, stream: TextIO):
+        """Class Constructor."""
+        self.stream = stream
+
+    def begin(self):
+        """Write anything that comes before the first plane."""
+
+    @abstractmethod
+    def write_plane(self, plane: Plane):
+        """Write one plane.
+
+        Args:
+            plane: The plane to write.
+
+        """
+
+    def end(self):
+        """Write anything that comes after the last plane."""
+
+
+class MarkdownExporter(PlaneExporter):
+    """Writes each plane as a Markdown section, one task list per checklist."""
+
+    def write_plane(self, plane: Plane):
+        """Write one plane as Markdown.
+
+        Args:
+            plane: The plane to write.
+
+        """
+        lines = ['# ' + plane.plane_name, '']
+        for info_pair in plane.plane_info:
+            for key, value in info_pair.items():
+                lines.append('- **' + str(key) + ':** ' + str(value))
+        if plane.plane_info:
+            lines.append('')
+        self.stream.write('\n'.join(lines) + '\n')
+        for checklist in plane.checklists:
+            self.stream.write(self._checklist(checklist))
+
+    @staticmethod
+    def _checklist(checklist: Checklist):
+        """Render one checklist as a Markdown section."""
+        lines = ['## ' + checklist.name, '', '_' + checklist.message + '_',
+                 '']
+        for step in checklist.steps:
+            lines.append('- [ ] **' + str(step.step_number) + '. '
+                         + step.step_title + '** - ' + step.step_text)
+        lines.append('')
+        return '\n'.join(lines) + '\n'
+
+
+class TextExporter(PlaneExporter):
+    """Writes each plane as plain text with dotted leaders to each step text.
+
+    Attributes:
+        width (int): The width of a line.
+
+    Args:
+        stream: A text file handle opened for writing.
+        width (Optional): See width.
+
+    """
+
+    def __init__(self, stream: TextIO, width: int = TEXT_WIDTH):
+        """Class Constructor."""
+        PlaneExporter.__init__(self, stream)
+        self.width = width
+
+    def write_plane(self, plane: Plane):
+        """Write one plane as plain text.
+
+        Args:
+            plane: The plane to write.
+
+        """
+        name = plane.plane_name.upper()
+        lines = [name, '=' * len(name)]
+        for info_pair in plane.plane_info:
+            for key, value in info_pair.items():
+                lines.append(str(key) + ': ' + str(value))
+        lines.append('')
+        self.stream.write('\n'.join(lines) + '\n')
+        for checklist in plane.checklists:
+            self.stream.write(self._checklist(checklist))
+
+    def _checklist(self, checklist: Checklist):
+        """Render one checklist as plain text."""
+        lines = [checklist.name, '-' * len(checklist.name), checklist.message,
+                 '']
+        for step in checklist.steps:
+            start = '{:>4}. {} '.format(step.step_number, step.step_title)
+            end = ' ' + step.step_text
+            lines.append(start + '.' * max(3, self.width - len(start)
+                                                - len(end)) + end)
+        lines.append('')
+        return '\n'.join(lines) + '\n'
+
+
+class HtmlExporter(PlaneExporter):
+    """Writes a printable HTML page with a kneeboard card per checklist."""
+
+    def begin(self):
+        """Write the start of the page and its print styles."""
+        self.stream.write(HTML_HEADER)
+
+    def write_plane(self, plane: Plane):
+        """Write one plane as a section of cards.
+
+        Args:
+            plane: The plane to write.
+
+        """
+        escape = html.escape
+        parts = ['<section class="plane">\n<h1>', escape(plane.plane_name),
+                 '</h1>\n']
+        if plane.plane_info:
+            parts.append('<p class="info">')
+            parts.append(' &middot; '.join(
+                escape(str(key)) + ': ' + escape(str(value))
+                for info_pair in plane.plane_info
+                for key, value in info_pair.items()))
+            parts.append('</p>\n')
+        self.stream.write(''.join(parts))
+        for checklist in plane.checklists:
+            self.stream.write(self._checklist(checklist))
+        self.stream.write('</section>\n')
+
+    @staticmethod
+    def _checklist(checklist: Checklist):
+        """Render one checklist as a card."""
+        escape = html.escape
+        parts = ['<div class="card">\n<h2>', escape(checklist.name),
+                 '</h2>\n<p>', escape(checklist.message), '</p>\n<table>\n']
+        for step in checklist.steps:
+            parts.extend(('<tr><td class="number">',
+                          escape(str(step.step_number)),
+                          '</td><td class="title">', escape(step.step_title),
+                          '</td><td class="leader"></td><td class="text">',
+                          escape(step.step_text), '</td></tr>\n'))
+        parts.append('</table>\n</div>\n')
+        return ''.join(parts)
+
+    def end(self):
+        """Write the end of the page."""
+        self.stream.write(HTML_FOOTER)
+
+
+EXPORTERS = {'markdown': MarkdownExporter,
+             'text': TextExporter,
+             'html': HtmlExporter}
+
+
+def export_planes(planes: Iterable[Plane], stream: TextIO,
+                  export_format: str = 'markdown'):
+    """Write planes to a file handle one at a time.
+
+    Args:
+        planes: The planes to write. Pass a generator to keep only one plane
+        in memory at a time.
+        stream: A text file handle opened for writing.
+        export_format (Optional): One of the keys of EXPORTERS.
+
+    Returns:
+        int: The number of planes written.
+
+    Raises:
+        ValueError: The format is not one of EXPORTERS.
+
+    """
+    exporter_class = EXPORTERS.get(export_format)
+    if exporter_class is None:
+        raise ValueError('Unknown export format: ' + str(export_format))
+    exporter = exporter_class(stream)
+    exporter.begin()
+    plane_count = 0
+    for plane in planes:
+        exporter.write_plane(plane)
+        plane_count += 1
+    exporter.end()
+    return plane_count
@@ -4,73 +4,961 @@ Copyright 2019 Jacqueline Button.
 
 """
 import json
-#from json import JSONDecodeError
+import os
+import re
+from functools import partial
 from os import listdir
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import TextIO
 
+from archive import ARCHIVE_ERRORS
+from archive import PlaneArchive
+from archive import is_plane_archive
+from archive import member_path
+from interning import STRING_POOL
+from jsonstream import JsonStreamReader
+from manifest import LibraryManifest
 from model import Checklist
 from model import ChecklistStep
+from model import LazyPlane
 from model import Plane
+from model import PlaneLibrary
+from profiling import span
+from validator import LoadDiagnostic
+from validator import PlaneLoadError
+from validator import ValidationError
+from validator import decode_error
+from validator import parse_step_number
+from validator import validate_plane_data
+from validator import validate_plane_path
 
+HEADER_CHUNK_SIZE = 4096
+PARALLEL_MIN_FILES = 32
+STREAMING_MIN_SIZE = 8 * 1024 * 1024
+PLANE_NAME_KEY = re.compile(r'"plane_name"\s*:\s*')
+PLANE_INFO_KEY = re.compile(r'"plane_info"\s*:\s*')
+CHECKLISTS_KEY = re.compile(r'"checklists"\s*:')
+# Raised when a plane file or an archive member can't be read.
+READ_ERRORS = (UnicodeDecodeError,) + ARCHIVE_ERRORS
 
-def load_plane_file(filename: str):
+
+def _require_str(value):
+    """Return value, raising TypeError if it is not a str."""
+    if type(value) is not str:
+        raise TypeError('expected a string, found ' + repr(value))
+    return value
+
+
+def _stat_or_none(path: str):
+    """Return os.stat of a file, or None if it can't be stat'ed."""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _require_list(value):
+    """Return value, raising TypeError if it is not a list."""
+    if type(value) is not list:
+        raise TypeError('expected a list, found ' + repr(value))
+    return value
+
+
+def load_plane_file(filename: str, columnar: bool = False):
     """Handle the loading of a plane data file.
 
+    Files of STREAMING_MIN_SIZE bytes or more are read with
+    load_plane_file_streaming to keep the peak memory down.
+
     Args:
         filename: the name of the file. It will be validated to make sure it
         is a JSON file
+        columnar (Optional): Store each checklist's steps in the compact
+        StepColumns form.
+
+    Raises:
+        PlaneLoadError: The file could not be read, is not valid JSON, or
+        does not follow the plane file schema. The error's diagnostic lists
+        every problem with its JSON path.
 
     """
-    checklists = []
-    new_plane = Plane('blank')
-    if validate_plane_file(filename):
-        with open(filename) as plane_data_file:
-            try:
-                plane_data = json.load(plane_data_file)
-                # All other data in the file is not handled yet.
-                # Currently only concerned about the checklists.
-                for individual_checklist in plane_data['checklists']:
-                    steps = []
-                    for checklist_step in individual_checklist['checklist_steps']:
-                        temp_checklist_step = ChecklistStep(
-                            int(checklist_step['step_number']),
-                            checklist_step['step_title'],
-                            checklist_step['step_text']
-                        )
-                        steps.append(temp_checklist_step)
-                    checklists.append(Checklist(
-                        individual_checklist['checklist_name'],
-                        individual_checklist['checklist_message'],
-                        steps
-                    ))
-                    checklists[-1].sort_checklist()
-                new_plane.plane_name = plane_data['plane_name']
-                new_plane.checklists = checklists
-            except json.JSONDecodeError:
-                new_plane = Plane("Plane with filename: " + str(filename) + " Failed to load correctly.", None, None)
-            
-    else:
+    with span('fileio.load_plane_file', filename):
+        try:
+            large = os.path.getsize(filename) >= STREAMING_MIN_SIZE
+        except OSError:
+            large = False
+        if large and validate_plane_file(filename):
+            return load_plane_file_streaming(filename, columnar)
+        return _load_plane_file_whole(filename, columnar)
+
+
+def _load_plane_file_whole(filename: str, columnar: bool = False):
+    """Load a plane data file by decoding all of it with json.load."""
+    if not validate_plane_file(filename):
         raise Exception('Parameter filename Passed to load_plane_file method \
             was not a JSON file.')
+    return _load_plane_whole(partial(open, filename, encoding='utf-8'),
+                             filename, columnar)
+
+
+def _load_plane_whole(open_stream: Callable[[], TextIO], filename: str,
+                      columnar: bool = False):
+    """Load a plane by decoding all of a stream with json.load."""
+    intern = STRING_POOL.intern
+    checklists = []
+    new_plane = Plane('blank')
+    try:
+        with open_stream() as plane_data_file, \
+                span('fileio.json_decode', filename):
+            plane_data = json.load(plane_data_file)
+    except json.JSONDecodeError as json_error:
+        raise PlaneLoadError(filename, [decode_error(json_error)])
+    except READ_ERRORS as read_error:
+        raise PlaneLoadError(filename, [ValidationError(
+            '$', 'could not read file: ' + str(read_error))])
+    try:
+        for individual_checklist in plane_data['checklists']:
+            steps = []
+            for checklist_step in individual_checklist['checklist_steps']:
+                temp_checklist_step = ChecklistStep(
+                    parse_step_number(checklist_step['step_number']),
+                    intern(_require_str(checklist_step['step_title'])),
+                    intern(_require_str(checklist_step['step_text']))
+                )
+                steps.append(temp_checklist_step)
+            checklists.append(Checklist(
+                intern(_require_str(
+                    individual_checklist['checklist_name'])),
+                intern(_require_str(
+                    individual_checklist['checklist_message'])),
+                steps
+            ))
+            checklists[-1].sort_checklist()
+            if columnar:
+                checklists[-1].compact()
+        new_plane.plane_name = intern(_require_str(
+            plane_data['plane_name']))
+        new_plane.plane_info = _read_plane_info(plane_data.get('plane_info',
+                                                               []))
+        new_plane.checklists = checklists
+    except (KeyError, IndexError, ValueError, TypeError,
+            AttributeError) as build_error:
+        # The schema check is only run on failure so good files don't
+        # pay for it.
+        errors = validate_plane_data(plane_data)
+        if not errors:
+            errors = [ValidationError('$', type(build_error).__name__
+                                      + ': ' + str(build_error))]
+        raise PlaneLoadError(filename, errors) from build_error
     return new_plane
 
 
-def search_directory_for_planes(directory: str):
+def _read_streaming_step(reader: JsonStreamReader):
+    """Read one step object from a plane file and build its ChecklistStep."""
+    checklist_step = reader.value()
+    intern = STRING_POOL.intern
+    return ChecklistStep(
+        parse_step_number(checklist_step['step_number']),
+        intern(_require_str(checklist_step['step_title'])),
+        intern(_require_str(checklist_step['step_text'])))
+
+
+def _read_streaming_checklist(reader: JsonStreamReader, columnar: bool):
+    """Read one checklist object from a plane file and build its Checklist."""
+    fields = {}
+    steps = None
+    for key in reader.keys():
+        if key == 'checklist_steps':
+            steps = [_read_streaming_step(reader) for _ in reader.items()]
+        else:
+            fields[key] = reader.value()
+    if steps is None:
+        raise KeyError('checklist_steps')
+    intern = STRING_POOL.intern
+    checklist = Checklist(intern(_require_str(fields['checklist_name'])),
+                          intern(_require_str(fields['checklist_message'])),
+                          steps)
+    checklist.sort_checklist()
+    if columnar:
+        checklist.compact()
+    return checklist
+
+
+def load_plane_file_streaming(filename: str, columnar: bool = False):
+    """Load a plane data file without decoding all of it at once.
+
+    The checklists are built step by step as the file is read, so the
+    decoded JSON of the whole file is never held in memory next to the
+    Plane. The result is the same as load_plane_file's.
+
+    Args:
+        filename: the name of the file.
+        columnar (Optional): Store each checklist's steps in the compact
+        StepColumns form.
+
+    Raises:
+        PlaneLoadError: As load_plane_file.
+
+    """
+    if not validate_plane_file(filename):
+        raise Exception('Parameter filename Passed to '
+                        'load_plane_file_streaming method was not a JSON '
+                        'file.')
+    return load_plane_stream(partial(open, filename, encoding='utf-8'),
+                             filename, columnar)
+
+
+def load_plane_stream(open_stream: Callable[[], TextIO], filename: str,
+                      columnar: bool = False):
+    """Load a plane from a text stream, building it as the stream is read.
+
+    Args:
+        open_stream: Opens the stream, for example an archive member. It is
+        called again to build the diagnostic if the plane is broken.
+        filename: The name to report the plane's problems under.
+        columnar (Optional): Store each checklist's steps in the compact
+        StepColumns form.
+
+    Raises:
+        PlaneLoadError: As load_plane_file.
+
+    """
+    try:
+        with open_stream() as plane_data_file, \
+                span('fileio.stream_decode', filename):
+            reader = JsonStreamReader(plane_data_file)
+            fields = {}
+            checklists = None
+            for key in reader.keys():
+                if key == 'checklists':
+                    checklists = [_read_streaming_checklist(reader, columnar)
+                                  for _ in reader.items()]
+                else:
+                    fields[key] = reader.value()
+            reader.end()
+        if checklists is None:
+            raise KeyError('checklists')
+        new_plane = Plane('blank')
+        new_plane.plane_name = STRING_POOL.intern(
+            _require_str(fields['plane_name']))
+        new_plane.plane_info = _read_plane_info(fields.get('plane_info', []))
+        new_plane.checklists = checklists
+        return new_plane
+    except (json.JSONDecodeError, KeyError, IndexError, ValueError,
+            TypeError, AttributeError) + READ_ERRORS:
+        # A broken plane is loaded the normal way, which builds the
+        # diagnostic with the path of every problem.
+        return _load_plane_whole(open_stream, filename, columnar)
+
+
+def load_plane_or_diagnostic(filename: str, lazy: bool = False):
+    """Load a plane data file without letting a bad file raise.
+
+    Args:
+        filename: the name of the file.
+        lazy (Optional): Create a LazyPlane instead of loading everything.
+
+    Returns:
+        Plane: The plane, or a LoadDiagnostic if the file failed to load.
+
+    """
+    try:
+        if lazy:
+            return load_lazy_plane(filename)
+        return load_plane_file(filename)
+    except PlaneLoadError as load_error:
+        return load_error.diagnostic
+    except Exception as error:  # pylint: disable=broad-except
+        # One bad file must never stop the rest of a scan.
+        return LoadDiagnostic(filename, [ValidationError(
+            '$', type(error).__name__ + ': ' + str(error))])
+
+
+def load_plane_header(filename: str):
+    """Read just enough of a plane data file to get its name and info.
+
+    The file is read in chunks until the plane_name and plane_info values
+    have been decoded. plane_info is optional, so a file that reaches its
+    checklists without one has an empty plane_info. The whole file is only
+    loaded when the plane_name can't be found before the checklists start
+    or either value is malformed, to build the diagnostic.
+
+    Args:
+        filename: the name of the file.
+
+    Returns:
+        tuple of (str, list): The name of the plane and its plane_info.
+
+    """
+    with open(filename, encoding='utf-8') as plane_data_file, \
+            span('fileio.load_plane_header', filename):
+        plane_name, plane_info = _read_plane_header(plane_data_file)
+    if plane_name is not None and plane_info is not None:
+        return plane_name, plane_info
+    plane = load_plane_file(filename)
+    return plane.plane_name, plane.plane_info
+
+
+def _read_plane_header(plane_data_file: TextIO):
+    """Read a stream in chunks until plane_name and plane_info are decoded.
+
+    Reading stops where the checklists start, so a large file is not read
+    to the end just because it has no plane_info.
+
+    Returns:
+        tuple of (str, list): The name of the plane and its plane_info,
+        each None if it wasn't found or is malformed. plane_info is an
+        empty list when the checklists start without one.
+
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    plane_name = None
+    plane_info = None
+    while True:
+        chunk = plane_data_file.read(HEADER_CHUNK_SIZE)
+        buffer += chunk
+        if plane_name is None:
+            plane_name = _decode_header_value(decoder, PLANE_NAME_KEY, buffer)
+            if not isinstance(plane_name, str):
+                plane_name = None
+        if plane_info is None:
+            plane_info = _decode_header_value(decoder, PLANE_INFO_KEY,
+                                              buffer)
+            if plane_info is not None:
+                try:
+                    plane_info = _read_plane_info(plane_info)
+                except (AttributeError, TypeError):
+                    return plane_name, None
+        if plane_name is not None and plane_info is not None:
+            return plane_name, plane_info
+        if CHECKLISTS_KEY.search(buffer) is not None:
+            if plane_info is None and PLANE_INFO_KEY.search(buffer) is None:
+                plane_info = []
+            return plane_name, plane_info
+        if not chunk:
+            return plane_name, plane_info
+
+
+def _decode_header_value(decoder: json.JSONDecoder, key_pattern, buffer: str):
+    """Decode the value after a key, or return None if it isn't all read."""
+    match = key_pattern.search(buffer)
+    if match is None:
+        return None
+    try:
+        return decoder.raw_decode(buffer, match.end())[0]
+    except json.JSONDecodeError:
+        return None
+
+
+def _read_plane_info(plane_info: list):
+    """Build the plane_info of a plane from its decoded JSON.
+
+    Raises:
+        TypeError: A key or value is not a str.
+        AttributeError: An entry is not an object.
+
+    """
+    intern = STRING_POOL.intern
+    return [{intern(_require_str(key)): intern(_require_str(value))
+             for key, value in info_pair.items()}
+            for info_pair in _require_list(plane_info)]
+
+
+def load_lazy_plane(filename: str):
+    """Create a LazyPlane for a plane data file.
+
+    Args:
+        filename: the name of the file.
+
+    Returns:
+        LazyPlane: A plane whose checklists are loaded on first use.
+
+    """
+    if not validate_plane_file(filename):
+        raise Exception('Parameter filename Passed to load_lazy_plane method \
+            was not a JSON file.')
+    plane_name, plane_info = load_plane_header(filename)
+    return LazyPlane(STRING_POOL.intern(plane_name),
+                     partial(load_plane_file, filename),
+                     filename, plane_info)
+
+
+def record_load_failure(library: PlaneLibrary, plane: Plane,
+                        load_error: PlaneLoadError,
+                        manifest: Optional[LibraryManifest] = None):
+    """Move a plane that failed to materialize into the library's diagnostics.
+
+    Only the header of a LazyPlane is read by a scan, so a file whose
+    checklists are broken is listed like any other until it is picked.
+
+    Args:
+        library: The library the plane is in.
+        plane: The plane that failed to load.
+        load_error: The error raised by plane.materialize().
+        manifest (Optional): A LibraryManifest to remember the failure in,
+        so the file is not loaded again until it changes.
+
+    """
+    path = library.path_of(plane)
+    library.remove(plane)
+    library.diagnostics.append(load_error.diagnostic)
+    if manifest is not None and path is not None:
+        manifest.record_failure(path, load_error.diagnostic)
+        manifest.save()
+
+
+def load_plane_files(filenames: List[str], workers: int = 1,
+                     lazy: bool = False):
+    """Load a list of plane data files, optionally in parallel.
+
+    Full loads are CPU bound so they are spread across worker processes.
+    Lazy loads only read the start of each file so threads are used instead.
+    Lists shorter than PARALLEL_MIN_FILES are always loaded serially because
+    starting the pool would take longer than the loading itself.
+
+    Args:
+        filenames: The paths of the plane files to load.
+        workers (Optional): The number of workers to use. 1 loads serially
+        and 0 uses one worker per CPU.
+        lazy (Optional): When True LazyPlanes are created instead.
+
+    Returns:
+        list: A Plane, or a LoadDiagnostic for a file that failed to load,
+        in the same order as filenames.
+
+    """
+    loader = partial(load_plane_or_diagnostic, lazy=lazy)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(filenames) < PARALLEL_MIN_FILES:
+        return [loader(filename) for filename in filenames]
+    # Imported here so the serial path doesn't pay for the import.
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor
+    if lazy:
+        executor_class = ThreadPoolExecutor
+    else:
+        executor_class = ProcessPoolExecutor
+    chunk_size = max(1, len(filenames) // (workers * 4))
+    with executor_class(max_workers=workers) as executor:
+        results = list(executor.map(loader, filenames, chunksize=chunk_size))
+    if not lazy:
+        # Planes from worker processes arrive with their own copies of
+        # every string.
+        for plane in results:
+            if not isinstance(plane, LoadDiagnostic):
+                STRING_POOL.intern_plane(plane)
+    return results
+
+
+def load_archive_member(archive_filename: str, member_name: str,
+                        columnar: bool = False):
+    """Load one plane file from inside an archive.
+
+    Args:
+        archive_filename: The path of the archive.
+        member_name: The name of the plane file inside the archive.
+        columnar (Optional): Store each checklist's steps in the compact
+        StepColumns form.
+
+    Raises:
+        PlaneLoadError: As load_plane_file, also when the archive itself
+        can't be read.
+
+    """
+    try:
+        archive = PlaneArchive(archive_filename)
+    except ARCHIVE_ERRORS as read_error:
+        raise PlaneLoadError(member_path(archive_filename, member_name),
+                             [ValidationError('$', 'could not read archive: '
+                                              + str(read_error))])
+    with archive:
+        return _load_archive_member(archive, member_name, columnar)
+
+
+def _load_archive_member(archive: PlaneArchive, member_name: str,
+                         columnar: bool = False):
+    """Load a member of an open archive, reading it from the archive.
+
+    As with load_plane_file, members of STREAMING_MIN_SIZE bytes or more
+    are decoded as they are read.
+
+    """
+    filename = member_path(archive.filename, member_name)
+    open_stream = partial(archive.open_member, member_name)
+    with span('fileio.load_archive_member', filename):
+        if archive.member_size(member_name) >= STREAMING_MIN_SIZE:
+            return load_plane_stream(open_stream, filename, columnar)
+        return _load_plane_whole(open_stream, filename, columnar)
+
+
+def _load_archive_member_or_diagnostic(archive: PlaneArchive,
+                                       member_name: str, lazy: bool = False):
+    """Load a member of an open archive as load_plane_or_diagnostic would."""
+    filename = member_path(archive.filename, member_name)
+    try:
+        if lazy:
+            with archive.open_member(member_name) as plane_data_file:
+                plane_name, plane_info = _read_plane_header(plane_data_file)
+            if plane_name is None or plane_info is None:
+                plane = _load_archive_member(archive, member_name)
+                plane_name, plane_info = plane.plane_name, plane.plane_info
+            return LazyPlane(STRING_POOL.intern(plane_name),
+                             partial(load_archive_member,
+                                     os.path.abspath(archive.filename),
+                                     member_name),
+                             filename, plane_info)
+        return _load_archive_member(archive, member_name)
+    except PlaneLoadError as load_error:
+        return load_error.diagnostic
+    except Exception as error:  # pylint: disable=broad-except
+        return LoadDiagnostic(filename, [ValidationError(
+            '$', type(error).__name__ + ': ' + str(error))])
+
+
+def _load_archive_chunk(archive_filename: str, member_names: List[str]):
+    """Load some members of an archive in a worker process."""
+    with PlaneArchive(archive_filename) as archive:
+        return [_load_archive_member_or_diagnostic(archive, member_name)
+                for member_name in member_names]
+
+
+def _load_archive_members(archive: PlaneArchive, member_names: List[str],
+                          workers: int = 1, lazy: bool = False):
+    """Load members of an open archive, in parallel where that helps.
+
+    Only full loads from zip archives are spread across worker processes,
+    each opening the archive once for a run of members. Tar members are
+    read in this process in the order they are stored.
+
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if (workers <= 1 or lazy or not archive.random_access
+            or len(member_names) < PARALLEL_MIN_FILES):
+        return [_load_archive_member_or_diagnostic(archive, member_name, lazy)
+                for member_name in member_names]
+    from concurrent.futures import ProcessPoolExecutor
+    chunk_size = max(1, -(-len(member_names) // (workers * 4)))
+    chunks = [member_names[start:start + chunk_size]
+              for start in range(0, len(member_names), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = [plane for chunk in executor.map(
+            partial(_load_archive_chunk, archive.filename), chunks)
+                   for plane in chunk]
+    for plane in results:
+        if not isinstance(plane, LoadDiagnostic):
+            STRING_POOL.intern_plane(plane)
+    return results
+
+
+def load_archive_planes(archive_filename: str,
+                        manifest: Optional[LibraryManifest] = None,
+                        lazy: bool = False, workers: int = 1):
+    """Load the plane files inside a zip or tar archive without extracting it.
+
+    Each member is decoded as it is decompressed. With a manifest, an
+    archive that hasn't changed is not opened at all, and when it has, only
+    the members whose size or stamp changed are loaded again.
+
+    Args:
+        archive_filename: The path of the archive.
+        manifest (Optional): A LibraryManifest to serve unchanged members
+        from. Its stats are added to, not reset.
+        lazy (Optional): When True LazyPlanes are created instead.
+        workers (Optional): The number of worker processes used to load the
+        members of a zip archive that aren't in the manifest. See
+        load_plane_files.
+
+    Returns:
+        list of tuple of (str, Plane): The path of each member, from
+        archive.member_path, with its Plane or a LoadDiagnostic, in the
+        order they are stored. An archive that can't be read gives a single
+        LoadDiagnostic under the archive's own path.
+
+    """
+    members = None
+    if manifest is not None:
+        members = manifest.lookup_archive(archive_filename)
+    archive = None
+    try:
+        if members is None:
+            archive = PlaneArchive(archive_filename)
+            # The stamps are only compared when there is a manifest, and
+            # only the tar members whose size or mtime changed are read
+            # for their CRC-32.
+            previous = None
+            if manifest is not None:
+                previous = manifest.recorded_members(archive_filename)
+            members = archive.members(checksums=manifest is not None,
+                                      previous=previous)
+            if manifest is not None:
+                manifest.store_archive(archive_filename, members)
+        paths = [member_path(archive_filename, member.name)
+                 for member in members]
+        planes = [None] * len(members)  # type: List[Optional[Plane]]
+        if manifest is not None:
+            for index, member in enumerate(members):
+                plane = manifest.lookup_member(paths[index], member)
+                if plane is not None and not isinstance(plane,
+                                                        LoadDiagnostic):
+                    STRING_POOL.intern_plane(plane)
+                planes[index] = plane
+        missing = [index for index, plane in enumerate(planes)
+                   if plane is None]
+        if missing:
+            if archive is None:
+                archive = PlaneArchive(archive_filename)
+                # Indexes a tar archive's members so each is found at once.
+                archive.members()
+            loaded_planes = _load_archive_members(
+                archive, [members[index].name for index in missing], workers,
+                lazy)
+            for index, plane in zip(missing, loaded_planes):
+                planes[index] = plane
+                if manifest is not None:
+                    manifest.store_member(paths[index], members[index], plane)
+    except ARCHIVE_ERRORS as read_error:
+        return [(os.path.abspath(archive_filename), LoadDiagnostic(
+            archive_filename, [ValidationError(
+                '$', 'could not read archive: ' + str(read_error))]))]
+    finally:
+        if archive is not None:
+            archive.close()
+    return list(zip(paths, planes))
+
+
+def _list_plane_sources(directory: str, recursive: bool = False):
+    """List the plane files and archives in a directory.
+
+    Args:
+        directory: The directory to list.
+        recursive (Optional): Also list every subdirectory, except those
+        whose names start with a dot. A directory's own files come before
+        those of its subdirectories.
+
+    Returns:
+        list of str: The paths, sorted by name within each directory.
+
+    """
+    if not recursive:
+        return [str(directory) + '/' + str(plane_file)
+                for plane_file in sorted(listdir(str(directory)))
+                if validate_plane_file(plane_file)
+                or is_plane_archive(plane_file)]
+    sources = []
+    for root, dirs, files in os.walk(str(directory)):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for plane_file in sorted(files):
+            if validate_plane_file(plane_file) or is_plane_archive(plane_file):
+                sources.append(os.path.join(root, plane_file))
+    return sources
+
+
+def search_directory_for_planes(directory: str,
+                                manifest: Optional[LibraryManifest] = None,
+                                lazy: bool = False,
+                                workers: int = 1,
+                                recursive: bool = False):
     """Search a directory for plane JSON files.
 
+    The files are loaded in filename order so the result is the same no
+    matter how many workers are used. Zip and tar archives in the directory
+    are read in place by load_archive_planes, and their planes are added
+    where the archive falls in that order.
+
+    Args:
+        directory: The directory to search in. An archive can be given
+        instead.
+        manifest (Optional): A LibraryManifest to serve unchanged files from.
+        Only new or modified files are loaded again, and the manifest's stats
+        are reset and filled in for this scan.
+        lazy (Optional): When True only the plane names are read and each
+        plane's checklists are loaded the first time they are used.
+        workers (Optional): The number of workers used to load the files
+        that aren't in the manifest. See load_plane_files.
+        recursive (Optional): Search the subdirectories too.
+
+    Returns:
+        PlaneLibrary: The planes, indexed by name and by file path. Files
+        that failed to load are left out and described in its diagnostics.
+        With a manifest, a file that failed is not loaded again until it
+        changes.
+
+    """
+    with span('fileio.list_directory', str(directory)):
+        if is_plane_archive(str(directory)) and os.path.isfile(directory):
+            sources = [str(directory)]
+        else:
+            sources = _list_plane_sources(directory, recursive)
+    if manifest is not None:
+        manifest.stats.reset()
+    plane_paths = [source for source in sources
+                   if not is_plane_archive(source)]
+    planes = [None] * len(plane_paths)  # type: List[Optional[Plane]]
+    if manifest is not None:
+        for index, plane_path in enumerate(plane_paths):
+            plane = manifest.lookup(plane_path)
+            if plane is not None and not isinstance(plane, LoadDiagnostic):
+                # Unpickled planes don't share strings with each other.
+                STRING_POOL.intern_plane(plane)
+            planes[index] = plane
+    missing = [index for index, plane in enumerate(planes) if plane is None]
+    # Taken before loading so a file that changes meanwhile is not cached
+    # under its new size and mtime.
+    file_stats = {}  # type: Dict[int, os.stat_result]
+    if manifest is not None:
+        for index in missing:
+            file_stats[index] = _stat_or_none(plane_paths[index])
+    with span('fileio.load_plane_files'):
+        loaded_planes = load_plane_files(
+            [plane_paths[index] for index in missing], workers, lazy)
+    for index, plane in zip(missing, loaded_planes):
+        planes[index] = plane
+        if manifest is not None:
+            manifest.store(plane_paths[index], plane, file_stats[index])
+    loaded = dict(zip(plane_paths, planes))
+    seen_paths = list(plane_paths)
+    library = PlaneLibrary()
+    for source in sources:
+        if source in loaded:
+            results = [(source, loaded[source])]
+        else:
+            with span('fileio.load_archive_planes', source):
+                results = load_archive_planes(source, manifest, lazy,
+                                              workers)
+            seen_paths.append(source)
+            seen_paths.extend(plane_path for plane_path, _ in results)
+        for plane_path, plane in results:
+            if isinstance(plane, LoadDiagnostic):
+                library.diagnostics.append(plane)
+            else:
+                library.add(plane, plane_path)
+    if manifest is not None:
+        manifest.prune(directory, seen_paths)
+        manifest.save()
+    return library
+
+
+def iter_plane_files(directory: str, recursive: bool = False):
+    """Load the plane files in a directory one at a time.
+
+    Nothing is kept once a plane has been handed out, so going through a
+    large library this way only ever holds one plane in memory. The planes
+    in archives are read one at a time too.
+
     Args:
         directory: The directory to search in.
+        recursive (Optional): Search the subdirectories too.
+
+    Yields:
+        Plane: Each plane, in filename order, or a LoadDiagnostic for a
+        file that failed to load.
 
     """
-    planes = []
-    directory_list = listdir(str(directory))
-    for plane_file in directory_list:
-        if validate_plane_file(plane_file):
-            planes.append(
-                load_plane_file(
-                    str(directory) + '/' + str(plane_file)
-                )
-                )
-    return planes
+    for source in _list_plane_sources(directory, recursive):
+        if not is_plane_archive(source):
+            yield load_plane_or_diagnostic(source)
+            continue
+        try:
+            archive = PlaneArchive(source)
+            members = archive.members()
+        except ARCHIVE_ERRORS as read_error:
+            yield LoadDiagnostic(source, [ValidationError(
+                '$', 'could not read archive: ' + str(read_error))])
+            continue
+        with archive:
+            for member in members:
+                yield _load_archive_member_or_diagnostic(archive, member.name)
+
+
+def _lint_file(filename: str):
+    """Validate one file for lint_directory, in a worker process."""
+    return filename, [error.to_dict()
+                      for error in validate_plane_path(filename)]
+
+
+def lint_directory(directory: str, workers: int = 0):
+    """Validate every plane file in a directory tree.
+
+    Args:
+        directory: The directory to walk. Directories whose names start
+        with a dot are skipped, as they are when loading.
+        workers (Optional): The number of worker processes. 0 uses one per
+        CPU and 1 validates in this process.
+
+    Returns:
+        dict: A report with the number of files checked, the number that
+        are invalid, and a list of errors each with its file, path and
+        message.
+
+    """
+    filenames = [filename for filename
+                 in _list_plane_sources(directory, recursive=True)
+                 if validate_plane_file(filename)]
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(filenames) < PARALLEL_MIN_FILES:
+        results = [_lint_file(filename) for filename in filenames]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        chunk_size = max(1, len(filenames) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_lint_file, filenames,
+                                        chunksize=chunk_size))
+    report = {'files': len(filenames), 'invalid': 0, 'errors': []}
+    for filename, errors in results:
+        if errors:
+            report['invalid'] += 1
+            for error in errors:
+                report['errors'].append({'file': filename,
+                                         'path': error['path'],
+                                         'message': error['message']})
+    return report
+
+
+def load_file_changes(changes: Dict[str, str],
+                      manifest: Optional[LibraryManifest] = None,
+                      lazy: bool = False):
+    """Load the plane files that were added or changed, without a library.
+
+    This is the slow half of apply_file_changes. It can run on another
+    thread while the library is still in use, and apply_loaded_changes
+    then updates the library in one go.
+
+    Args:
+        changes: The kind of change keyed by file path, as returned by
+        DirectoryWatcher.drain.
+        manifest (Optional): A LibraryManifest to keep up to date. Its stats
+        are reset and filled in for these files.
+        lazy (Optional): When True the files are loaded as LazyPlanes.
+
+    Returns:
+        dict of str: list of tuple of (str, Plane or LoadDiagnostic): The
+        planes and diagnostics loaded for each changed path, with the path
+        each one is known by. A deleted file has none.
+
+    """
+    if manifest is not None:
+        manifest.stats.reset()
+    loaded = {}
+    for path in sorted(changes):
+        if is_plane_archive(path):
+            if changes[path] == 'deleted':
+                loaded[path] = []
+                if manifest is not None:
+                    manifest.discard(path)
+            else:
+                loaded[path] = load_archive_planes(path, manifest, lazy)
+            continue
+        if changes[path] == 'deleted' or not validate_plane_file(path):
+            loaded[path] = []
+            if manifest is not None:
+                manifest.discard(path)
+            continue
+        plane = None
+        if manifest is not None:
+            plane = manifest.lookup(path)
+            if plane is not None and not isinstance(plane, LoadDiagnostic):
+                STRING_POOL.intern_plane(plane)
+        if plane is None:
+            file_stat = _stat_or_none(path)
+            plane = load_plane_or_diagnostic(path, lazy)
+            if manifest is not None:
+                manifest.store(path, plane, file_stat)
+        loaded[path] = [(path, plane)]
+    if manifest is not None:
+        manifest.save()
+    return loaded
+
+
+def apply_loaded_changes(library: PlaneLibrary, loaded: Dict[str, list]):
+    """Update a library with the files loaded by load_file_changes.
+
+    Every plane that came from a changed path and was not loaded again is
+    removed, along with the old diagnostics for the changed paths.
+
+    Args:
+        library: The library to update.
+        loaded: The result of load_file_changes.
+
+    """
+    changed_paths = set(os.path.abspath(path) for path in loaded)
+    changed_archives = tuple(os.path.join(path, '') for path in changed_paths
+                             if is_plane_archive(path))
+    kept_diagnostics = []
+    for diagnostic in library.diagnostics:
+        diagnostic_path = os.path.abspath(diagnostic.filename)
+        if (diagnostic_path not in changed_paths
+                and not diagnostic_path.startswith(changed_archives)):
+            kept_diagnostics.append(diagnostic)
+    library.diagnostics = kept_diagnostics
+    for path in sorted(loaded):
+        if is_plane_archive(path):
+            member_prefix = os.path.join(os.path.abspath(path), '')
+            old_paths = set(plane_path for plane_path in library.paths()
+                            if plane_path.startswith(member_prefix))
+        else:
+            old_paths = set([os.path.abspath(path)])
+        for plane_path, plane in loaded[path]:
+            old_paths.discard(os.path.abspath(plane_path))
+            if isinstance(plane, LoadDiagnostic):
+                library.remove_path(plane_path)
+                library.diagnostics.append(plane)
+            else:
+                library.add(plane, plane_path)
+        for plane_path in old_paths:
+            library.remove_path(plane_path)
+
+
+def apply_file_changes(library: PlaneLibrary, changes: Dict[str, str],
+                       manifest: Optional[LibraryManifest] = None,
+                       lazy: bool = False):
+    """Update a library for plane files that were added, changed or deleted.
+
+    Only the files named in changes are loaded, so the rest of the library
+    is left untouched. A changed archive only loads its changed members.
+
+    Args:
+        library: The library to update.
+        changes: The kind of change keyed by file path, as returned by
+        DirectoryWatcher.drain. 'deleted' removes the file's plane, anything
+        else loads the file again.
+        manifest (Optional): A LibraryManifest to keep up to date. Its stats
+        are reset and filled in for these files.
+        lazy (Optional): When True the files are loaded as LazyPlanes.
+
+    """
+    apply_loaded_changes(library, load_file_changes(changes, manifest, lazy))
+
+
+def plane_to_dict(plane: Plane):
+    """Convert a Plane to the structure used in plane data files.
+
+    Args:
+        plane: The plane to convert.
+
+    Returns:
+        dict: The plane in the same layout as plane_data_file_template.json.
+
+    """
+    return {
+        'plane_name': plane.plane_name,
+        'plane_info': list(plane.plane_info),
+        'checklists': [
+            {'checklist_name': checklist.name,
+             'checklist_message': checklist.message,
+             'checklist_steps': [
+                 {'step_number': str(step.step_number),
+                  'step_title': step.step_title,
+                  'step_text': step.step_text}
+                 for step in checklist.steps]}
+            for checklist in plane.checklists]
+    }
 
 
 def validate_plane_file(plane_file: str):
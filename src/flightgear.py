@@ -0,0 +1,591 @@
+"""Imports the checklists that ship with FlightGear aircraft.
+
+FlightGear aircraft describe their checklists in PropertyList XML, either
+under /sim/checklists in the aircraft's -set.xml or in files in its
+Checklists directory:
+
+    <checklist>
+        <title>Before Start</title>
+        <item>
+            <name>Parking Brake</name>
+            <value>SET</value>
+        </item>
+    </checklist>
+
+Items may be grouped into pages, and any element may pull in another file
+with an include attribute. Each aircraft directory becomes one plane file
+in our schema. The XML is read with iterparse and every element is
+dropped as soon as it ends, so a -set.xml with thousands of properties is
+never held in memory as a whole.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import json
+import os
+import pickle
+import re
+import xml.etree.ElementTree as ElementTree
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from fileio import PARALLEL_MIN_FILES
+from fileio import plane_to_dict
+from model import Checklist
+from model import ChecklistStep
+from model import Plane
+
+IMPORT_STATE_VERSION = 1
+SET_FILE_SUFFIX = '-set.xml'
+CHECKLIST_DIRECTORY = 'Checklists'
+OUTPUT_SUFFIX = '_FlightGear.json'
+UNSAFE_FILENAME_CHARACTERS = re.compile(r'[^\w.-]')
+# Raised when an aircraft's XML can't be read.
+XML_ERRORS = (OSError, UnicodeDecodeError, ElementTree.ParseError)
+
+# What an element is read as, from what its parent is read as and its tag.
+# Elements that are not listed are skipped along with everything in them.
+CHILD_CONTEXTS = {
+    'set': {'sim': 'sim'},
+    'sim': {'description': 'description', 'author': 'author',
+            'aircraft-version': 'aircraft-version',
+            'checklists': 'checklist'},
+    'checklist': {'checklist': 'checklist', 'title': 'title',
+                  'page': 'page', 'item': 'item'},
+    'page': {'item': 'item'},
+    'item': {'name': 'name', 'value': 'value'},
+}
+# The plane_info keys the /sim properties are saved under.
+INFO_KEYS = {'author': 'author', 'aircraft-version': 'aircraft_version'}
+
+
+def find_aircraft(root: str):
+    """Find the aircraft directories in an FGData or FGAddon tree.
+
+    An aircraft directory is one holding a -set.xml file. The directories
+    inside it are not searched.
+
+    Args:
+        root: The directory to walk. It may be an aircraft directory itself.
+
+    Returns:
+        list of str: The absolute paths of the aircraft directories, sorted.
+
+    """
+    found = []
+    for directory, dirs, files in os.walk(os.path.abspath(root)):
+        if any(filename.endswith(SET_FILE_SUFFIX) for filename in files):
+            found.append(directory)
+            dirs[:] = []
+        else:
+            dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+    return found
+
+
+def aircraft_sources(aircraft_directory: str):
+    """List the files an aircraft's checklists are looked for in.
+
+    Args:
+        aircraft_directory: The aircraft directory.
+
+    Returns:
+        list of str: The -set.xml files, the one named after the directory
+        first, then the XML files in the Checklists directory.
+
+    """
+    name = os.path.basename(aircraft_directory)
+    set_files = sorted(filename for filename in os.listdir(aircraft_directory)
+                       if filename.endswith(SET_FILE_SUFFIX))
+    primary = name + SET_FILE_SUFFIX
+    if primary in set_files:
+        set_files.remove(primary)
+        set_files.insert(0, primary)
+    sources = [os.path.join(aircraft_directory, filename)
+               for filename in set_files]
+    checklist_directory = os.path.join(aircraft_directory,
+                                       CHECKLIST_DIRECTORY)
+    if os.path.isdir(checklist_directory):
+        sources.extend(os.path.join(checklist_directory, filename)
+                       for filename in sorted(os.listdir(checklist_directory))
+                       if filename.endswith('.xml'))
+    return sources
+
+
+def _element_text(element):
+    """Return the text of an element with its whitespace collapsed."""
+    return ' '.join((element.text or '').split())
+
+
+class _ChecklistBuilder():
+    """Collects the steps of a checklist while its element is open."""
+
+    __slots__ = ('title', 'default_title', 'steps')
+
+    def __init__(self, default_title: Optional[str] = None):
+        """Class Constructor."""
+        self.title = None  # type: Optional[str]
+        self.default_title = default_title
+        self.steps = []  # type: List[ChecklistStep]
+
+
+class AircraftReader():
+    """Reads the checklists and description of one FlightGear aircraft.
+
+    Attributes:
+        aircraft_directory (str): The aircraft directory.
+        properties (dict of str: str): The /sim description, author and
+        aircraft-version, from the first file that sets each.
+        checklists (list of Checklist): The checklists read so far. An
+        exact copy of one already read, such as the same file included by
+        two -set.xml variants, is left out.
+        files (dict of str: tuple of (int, int)): The size and mtime_ns of
+        every file read, including those pulled in by include attributes.
+
+    Args:
+        aircraft_directory: The aircraft directory.
+
+    """
+
+    def __init__(self, aircraft_directory: str):
+        """Class Constructor."""
+        self.aircraft_directory = aircraft_directory
+        self.properties = {}  # type: Dict[str, str]
+        self.checklists = []  # type: List[Checklist]
+        self.files = {}  # type: Dict[str, Tuple[int, int]]
+        self._builders = []  # type: List[_ChecklistBuilder]
+        self._item_names = []  # type: List[str]
+        self._item_values = []  # type: List[str]
+        self._seen = set()
+        self._reading = set()
+        # Includes are looked for next to the including file, then in the
+        # aircraft directory and each directory above it, which covers
+        # paths relative to FGData like Aircraft/Generic/checklists.xml.
+        self._include_directories = []
+        directory = aircraft_directory
+        while True:
+            self._include_directories.append(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+
+    def read_aircraft(self):
+        """Read every source of the aircraft's checklists.
+
+        Returns:
+            AircraftReader: The reader, so it can be created and read at
+            once.
+
+        Raises:
+            OSError: A file could not be read.
+            xml.etree.ElementTree.ParseError: A file is not well formed XML.
+
+        """
+        for source in aircraft_sources(self.aircraft_directory):
+            if source in self.files:
+                # Already pulled in by an include.
+                continue
+            if source.endswith(SET_FILE_SUFFIX):
+                self.read_file(source, 'set')
+            else:
+                title = os.path.splitext(os.path.basename(source))[0]
+                self.read_file(source, 'checklist',
+                               title.replace('-', ' ').replace('_', ' ')
+                               .title())
+        return self
+
+    def read_file(self, filename: str, context: str,
+                  default_title: Optional[str] = None):
+        """Read one PropertyList file, dropping each element as it ends.
+
+        Args:
+            filename: The file to read.
+            context: What the file's root element is read as: 'set' for a
+            -set.xml, or the context of the element that included it.
+            default_title (Optional): Start a new checklist with this title,
+            used when the file does not give one. Without it the file's
+            items go into the checklist that included it.
+
+        """
+        filename = os.path.abspath(filename)
+        if filename in self._reading:
+            # The file includes itself, directly or through another file.
+            return
+        status = os.stat(filename)
+        self.files[filename] = (status.st_size, status.st_mtime_ns)
+        self._reading.add(filename)
+        try:
+            self._read_elements(filename, context, default_title)
+        finally:
+            self._reading.discard(filename)
+
+    def _read_elements(self, filename: str, root_context: str,
+                       default_title: Optional[str]):
+        """Walk the start and end events of a file for read_file."""
+        # The context of each open element, None when it is skipped, and
+        # whether it started a checklist.
+        open_contexts = []  # type: List[Tuple[Optional[str], bool]]
+        open_elements = []  # type: List[ElementTree.Element]
+        for event, element in ElementTree.iterparse(filename,
+                                                    ('start', 'end')):
+            if event == 'start':
+                if not open_contexts:
+                    context = root_context
+                    starts_checklist = default_title is not None
+                else:
+                    parent_context = open_contexts[-1][0]
+                    context = CHILD_CONTEXTS.get(parent_context, {}).get(
+                        element.tag)
+                    starts_checklist = context == 'checklist'
+                open_contexts.append((context, starts_checklist))
+                open_elements.append(element)
+                if starts_checklist:
+                    self._builders.append(_ChecklistBuilder(
+                        default_title if len(open_elements) == 1 else None))
+                elif context == 'item':
+                    self._item_names = []
+                    self._item_values = []
+                include = element.get('include')
+                if include and context in CHILD_CONTEXTS:
+                    included = self._find_include(include,
+                                                  os.path.dirname(filename))
+                    if included is not None:
+                        self.read_file(included, context)
+            else:
+                context, starts_checklist = open_contexts.pop()
+                open_elements.pop()
+                if context is not None:
+                    self._end_element(context, element, starts_checklist)
+                element.clear()
+                if open_elements:
+                    open_elements[-1].remove(element)
+
+    def _end_element(self, context: str, element: ElementTree.Element,
+                     starts_checklist: bool):
+        """Take what is needed from an element that has just ended."""
+        if context in ('description', 'author', 'aircraft-version'):
+            self.properties.setdefault(context, _element_text(element))
+        elif context == 'name':
+            self._item_names.append(_element_text(element))
+        elif context == 'value':
+            self._item_values.append(_element_text(element))
+        elif context == 'title':
+            if self._builders and self._builders[-1].title is None:
+                self._builders[-1].title = _element_text(element)
+        elif context == 'item':
+            title = ' '.join(name for name in self._item_names if name)
+            if title and self._builders:
+                steps = self._builders[-1].steps
+                steps.append(ChecklistStep(len(steps) + 1, title, ' / '.join(
+                    value for value in self._item_values if value)))
+        elif starts_checklist:
+            self._add_checklist(self._builders.pop())
+
+    def _add_checklist(self, builder: _ChecklistBuilder):
+        """Turn a finished builder into a Checklist, skipping copies."""
+        if not builder.steps:
+            return
+        name = (builder.title or builder.default_title
+                or 'Checklist ' + str(len(self.checklists) + 1))
+        key = (name, tuple((step.step_title, step.step_text)
+                           for step in builder.steps))
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self.checklists.append(Checklist(name, name, builder.steps))
+
+    def _find_include(self, include: str, directory: str):
+        """Find the file an include attribute names, or None."""
+        for base in [directory] + self._include_directories:
+            candidate = os.path.join(base, include)
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def to_plane(self):
+        """Build the Plane for the aircraft.
+
+        Returns:
+            Plane: The plane, named after the aircraft's description.
+
+        """
+        aircraft = os.path.basename(self.aircraft_directory)
+        plane_info = [{'game_platform': 'FlightGear'}, {'aircraft': aircraft}]
+        for property_name, info_key in INFO_KEYS.items():
+            if self.properties.get(property_name):
+                plane_info.append({info_key: self.properties[property_name]})
+        return Plane(self.properties.get('description') or aircraft,
+                     plane_info, self.checklists)
+
+
+class AircraftImport():
+    """What happened when one aircraft was imported.
+
+    Attributes:
+        aircraft_directory (str): The aircraft directory.
+        output_filename (str): The plane file written, or None if the
+        aircraft has no checklists or could not be read.
+        checklist_count (int): The number of checklists written.
+        files (dict of str: tuple of (int, int)): The size and mtime_ns of
+        every file read, to tell whether the aircraft has changed.
+        error (str): Why the aircraft could not be read, or None.
+
+    """
+
+    def __init__(self, aircraft_directory: str,
+                 output_filename: Optional[str] = None,
+                 checklist_count: int = 0,
+                 files: Dict[str, Tuple[int, int]] = None,
+                 error: Optional[str] = None):
+        """Class Constructor."""
+        self.aircraft_directory = aircraft_directory
+        self.output_filename = output_filename
+        self.checklist_count = checklist_count
+        self.files = files or {}
+        self.error = error
+
+
+def output_filename_for(aircraft_directory: str, output_directory: str):
+    """Return the plane file an aircraft is written to."""
+    name = UNSAFE_FILENAME_CHARACTERS.sub(
+        '_', os.path.basename(aircraft_directory))
+    return os.path.join(os.path.abspath(output_directory),
+                        name + OUTPUT_SUFFIX)
+
+
+def import_aircraft(aircraft_directory: str, output_directory: str):
+    """Read one aircraft's checklists and write them as a plane file.
+
+    Runs in a worker process when aircraft are imported in parallel. Only
+    the small AircraftImport is sent back; the plane is written here.
+
+    Args:
+        aircraft_directory: The aircraft directory.
+        output_directory: The directory the plane file is written to.
+
+    Returns:
+        AircraftImport: What happened.
+
+    """
+    reader = AircraftReader(aircraft_directory)
+    try:
+        reader.read_aircraft()
+    except XML_ERRORS as read_error:
+        return AircraftImport(aircraft_directory, files=reader.files,
+                              error=str(read_error))
+    if not reader.checklists:
+        return AircraftImport(aircraft_directory, files=reader.files)
+    output_filename = output_filename_for(aircraft_directory,
+                                          output_directory)
+    temp_path = output_filename + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as output_file:
+        json.dump(plane_to_dict(reader.to_plane()), output_file, indent=4)
+    os.replace(temp_path, output_filename)
+    return AircraftImport(aircraft_directory, output_filename,
+                          len(reader.checklists), reader.files)
+
+
+class ImportState():
+    """Remembers what each aircraft looked like when it was last imported.
+
+    Attributes:
+        state_path (str): Where the state is saved, or None to keep it in
+        memory only.
+        imports (dict of str: AircraftImport): The last import of each
+        aircraft, keyed by its directory.
+
+    Args:
+        state_path (Optional): Where the state is saved.
+
+    """
+
+    def __init__(self, state_path: Optional[str] = None):
+        """Class Constructor."""
+        self.state_path = state_path
+        self.imports = {}  # type: Dict[str, AircraftImport]
+        if self.state_path is not None:
+            self.load()
+
+    def load(self):
+        """Load the state. A missing or outdated one leaves it empty."""
+        self.imports = {}
+        try:
+            with open(self.state_path, 'rb') as state_file:
+                version, imports = pickle.load(state_file)
+            if version == IMPORT_STATE_VERSION:
+                self.imports = imports
+        except (OSError, EOFError, ValueError, TypeError, AttributeError,
+                ImportError, pickle.UnpicklingError):
+            self.imports = {}
+
+    def save(self):
+        """Write the state to state_path."""
+        if self.state_path is None:
+            return
+        state_dir = os.path.dirname(self.state_path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'wb') as state_file:
+            pickle.dump((IMPORT_STATE_VERSION, self.imports), state_file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.state_path)
+
+    def is_unchanged(self, aircraft_directory: str, output_directory: str):
+        """Check whether an aircraft is as it was when last imported.
+
+        Only the files are stat'ed; none of them is read. An aircraft that
+        failed to import is not tried again until one of its files changes.
+
+        Args:
+            aircraft_directory: The aircraft directory.
+            output_directory: The directory plane files are written to.
+
+        Returns:
+            bool: True if no file the last import read has changed, no new
+            source has appeared and the plane file written is still there.
+
+        """
+        last_import = self.imports.get(aircraft_directory)
+        if last_import is None:
+            return False
+        if (last_import.output_filename is not None
+                and last_import.output_filename != output_filename_for(
+                    aircraft_directory, output_directory)):
+            return False
+        if (last_import.output_filename is not None
+                and not os.path.isfile(last_import.output_filename)):
+            return False
+        try:
+            sources = aircraft_sources(aircraft_directory)
+        except OSError:
+            return False
+        if any(source not in last_import.files for source in sources):
+            return False
+        for filename, (size, mtime_ns) in last_import.files.items():
+            try:
+                status = os.stat(filename)
+            except OSError:
+                return False
+            if status.st_size != size or status.st_mtime_ns != mtime_ns:
+                return False
+        return True
+
+
+def _remove_output(state: ImportState,
+                   last_import: Optional[AircraftImport]):
+    """Delete the plane file an earlier import wrote, if nothing else uses it.
+
+    Args:
+        state: The import state, without last_import in it any more.
+        last_import: The earlier import of the aircraft.
+
+    Returns:
+        bool: True if a plane file was deleted.
+
+    """
+    if last_import is None or last_import.output_filename is None:
+        return False
+    # Aircraft from different trees can share a directory name.
+    if any(other.output_filename == last_import.output_filename
+           for other in state.imports.values()):
+        return False
+    try:
+        os.remove(last_import.output_filename)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _import_chunk(aircraft_directories: List[str], output_directory: str):
+    """Import a chunk of aircraft, in a worker process."""
+    return [import_aircraft(aircraft_directory, output_directory)
+            for aircraft_directory in aircraft_directories]
+
+
+def import_flightgear(root: str, output_directory: str,
+                      state: Optional[ImportState] = None, workers: int = 1):
+    """Import the checklists of every aircraft in a FlightGear tree.
+
+    Aircraft are read and written by worker processes, one chunk at a
+    time, and only a small AircraftImport comes back for each, so the
+    memory used does not grow with the size of the hangar.
+
+    Args:
+        root: An FGData or FGAddon directory, or one aircraft directory.
+        output_directory: The directory the plane files are written to.
+        state (Optional): The state of the last import. Aircraft that have
+        not changed since are skipped, and the state is updated.
+        workers (Optional): The number of worker processes. 1 imports in
+        this process and 0 uses one per CPU.
+
+    Returns:
+        dict: A report with the number of aircraft found, imported,
+        unchanged and without checklists, the number of plane files
+        removed, and a list of the aircraft that failed, each with its
+        directory and error.
+
+    """
+    if state is None:
+        state = ImportState()
+    os.makedirs(output_directory, exist_ok=True)
+    aircraft_directories = find_aircraft(root)
+    report = {'aircraft': len(aircraft_directories), 'imported': 0,
+              'unchanged': 0, 'without_checklists': 0, 'removed': 0,
+              'failed': []}
+    # The plane files of aircraft that are gone from the tree go too.
+    root_path = os.path.abspath(root)
+    root_prefix = os.path.join(root_path, '')
+    found = set(aircraft_directories)
+    for aircraft_directory in list(state.imports):
+        if aircraft_directory in found or not (
+                aircraft_directory == root_path
+                or aircraft_directory.startswith(root_prefix)):
+            continue
+        last_import = state.imports.pop(aircraft_directory)
+        if _remove_output(state, last_import):
+            report['removed'] += 1
+    pending = []
+    for aircraft_directory in aircraft_directories:
+        if state.is_unchanged(aircraft_directory, output_directory):
+            report['unchanged'] += 1
+        else:
+            pending.append(aircraft_directory)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    def record(result: AircraftImport):
+        last_import = state.imports.pop(result.aircraft_directory, None)
+        state.imports[result.aircraft_directory] = result
+        if result.error is not None:
+            report['failed'].append({'aircraft': result.aircraft_directory,
+                                     'error': result.error})
+        elif result.output_filename is None:
+            report['without_checklists'] += 1
+            if _remove_output(state, last_import):
+                report['removed'] += 1
+        else:
+            report['imported'] += 1
+
+    try:
+        if workers <= 1 or len(pending) < PARALLEL_MIN_FILES:
+            for aircraft_directory in pending:
+                record(import_aircraft(aircraft_directory, output_directory))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            from functools import partial
+            chunk_size = max(1, min(64, len(pending) // (workers * 8)))
+            chunks = [pending[start:start + chunk_size]
+                      for start in range(0, len(pending), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for results in executor.map(
+                        partial(_import_chunk,
+                                output_directory=output_directory), chunks):
+                    for result in results:
+                        record(result)
+    finally:
+        # Whatever was imported before an interruption is not redone.
+        state.save()
+    return report
@@ -1,38 +1,651 @@
 """Main Control Script for the flisick demo project.
 
+The non-interactive commands only import fileio and model, so scripts
+that call them many times a second do not pay for PyInquirer and
+prompt_toolkit. Those are imported when the interactive menus start.
+
 Copyright 2019 Jacqueline Button.
 
 """
-from cli_controls import CliStyle
-from cli_controls import show_checklist
-from cli_controls import show_checklist_selection_page
-from cli_controls import show_plane_select_menu
+import argparse
+import json
+import sys
+
+from fileio import iter_plane_files
+from fileio import plane_to_dict
 from fileio import search_directory_for_planes
+from profiling import CPROFILE_VARIABLE
+from profiling import PROFILE_VARIABLE
+from profiling import TRACE_VARIABLE
+from profiling import enable as enable_profiling
+from profiling import enable_from_environment as \
+    enable_profiling_from_environment
+
+DATA_DIRECTORY = './data'
+MANIFEST_PATH = './.flysimchk_cache/manifest.pickle'
+PACK_PATH = './.flysimchk_cache/planes.pack'
+RECENT_PLANES = 3
+PROGRESS_DIRECTORY = './.flysimchk_cache'
+FLIGHTGEAR_STATE_PATH = './.flysimchk_cache/flightgear_import.pickle'
+
+def main_loop(workers: int = 1, use_pack: bool = False):
+    """Main Loop of flisick demo program.
+
+    The data directory is watched while the menus are open, and only the
+    plane files that changed are loaded again before the next menu is shown.
+    While a menu waits for input a PrefetchWorker loads the planes and
+    builds the checklist prompts most likely to be picked next.
+
+    Args:
+        workers (Optional): The number of workers used to load plane files.
+        use_pack (Optional): Read the planes from the compiled pack, which is
+        rebuilt whenever a plane file changes.
+
+    """
+    # The prompt stack is slow to import so it is only loaded here.
+    from cli_controls import CHECKLIST_PAYLOAD_CACHE
+    from cli_controls import CliStyle
+    from cli_controls import show_checklist
+    from cli_controls import show_checklist_selection_page
+    from cli_controls import show_plane_select_menu
+    from cli_controls import show_search_prompt
+    from manifest import LibraryManifest
+    from pack import load_pack
+    from prefetch import PrefetchWorker
+    from progress import ProgressJournal
+    from fileio import apply_file_changes
+    from fileio import record_load_failure
+    from interning import STRING_POOL
+    from search import SearchIndex
+    from validator import PlaneLoadError
+    from watcher import DirectoryWatcher
 
-def main_loop():
-    """Main Loop of flisick demo program."""
     app_style = CliStyle()
     flag = False
     checklist_select_loop_flag = False
     checklist_loop_flag = False
-    while not flag:
-        list_of_planes = search_directory_for_planes('./data')
-        selected_plane = show_plane_select_menu(list_of_planes, app_style)
-        if selected_plane is None:
-            break
-        while not checklist_select_loop_flag:
-            selected_checklist = show_checklist_selection_page(selected_plane, app_style)
-            if selected_checklist == 'RETURN TO PLANE SELECT':
+    manifest = LibraryManifest(MANIFEST_PATH)
+    search_index = SearchIndex()
+    journal = ProgressJournal(PROGRESS_DIRECTORY).open()
+    reported_failures = set()
+    # Kept between visits to the plane menu.
+    plane_filter = {}
+    # Started before the first scan so no change can slip in between.
+    watcher = DirectoryWatcher(DATA_DIRECTORY).start()
+    # The pack is rebuilt on changes instead, so there is nothing to load
+    # ahead of time.
+    prefetcher = PrefetchWorker(CHECKLIST_PAYLOAD_CACHE.warm,
+                                None if use_pack else watcher).start()
+    # Keys of the planes picked most recently, most recent first.
+    recent_planes = []
+    list_of_planes = None
+    pack = None
+    try:
+        while not flag:
+            changes = watcher.drain()
+            if use_pack:
+                if pack is None or changes:
+                    # Closing a stale pack releases the old planes, so the
+                    # worker is told to drop them first.
+                    prefetcher.cancel()
+                    current_pack = pack
+                    pack = load_pack(DATA_DIRECTORY, PACK_PATH, current_pack)
+                    if pack is not current_pack:
+                        list_of_planes = pack.planes()
+            elif list_of_planes is None:
+                list_of_planes = search_directory_for_planes(DATA_DIRECTORY,
+                                                             manifest,
+                                                             lazy=True,
+                                                             workers=workers)
+                print('Plane files loaded: ' + str(manifest.stats))
+                print('Shared strings: ' + str(STRING_POOL))
+            elif changes:
+                prefetcher.store_validated(manifest)
+                apply_file_changes(list_of_planes, changes, manifest,
+                                   lazy=True)
+                print('Plane files reloaded: ' + str(manifest.stats))
+            failures = set(diagnostic.filename
+                           for diagnostic in list_of_planes.diagnostics)
+            if failures != reported_failures:
+                for diagnostic in list_of_planes.diagnostics:
+                    print(str(diagnostic))
+                reported_failures = failures
+            # The cursor starts on the first plane listed, and planes with
+            # saved progress are likely to be picked up again.
+            likely_planes = [list_of_planes.get_by_path(key)
+                             or list_of_planes.get_by_name(key)
+                             for key in recent_planes]
+            likely_planes.extend(list_of_planes.filter(plane_filter)[:1])
+            likely_planes.extend(list_of_planes.get_by_name(plane_name)
+                                 for plane_name, _ in list(journal.progress))
+            prefetcher.prefetch_planes(likely_planes)
+            selected_plane, search_checklist = show_plane_select_menu(
+                list_of_planes, app_style, search_index, plane_filter)
+            if selected_plane is None:
                 break
-            else:
-                while not checklist_loop_flag:
-                    checklist_result = show_checklist(selected_plane, selected_checklist, app_style)
-                    if checklist_result == 'EXIT':
-                        flag = True
-                        checklist_select_loop_flag = True
-                        checklist_loop_flag = True
-                    elif checklist_result == 'RETURN TO LIST SELECT':
-                        checklist_loop_flag = True
-                        break
-
-main_loop()
+            prefetcher.cancel()
+            try:
+                selected_plane.materialize()
+            except PlaneLoadError as load_error:
+                # Shown with the other diagnostics when the menu comes back.
+                record_load_failure(list_of_planes, selected_plane,
+                                    load_error, manifest)
+                continue
+            plane_key = (list_of_planes.path_of(selected_plane)
+                         or selected_plane.plane_name)
+            if plane_key in recent_planes:
+                recent_planes.remove(plane_key)
+            recent_planes.insert(0, plane_key)
+            del recent_planes[RECENT_PLANES:]
+            while not checklist_select_loop_flag:
+                if search_checklist is not None:
+                    # Picked from a search of every plane, so it is opened
+                    # straight away.
+                    selected_checklist = search_checklist
+                    search_checklist = None
+                else:
+                    prefetcher.prefetch_checklists(selected_plane)
+                    selected_checklist = show_checklist_selection_page(
+                        selected_plane, app_style)
+                    prefetcher.cancel()
+                if selected_checklist == 'SEARCH THIS PLANE':
+                    search_index.ensure_plane(selected_plane, plane_key)
+                    search_result = show_search_prompt(search_index, app_style,
+                                                       plane_key)
+                    if search_result is None:
+                        continue
+                    selected_checklist = search_result.checklist_name
+                if selected_checklist == 'RETURN TO PLANE SELECT':
+                    break
+                else:
+                    checklist_loop_flag = False
+                    while not checklist_loop_flag:
+                        checklist_result = show_checklist(
+                            selected_plane, selected_checklist, app_style,
+                            journal)
+                        if checklist_result == 'EXIT':
+                            flag = True
+                            checklist_select_loop_flag = True
+                            checklist_loop_flag = True
+                        elif checklist_result == 'RETURN TO LIST SELECT':
+                            checklist_loop_flag = True
+                            break
+    finally:
+        prefetcher.stop()
+        watcher.stop()
+        journal.close()
+        if pack is not None:
+            pack.close()
+
+
+def load_library(use_pack: bool = False, lazy: bool = True,
+                 workers: int = 1):
+    """Load the planes in the data directory without any caching.
+
+    Args:
+        use_pack (Optional): Read the planes from the compiled pack.
+        lazy (Optional): Only read the plane names up front.
+        workers (Optional): The number of workers used to load plane files.
+
+    Returns:
+        PlaneLibrary: The planes.
+
+    """
+    if use_pack:
+        from pack import load_pack
+        return load_pack(DATA_DIRECTORY, PACK_PATH).planes()
+    return search_directory_for_planes(DATA_DIRECTORY, lazy=lazy,
+                                       workers=workers)
+
+
+def run_list_planes(use_pack: bool = False, workers: int = 1,
+                    selection: dict = None, show_facets: bool = False):
+    """Print the name of every plane, one per line.
+
+    Args:
+        use_pack (Optional): Read the planes from the compiled pack.
+        workers (Optional): The number of workers used to load plane files.
+        selection (Optional): Only list the planes with these plane_info
+        values, keyed by info key.
+        show_facets (Optional): Print how many of those planes have each
+        plane_info value instead.
+
+    Returns:
+        int: The exit status.
+
+    """
+    library = load_library(use_pack, workers=workers)
+    if show_facets:
+        lines = []
+        for key, counts in library.facet_counts(selection).items():
+            if counts:
+                lines.append(key)
+                for value in sorted(counts):
+                    lines.append('    ' + value + ': ' + str(counts[value]))
+        print('\n'.join(lines))
+    else:
+        for plane in library.filter(selection or {}):
+            print(plane.plane_name)
+    for diagnostic in library.diagnostics:
+        print(str(diagnostic), file=sys.stderr)
+    return 0
+
+
+def info_filter(text: str):
+    """Parse a KEY=VALUE plane_info filter from the command line.
+
+    Args:
+        text: The argument.
+
+    Returns:
+        tuple of (str, str): The info key and value.
+
+    Raises:
+        argparse.ArgumentTypeError: There is no = in the argument.
+
+    """
+    key, separator, value = text.partition('=')
+    if not separator or not key:
+        raise argparse.ArgumentTypeError('expected KEY=VALUE, found '
+                                         + repr(text))
+    return key, value
+
+
+def run_show(plane_name: str, checklist_name: str, use_pack: bool = False):
+    """Print the steps of a checklist with their saved progress.
+
+    Args:
+        plane_name: The name of the plane.
+        checklist_name: The name of the checklist.
+        use_pack (Optional): Read the planes from the compiled pack.
+
+    Returns:
+        int: The exit status.
+
+    """
+    from progress import ProgressJournal
+    plane = load_library(use_pack).get_by_name(plane_name)
+    if plane is None:
+        print('No plane named: ' + plane_name, file=sys.stderr)
+        return 1
+    checklist = plane.get_checklist(checklist_name)
+    if checklist is None:
+        print('No checklist named: ' + checklist_name, file=sys.stderr)
+        return 1
+    progress = ProgressJournal(PROGRESS_DIRECTORY).load().get_progress(
+        plane.plane_name, checklist.name, len(checklist.steps))
+    lines = [checklist.message + ' [' + str(progress) + ']']
+    for index, step in enumerate(checklist.steps):
+        lines.append(('[x] ' if progress.is_checked(index) else '[ ] ')
+                     + str(step.step_number) + ': ' + step.step_title
+                     + ' - ' + step.step_text)
+    print('\n'.join(lines))
+    return 0
+
+
+def run_dump(plane_name: str = None, use_pack: bool = False):
+    """Print planes as JSON in the plane data file format.
+
+    Args:
+        plane_name (Optional): Only dump the plane with this name.
+        use_pack (Optional): Read the planes from the compiled pack.
+
+    Returns:
+        int: The exit status.
+
+    """
+    library = load_library(use_pack)
+    if plane_name is not None:
+        plane = library.get_by_name(plane_name)
+        if plane is None:
+            print('No plane named: ' + plane_name, file=sys.stderr)
+            return 1
+        print(json.dumps(plane_to_dict(plane), indent=4))
+    else:
+        print(json.dumps([plane_to_dict(plane) for plane in library],
+                         indent=4))
+    return 0
+
+
+def run_export(export_format: str, output: str = None,
+               plane_names: list = None, use_pack: bool = False):
+    """Write planes as Markdown, plain text or printable HTML cards.
+
+    The planes are loaded and written one at a time, so the memory used
+    does not grow with the size of the library.
+
+    Args:
+        export_format: One of the keys of export.EXPORTERS.
+        output (Optional): The file to write to. Defaults to stdout.
+        plane_names (Optional): Only export the planes with these names.
+        use_pack (Optional): Read the planes from the compiled pack.
+
+    Returns:
+        int: The exit status.
+
+    """
+    from export import export_planes
+    from validator import LoadDiagnostic
+    wanted = set(plane_names) if plane_names else None
+    found = set()
+
+    def selected_planes():
+        if use_pack:
+            from pack import load_pack
+            pack = load_pack(DATA_DIRECTORY, PACK_PATH)
+            for plane_index in range(pack.plane_count):
+                if wanted is None or pack.plane_name(plane_index) in wanted:
+                    plane = pack.build_plane(plane_index)
+                    found.add(plane.plane_name)
+                    yield plane
+            return
+        for plane in iter_plane_files(DATA_DIRECTORY):
+            if isinstance(plane, LoadDiagnostic):
+                print(str(plane), file=sys.stderr)
+            elif wanted is None or plane.plane_name in wanted:
+                found.add(plane.plane_name)
+                yield plane
+
+    if output is None:
+        export_planes(selected_planes(), sys.stdout, export_format)
+    else:
+        with open(output, 'w', encoding='utf-8') as output_file:
+            export_planes(selected_planes(), output_file, export_format)
+    if wanted is not None and found != wanted:
+        print('No plane named: ' + ', '.join(sorted(wanted - found)),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_search(query: str, plane_name: str = None, limit: int = 20,
+               workers: int = 1):
+    """Search the checklist steps and print the results.
+
+    Args:
+        query: The words to search for.
+        plane_name (Optional): Only search the plane with this name.
+        limit (Optional): The most results to print.
+        workers (Optional): The number of workers used to load plane files.
+
+    Returns:
+        int: The exit status.
+
+    """
+    from search import SearchIndex
+    library = search_directory_for_planes(DATA_DIRECTORY, workers=workers)
+    search_index = SearchIndex()
+    if plane_name is None:
+        search_index.sync(library)
+        plane_key = None
+    else:
+        plane = library.get_by_name(plane_name)
+        if plane is None:
+            print('No plane named: ' + plane_name, file=sys.stderr)
+            return 1
+        plane_key = library.path_of(plane)
+        search_index.add_plane(plane, plane_key)
+    for result in search_index.search(query, limit, plane_key):
+        print(str(result))
+    return 0
+
+
+def run_lint(directory: str, workers: int = 0):
+    """Validate every plane file in a directory tree and print a report.
+
+    Args:
+        directory: The directory to check.
+        workers (Optional): The number of worker processes to use, 0 for
+        one per CPU.
+
+    Returns:
+        int: The exit status, 1 if any file is invalid.
+
+    """
+    from fileio import lint_directory
+    report = lint_directory(directory, workers)
+    print(json.dumps(report, indent=4))
+    return 1 if report['invalid'] else 0
+
+
+def run_serve(host: str, port: int, workers: int = 1,
+              use_pack: bool = False):
+    """Serve the planes and checklist progress as a JSON API over HTTP.
+
+    Args:
+        host: The address to listen on.
+        port: The port to listen on.
+        workers (Optional): The number of workers used to load plane files.
+        use_pack (Optional): Read the planes from the compiled pack.
+
+    Returns:
+        int: The exit status.
+
+    """
+    from manifest import LibraryManifest
+    from progress import ProgressJournal
+    from server import serve
+    from watcher import DirectoryWatcher
+    journal = ProgressJournal(PROGRESS_DIRECTORY).open()
+    manifest = None
+    watcher = None
+    if use_pack:
+        library = load_library(use_pack)
+    else:
+        manifest = LibraryManifest(MANIFEST_PATH)
+        watcher = DirectoryWatcher(DATA_DIRECTORY).start()
+        library = search_directory_for_planes(DATA_DIRECTORY, manifest,
+                                              lazy=True, workers=workers)
+    for diagnostic in library.diagnostics:
+        print(str(diagnostic), file=sys.stderr)
+    try:
+        serve(library, journal, host, port, watcher, manifest)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        journal.close()
+    return 0
+
+
+def run_import_flightgear(root: str, output: str, workers: int = 0,
+                          force: bool = False):
+    """Import the checklists of the FlightGear aircraft in a directory tree.
+
+    Args:
+        root: An FGData or FGAddon directory, or one aircraft directory.
+        output: The directory the plane files are written to.
+        workers (Optional): The number of worker processes to use, 0 for
+        one per CPU.
+        force (Optional): Import every aircraft, even unchanged ones.
+
+    Returns:
+        int: The exit status, 1 if any aircraft could not be read.
+
+    """
+    from flightgear import ImportState
+    from flightgear import import_flightgear
+    state = ImportState(FLIGHTGEAR_STATE_PATH)
+    if force:
+        state.imports = {}
+    report = import_flightgear(root, output, state, workers)
+    print('Found ' + str(report['aircraft']) + ' aircraft: '
+          + str(report['imported']) + ' imported, '
+          + str(report['unchanged']) + ' unchanged, '
+          + str(report['without_checklists']) + ' without checklists, '
+          + str(len(report['failed'])) + ' failed, '
+          + str(report['removed']) + ' old plane files removed')
+    for failure in report['failed']:
+        print(failure['aircraft'] + ': ' + failure['error'], file=sys.stderr)
+    return 1 if report['failed'] else 0
+
+
+def parse_arguments(args=None):
+    """Parse the command line arguments.
+
+    Args:
+        args (Optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Read flight simulator checklists. Without a command the '
+        'interactive menus are shown.')
+    parser.add_argument('--workers', type=int,
+                        help='number of workers used to load plane files, '
+                        '0 uses one per CPU (default: 1, or 0 for lint and '
+                        'import-flightgear)')
+    parser.add_argument('--pack', action='store_true',
+                        help='read the planes from the compiled pack')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the hot paths and print a summary at '
+                        'exit (or set ' + PROFILE_VARIABLE + '=1)')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='with profiling, also write a Chrome trace-event '
+                        'file (or set ' + TRACE_VARIABLE + ')')
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help='run under cProfile and write the stats to FILE '
+                        '(or set ' + CPROFILE_VARIABLE + ')')
+    parser.add_argument('--cache-planes', type=int, metavar='N',
+                        help='keep at most N planes loaded, unloading the '
+                        'least recently used ones')
+    parser.add_argument('--cache-mb', type=float, metavar='MB',
+                        help='keep at most about MB megabytes of checklists '
+                        'loaded, unloading the least recently used planes')
+    subparsers = parser.add_subparsers(dest='command')
+    list_parser = subparsers.add_parser('list-planes',
+                                        help='print the name of every plane')
+    list_parser.add_argument('--filter', dest='filters', action='append',
+                             type=info_filter, default=[],
+                             metavar='KEY=VALUE',
+                             help='only list planes with this plane_info '
+                             'value, for example game_platform=FlightGear; '
+                             'may be repeated')
+    list_parser.add_argument('--facets', action='store_true',
+                             help='print how many planes have each '
+                             'plane_info value instead of their names')
+    show_parser = subparsers.add_parser(
+        'show', help='print the steps of a checklist')
+    show_parser.add_argument('plane', help='name of the plane')
+    show_parser.add_argument('checklist', help='name of the checklist')
+    dump_parser = subparsers.add_parser(
+        'dump', help='print planes as JSON in the plane file format')
+    dump_parser.add_argument('plane', nargs='?',
+                             help='only dump the plane with this name')
+    export_parser = subparsers.add_parser(
+        'export', help='write planes as Markdown, text or printable HTML '
+        'kneeboard cards')
+    export_parser.add_argument('planes', nargs='*', metavar='plane',
+                               help='only export the planes with these names')
+    export_parser.add_argument('--format', dest='export_format',
+                               choices=['markdown', 'text', 'html'],
+                               default='markdown')
+    export_parser.add_argument('--output', '-o',
+                               help='file to write to (default: stdout)')
+    compile_parser = subparsers.add_parser(
+        'compile', help='compile the plane files into a binary pack')
+    compile_parser.add_argument('--data-dir', default=DATA_DIRECTORY,
+                                help='directory containing the plane files')
+    compile_parser.add_argument('--output', default=PACK_PATH,
+                                help='path of the pack to write')
+    lint_parser = subparsers.add_parser(
+        'lint', help='validate every plane file in a directory tree and '
+        'print a JSON report, using --workers processes')
+    lint_parser.add_argument('directory', nargs='?', default=DATA_DIRECTORY,
+                             help='directory to check')
+    search_parser = subparsers.add_parser(
+        'search', help='search the checklist steps of every plane')
+    search_parser.add_argument('query', nargs='+', help='words to search for')
+    search_parser.add_argument('--plane', help='only search this plane')
+    search_parser.add_argument('--limit', type=int, default=20,
+                               help='most results to show (default: 20)')
+    serve_parser = subparsers.add_parser(
+        'serve', help='serve the checklists and their progress as a JSON '
+        'API over HTTP')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help='address to listen on, 0.0.0.0 for the '
+                              'LAN (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8080,
+                              help='port to listen on (default: 8080)')
+    import_parser = subparsers.add_parser(
+        'import-flightgear', help='write plane files from the checklists '
+        'of the FlightGear aircraft in an FGData or FGAddon tree, using '
+        '--workers processes')
+    import_parser.add_argument('root', help='FGData/Aircraft, FGAddon or '
+                               'one aircraft directory')
+    import_parser.add_argument('--output', default=DATA_DIRECTORY,
+                               help='directory to write the plane files to '
+                               '(default: ' + DATA_DIRECTORY + ')')
+    import_parser.add_argument('--force', action='store_true',
+                               help='import aircraft that have not changed '
+                               'since the last import too')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Run the command given on the command line.
+
+    Args:
+        args (Optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status.
+
+    """
+    from validator import PlaneLoadError
+    arguments = parse_arguments(args)
+    workers = arguments.workers
+    if workers is None:
+        # Going through a whole tree is worth a process per CPU without
+        # being asked.
+        workers = 0 if arguments.command in ('lint',
+                                             'import-flightgear') else 1
+    if arguments.profile or arguments.trace or arguments.cprofile:
+        enable_profiling(arguments.trace, arguments.cprofile)
+    else:
+        enable_profiling_from_environment()
+    if arguments.cache_planes is not None or arguments.cache_mb is not None:
+        from planecache import PlaneCache
+        max_bytes = None
+        if arguments.cache_mb is not None:
+            max_bytes = int(arguments.cache_mb * 1024 * 1024)
+        PlaneCache(arguments.cache_planes, max_bytes).install()
+    if arguments.command == 'list-planes':
+        return run_list_planes(arguments.pack, workers,
+                               dict(arguments.filters), arguments.facets)
+    try:
+        if arguments.command == 'show':
+            return run_show(arguments.plane, arguments.checklist,
+                            arguments.pack)
+        if arguments.command == 'dump':
+            return run_dump(arguments.plane, arguments.pack)
+    except PlaneLoadError as load_error:
+        print(str(load_error), file=sys.stderr)
+        return 1
+    if arguments.command == 'export':
+        return run_export(arguments.export_format, arguments.output,
+                          arguments.planes, arguments.pack)
+    if arguments.command == 'compile':
+        from pack import compile_pack
+        plane_count = compile_pack(arguments.data_dir, arguments.output)
+        print('Compiled ' + str(plane_count) + ' planes into '
+              + arguments.output)
+        return 0
+    if arguments.command == 'lint':
+        return run_lint(arguments.directory, workers)
+    if arguments.command == 'search':
+        return run_search(' '.join(arguments.query), arguments.plane,
+                          arguments.limit, workers)
+    if arguments.command == 'serve':
+        return run_serve(arguments.host, arguments.port, workers,
+                         arguments.pack)
+    if arguments.command == 'import-flightgear':
+        return run_import_flightgear(arguments.root, arguments.output,
+                                     workers, arguments.force)
+    main_loop(workers, arguments.pack)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Shares one copy of each repeated string across every loaded plane.
+
+Step texts like "ON", "CHECK" and "AUTO" and step titles like "APU" are
+repeated thousands of times in a library. The JSON decoder makes a new
+str object for every one of them, so the loaders pass each string through
+STRING_POOL, which swaps it for the copy already in memory.
+
+The pool is built on sys.intern. Interned strings are freed when the last
+plane using them is, so the pool never keeps strings alive by itself.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import sys
+
+from model import Plane
+from model import StepColumns
+
+
+class StringPool():
+    """Deduplicates strings and counts how much memory that saves.
+
+    The counters are only statistics. They are not locked, so loads
+    running in threads at the same time may miss a few counts.
+
+    Attributes:
+        total (int): The strings passed through the pool.
+        deduplicated (int): The strings that were replaced by a copy already
+        in memory.
+        bytes_saved (int): The size of the replaced strings, which can be
+        freed.
+
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self.total = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    @property
+    def unique(self):
+        """int: The strings that were kept because they were the first copy.
+        """
+        return self.total - self.deduplicated
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the StringPool.
+
+        """
+        return ('{ total: ' + str(self.total) + ' | unique: '
+                + str(self.unique) + ' | deduplicated: '
+                + str(self.deduplicated) + ' | bytes_saved: '
+                + str(self.bytes_saved) + ' }')
+
+    def reset(self):
+        """Zero all of the counters."""
+        self.total = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    def intern(self, value: str):
+        """Return the shared copy of a string.
+
+        Args:
+            value: The string to deduplicate.
+
+        Returns:
+            str: An equal string, shared with every other user of the pool.
+
+        """
+        shared = sys.intern(value)
+        self.total += 1
+        if shared is not value:
+            self.deduplicated += 1
+            self.bytes_saved += sys.getsizeof(value)
+        return shared
+
+    def intern_plane(self, plane: Plane):
+        """Deduplicate the strings of a plane that was built elsewhere.
+
+        Planes built by the loaders already use the pool. This is for planes
+        that arrive unpickled, from a worker process or from the manifest.
+        A LazyPlane that hasn't been loaded only has its name and
+        plane_info deduplicated.
+
+        Args:
+            plane: The plane to update in place.
+
+        """
+        intern = self.intern
+        plane.plane_name = intern(plane.plane_name)
+        plane.plane_info = [{intern(key): intern(value)
+                             for key, value in info_pair.items()}
+                            for info_pair in plane.plane_info]
+        if not getattr(plane, 'loaded', True):
+            return
+        for checklist in plane.checklists:
+            checklist.name = intern(checklist.name)
+            checklist.message = intern(checklist.message)
+            steps = checklist.steps
+            if isinstance(steps, StepColumns):
+                steps.titles = tuple(map(intern, steps.titles))
+                steps.texts = tuple(map(intern, steps.texts))
+            else:
+                for step in steps:
+                    step.step_title = intern(step.step_title)
+                    step.step_text = intern(step.step_text)
+
+
+STRING_POOL = StringPool()
@@ -0,0 +1,187 @@
+"""Reads a JSON document a piece at a time instead of all at once.
+
+JsonStreamReader keeps only a small window of the file in memory. The
+caller walks the structure it expects, token by token, and has the stdlib
+decoder turn just the values it wants into Python objects, so a large
+array can be consumed one item at a time.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import json
+from json.decoder import WHITESPACE
+from typing import TextIO
+
+STREAM_CHUNK_SIZE = 65536
+
+
+class JsonStreamReader():
+    """A cursor over a JSON document that is read from a file in chunks.
+
+    Args:
+        stream: A text file opened for reading.
+        chunk_size (Optional): How many characters to read at a time.
+
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Class Constructor."""
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._position = 0
+        # Characters consumed before the start of the buffer, for errors.
+        self._offset = 0
+        self._at_end = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: int):
+        """Read at least size more characters, unless the file ends first.
+
+        Returns:
+            bool: False if the file had already ended.
+
+        """
+        if self._at_end:
+            return False
+        if self._position > self._chunk_size:
+            # Drop what has been consumed so the window stays small.
+            self._offset += self._position
+            self._buffer = self._buffer[self._position:]
+            self._position = 0
+        chunk = self._stream.read(max(size, self._chunk_size))
+        if not chunk:
+            self._at_end = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def _error(self, message: str):
+        """Build a JSONDecodeError for the current position."""
+        return json.JSONDecodeError(message, self._buffer, self._position)
+
+    def peek(self):
+        """Skip whitespace and return the next character without using it.
+
+        Returns:
+            str: The next character, or '' at the end of the document.
+
+        """
+        while True:
+            self._position = WHITESPACE.match(self._buffer,
+                                              self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill(self._chunk_size):
+                return ''
+
+    def expect(self, character: str):
+        """Use the next character, which must be the one given.
+
+        Args:
+            character: The structural character expected, like '{' or ':'.
+
+        Raises:
+            json.JSONDecodeError: The next character is something else.
+
+        """
+        if self.peek() != character:
+            raise self._error('Expecting ' + repr(character))
+        self._position += 1
+
+    def take(self, character: str):
+        """Use the next character if it is the one given.
+
+        Args:
+            character: The structural character to look for.
+
+        Returns:
+            bool: True if it was there and has been used.
+
+        """
+        if self.peek() == character:
+            self._position += 1
+            return True
+        return False
+
+    def value(self):
+        """Decode the next complete value.
+
+        Returns:
+            The decoded value, as json.load would return it.
+
+        Raises:
+            json.JSONDecodeError: The value is not valid JSON.
+
+        """
+        self.peek()
+        read_size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer,
+                                                      self._position)
+            except json.JSONDecodeError:
+                if not self._fill(read_size):
+                    raise
+                # Grow the reads so a large value isn't decoded again for
+                # every chunk.
+                read_size *= 2
+                continue
+            if end < len(self._buffer) or not self._fill(read_size):
+                # A number that runs to the end of the window might carry on
+                # in the next chunk, so only trust a value with text after it.
+                self._position = end
+                return value
+
+    def items(self):
+        """Iterate over an array, leaving each item to be read by the caller.
+
+        The caller must read exactly one value for each iteration.
+
+        Yields:
+            int: The index of the item about to be read.
+
+        """
+        self.expect('[')
+        if self.take(']'):
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.take(']'):
+                return
+            self.expect(',')
+
+    def keys(self):
+        """Iterate over an object, leaving each value to be read by the caller.
+
+        The caller must read exactly one value for each key.
+
+        Yields:
+            str: The key of the value about to be read.
+
+        """
+        self.expect('{')
+        if self.take('}'):
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error('Expecting property name enclosed in '
+                                  'double quotes')
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.take('}'):
+                return
+            self.expect(',')
+
+    def end(self):
+        """Check that nothing but whitespace is left in the document.
+
+        Raises:
+            json.JSONDecodeError: There is extra data after the document.
+
+        """
+        if self.peek() != '':
+            raise self._error('Extra data')
@@ -0,0 +1,425 @@
+"""Keeps an on-disk manifest of plane files that have already been loaded.
+
+The manifest lets search_directory_for_planes skip re-parsing plane files
+that have not changed since the last time they were loaded. It also keeps
+the member list of each archive, so an archive that hasn't changed is not
+even opened, and the planes of each archive member.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import hashlib
+import os
+import pickle
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Union
+
+from archive import ArchiveMember
+from model import LazyPlane
+from model import Plane
+from validator import LoadDiagnostic
+
+MANIFEST_VERSION = 8
+
+
+def hash_file(filename: str):
+    """Calculate the content hash of a file.
+
+    Args:
+        filename: The path of the file to hash.
+
+    Returns:
+        str: The hex digest of the file's contents.
+
+    """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ManifestStats():
+    """Counts what happened to the files during the last directory scan.
+
+    Attributes:
+        hits (int): Files that were served from the manifest.
+        failed_hits (int): Of the hits, the files that had failed to load
+        before and were not tried again because they have not changed.
+        reparsed (int): Files that were new or changed and had to be loaded.
+        removed (int): Manifest entries dropped because the file is gone.
+
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self.hits = 0
+        self.failed_hits = 0
+        self.reparsed = 0
+        self.removed = 0
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the ManifestStats.
+
+        """
+        return ('{ hits: ' + str(self.hits) + ' | failed_hits: '
+                + str(self.failed_hits) + ' | reparsed: '
+                + str(self.reparsed) + ' | removed: '
+                + str(self.removed) + ' }')
+
+    def reset(self):
+        """Zero all of the counters."""
+        self.hits = 0
+        self.failed_hits = 0
+        self.reparsed = 0
+        self.removed = 0
+
+
+class ManifestEntry():
+    """The information recorded about a single plane file.
+
+    Attributes:
+        size (int): The size of the file in bytes when it was loaded.
+        mtime_ns (int): The modification time of the file when it was loaded.
+        digest (str): The content hash of the file when it was loaded, or
+        None for a LazyPlane, which only read the file's header. For an
+        archive member, the member's stamp, with mtime_ns left at 0.
+        result (Plane or LoadDiagnostic): The Plane that was loaded from the
+        file, or the LoadDiagnostic saying why it failed to load.
+
+    """
+
+    def __init__(self, size: int, mtime_ns: int, digest: Optional[str],
+                 result: Union[Plane, LoadDiagnostic]):
+        """Class Constructor."""
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+        self.result = result
+
+
+class ArchiveIndex():
+    """The member list recorded for an archive.
+
+    Attributes:
+        size (int): The size of the archive in bytes when it was read.
+        mtime_ns (int): The modification time of the archive when it was
+        read.
+        members (list of ArchiveMember): The plane files in the archive.
+
+    """
+
+    def __init__(self, size: int, mtime_ns: int,
+                 members: List[ArchiveMember]):
+        """Class Constructor."""
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.members = members
+
+
+class LibraryManifest():
+    """Maps plane file paths to the Plane objects loaded from them.
+
+    An entry is reused when the file's size and mtime still match. When only
+    the mtime changed the content hash is compared before deciding to
+    reparse, so touching a file does not force it to be loaded again. A
+    LazyPlane has no hash, because reading its header again costs no more
+    than hashing the file would.
+    Files that failed to load are remembered the same way, so a broken file
+    is only parsed again once it changes.
+
+    Archive members have no stat of their own. Their entries are keyed by
+    archive.member_path and checked against the size and stamp recorded in
+    the archive's member list instead.
+
+    Attributes:
+        manifest_path (str): Where the manifest is saved. None keeps the
+        manifest in memory only.
+        entries (dict of str: ManifestEntry): The known files keyed by their
+        absolute path.
+        archives (dict of str: ArchiveIndex): The member lists of the known
+        archives keyed by their absolute path.
+        stats (ManifestStats): The counters for the last scan.
+
+    Args:
+        manifest_path (Optional): Where to load and save the manifest.
+
+    """
+
+    def __init__(self, manifest_path: Optional[str] = None):
+        """Class Constructor."""
+        self.manifest_path = manifest_path
+        self.entries = {}  # type: Dict[str, ManifestEntry]
+        self.archives = {}  # type: Dict[str, ArchiveIndex]
+        self.stats = ManifestStats()
+        self._dirty = False
+        if self.manifest_path is not None:
+            self.load()
+
+    def load(self):
+        """Load the manifest from manifest_path.
+
+        A missing, unreadable or outdated manifest leaves the manifest empty.
+
+        """
+        self.entries = {}
+        self.archives = {}
+        try:
+            with open(self.manifest_path, 'rb') as manifest_file:
+                version, entries, archives = pickle.load(manifest_file)
+            if version == MANIFEST_VERSION:
+                self.entries = entries
+                self.archives = archives
+        except (OSError, EOFError, ValueError, TypeError, AttributeError,
+                ImportError, pickle.UnpicklingError):
+            self.entries = {}
+            self.archives = {}
+        self._dirty = False
+
+    def save(self):
+        """Write the manifest to manifest_path if anything changed."""
+        if self.manifest_path is None or not self._dirty:
+            return
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'wb') as manifest_file:
+            pickle.dump((MANIFEST_VERSION, self.entries, self.archives),
+                        manifest_file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.manifest_path)
+        self._dirty = False
+
+    def lookup(self, filename: str):
+        """Return the cached result for a file if the file has not changed.
+
+        Args:
+            filename: The path of the plane file.
+
+        Returns:
+            Plane: The cached plane, the cached LoadDiagnostic if the file
+            failed to load, or None when the file must be reparsed.
+
+        """
+        path = os.path.abspath(filename)
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if file_stat.st_size != entry.size:
+            return None
+        if file_stat.st_mtime_ns != entry.mtime_ns:
+            if entry.digest is None or hash_file(path) != entry.digest:
+                return None
+            entry.mtime_ns = file_stat.st_mtime_ns
+            self._dirty = True
+        self.stats.hits += 1
+        if isinstance(entry.result, LoadDiagnostic):
+            self.stats.failed_hits += 1
+        return entry.result
+
+    def store(self, filename: str, result: Union[Plane, LoadDiagnostic],
+              file_stat: Optional[os.stat_result] = None,
+              digest: Optional[str] = None, reparsed: bool = True):
+        """Record the result of loading a file.
+
+        Args:
+            filename: The path of the plane file.
+            result: The Plane that was loaded from it, or the LoadDiagnostic
+            saying why it failed.
+            file_stat (Optional): The file's stat taken before it was
+            loaded. A file that changes during the load then no longer
+            matches its entry. Without it the file is stat'ed now.
+            digest (Optional): The content hash, if it is already known.
+            Otherwise the file is hashed, unless result is a LazyPlane.
+            reparsed (Optional): Count the file in stats.reparsed. False
+            for a result loaded ahead of time, which the next lookup counts
+            as a hit.
+
+        """
+        path = os.path.abspath(filename)
+        if reparsed:
+            self.stats.reparsed += 1
+        try:
+            if file_stat is None:
+                file_stat = os.stat(path)
+            if digest is None and not isinstance(result, LazyPlane):
+                digest = hash_file(path)
+        except OSError:
+            # The file went away after it was loaded, so there is nothing
+            # to key the entry on.
+            self.entries.pop(path, None)
+            return
+        self.entries[path] = ManifestEntry(file_stat.st_size,
+                                           file_stat.st_mtime_ns,
+                                           digest, result)
+        self._dirty = True
+
+    def lookup_archive(self, filename: str):
+        """Return the recorded member list of an archive if it has not changed.
+
+        Args:
+            filename: The path of the archive.
+
+        Returns:
+            list of ArchiveMember: The members, or None when the archive
+            must be read again.
+
+        """
+        path = os.path.abspath(filename)
+        index = self.archives.get(path)
+        if index is None:
+            return None
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if (file_stat.st_size != index.size
+                or file_stat.st_mtime_ns != index.mtime_ns):
+            return None
+        return index.members
+
+    def recorded_members(self, filename: str):
+        """Return the member list last recorded for an archive.
+
+        Unlike lookup_archive it is returned even if the archive changed
+        since, so the members that did not change can be recognised.
+
+        Args:
+            filename: The path of the archive.
+
+        Returns:
+            list of ArchiveMember: The members, or None if the archive has
+            not been recorded.
+
+        """
+        index = self.archives.get(os.path.abspath(filename))
+        if index is None:
+            return None
+        return index.members
+
+    def store_archive(self, filename: str, members: List[ArchiveMember]):
+        """Record the member list of an archive.
+
+        Args:
+            filename: The path of the archive.
+            members: The plane files in the archive.
+
+        """
+        path = os.path.abspath(filename)
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            self.archives.pop(path, None)
+            return
+        self.archives[path] = ArchiveIndex(file_stat.st_size,
+                                           file_stat.st_mtime_ns, members)
+        self._dirty = True
+
+    def lookup_member(self, path: str, member: ArchiveMember):
+        """Return the cached result for an unchanged archive member.
+
+        Args:
+            path: The member's path, from archive.member_path.
+            member: The member as listed in the archive.
+
+        Returns:
+            Plane: The cached plane or LoadDiagnostic, or None when the
+            member must be loaded again.
+
+        """
+        entry = self.entries.get(path)
+        if (entry is None or entry.size != member.size
+                or entry.digest != member.stamp):
+            return None
+        self.stats.hits += 1
+        if isinstance(entry.result, LoadDiagnostic):
+            self.stats.failed_hits += 1
+        return entry.result
+
+    def store_member(self, path: str, member: ArchiveMember,
+                     result: Union[Plane, LoadDiagnostic]):
+        """Record the result of loading an archive member.
+
+        Args:
+            path: The member's path, from archive.member_path.
+            member: The member as listed in the archive.
+            result: The Plane that was loaded from it, or the LoadDiagnostic
+            saying why it failed.
+
+        """
+        self.stats.reparsed += 1
+        self.entries[path] = ManifestEntry(member.size, 0, member.stamp,
+                                           result)
+        self._dirty = True
+
+    def record_failure(self, path: str, diagnostic: LoadDiagnostic):
+        """Replace a plane that was stored lazily with why it failed to load.
+
+        A LazyPlane is stored after only its header was read, so a broken
+        checklist is found when it is first loaded. The entry keeps the
+        size and stamp it was stored with, so the file is only tried again
+        once it changes.
+
+        Args:
+            path: The path of the plane file, or of the archive member.
+            diagnostic: The LoadDiagnostic from loading the plane.
+
+        """
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return
+        entry.result = diagnostic
+        self._dirty = True
+
+    def discard(self, filename: str):
+        """Forget a file, for example because it was deleted.
+
+        Forgetting an archive forgets all of its members too.
+
+        Args:
+            filename: The path of the plane file or archive.
+
+        """
+        path = os.path.abspath(filename)
+        if self.entries.pop(path, None) is not None:
+            self.stats.removed += 1
+            self._dirty = True
+        if self.archives.pop(path, None) is not None:
+            member_prefix = os.path.join(path, '')
+            for entry_path in list(self.entries):
+                if entry_path.startswith(member_prefix):
+                    del self.entries[entry_path]
+                    self.stats.removed += 1
+            self._dirty = True
+
+    def prune(self, directory: str, seen_files: Iterable[str]):
+        """Drop entries for files in a directory that no longer exist.
+
+        Args:
+            directory: The directory that was scanned.
+            seen_files: The paths of the plane files, archives and archive
+            members found in the scan.
+
+        """
+        directory_path = os.path.join(os.path.abspath(directory), '')
+        seen = set(os.path.abspath(filename) for filename in seen_files)
+        for path in list(self.entries):
+            if path.startswith(directory_path) and path not in seen:
+                del self.entries[path]
+                self.stats.removed += 1
+                self._dirty = True
+        for path in list(self.archives):
+            if path.startswith(directory_path) and path not in seen:
+                del self.archives[path]
+                self._dirty = True
@@ -3,8 +3,24 @@
 Copyright 2019 Jacqueline Button.
 
 """
+import os
+import sys
+import warnings
+from array import array
+from collections.abc import Sequence
+from typing import Callable
+from typing import Iterable
 from typing import List
 from typing import Dict
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from profiling import span
+
+
+class DuplicateNameWarning(UserWarning):
+    """Warns that a name index found more than one item with a name."""
 
 
 class ChecklistStep():
@@ -24,6 +40,8 @@ class ChecklistStep():
 
     """
 
+    __slots__ = ('step_number', 'step_title', 'step_text')
+
     def __init__(self, step_number: int, step_title: str, step_text: str):
         """Class Constructor."""
         self.step_number = step_number
@@ -37,9 +55,8 @@ class ChecklistStep():
             A str representation of the ChecklistStep.
 
         """
-        output = '{ step_number: ' + str(self.step_number) + ' | step_title: '
-        output += self.step_title + ' | step_text: ' + self.step_text + ' }'
-        return output
+        return '{ step_number: %s | step_title: %s | step_text: %s }' % (
+            self.step_number, self.step_title, self.step_text)
 
     def __repr__(self):
         """Turn a class into a str for debugging purposes.
@@ -48,11 +65,70 @@ class ChecklistStep():
             A str representation of the Plane.
 
         """
-        output = '{ ChecklistStep Object: step_number: '
-        output += str(self.step_number)
-        output += ' | step_title: ' + self.step_title
-        output += ' | step_text: ' + self.step_text + ' }'
-        return output
+        return ('{ ChecklistStep Object: step_number: %s | step_title: %s'
+                ' | step_text: %s }' % (self.step_number, self.step_title,
+                                        self.step_text))
+
+
+class StepColumns(Sequence):
+    """Columnar storage for the steps of a Checklist.
+
+    The step numbers are kept in an array and the titles and texts in
+    parallel tuples of interned strings, which is much smaller than a list
+    of ChecklistStep objects. Indexing and iterating still produce
+    ChecklistStep objects, built on demand.
+
+    Attributes:
+        numbers (array of int): The step numbers.
+        titles (tuple of str): The step titles.
+        texts (tuple of str): The step texts.
+
+    Args:
+        steps (Optional): The steps to store.
+
+    """
+
+    __slots__ = ('numbers', 'titles', 'texts')
+
+    def __init__(self, steps: Iterable[ChecklistStep] = ()):
+        """Class Constructor."""
+        steps = list(steps)
+        self.numbers = array('i', [step.step_number for step in steps])
+        self.titles = tuple(sys.intern(step.step_title) for step in steps)
+        self.texts = tuple(sys.intern(step.step_text) for step in steps)
+
+    def __len__(self):
+        """Return the number of steps."""
+        return len(self.numbers)
+
+    def __getitem__(self, index):
+        """Return the ChecklistStep at an index, or a list for a slice."""
+        if isinstance(index, slice):
+            return [self[position]
+                    for position in range(*index.indices(len(self)))]
+        return ChecklistStep(self.numbers[index], self.titles[index],
+                             self.texts[index])
+
+    def __iter__(self):
+        """Iterate over the steps as ChecklistStep objects."""
+        for step_number, step_title, step_text in zip(self.numbers,
+                                                      self.titles,
+                                                      self.texts):
+            yield ChecklistStep(step_number, step_title, step_text)
+
+    def sorted_by_number(self):
+        """Return a copy of the columns sorted by step number.
+
+        Returns:
+            StepColumns: The sorted steps.
+
+        """
+        order = sorted(range(len(self)), key=self.numbers.__getitem__)
+        result = StepColumns()
+        result.numbers = array('i', [self.numbers[i] for i in order])
+        result.titles = tuple(self.titles[i] for i in order)
+        result.texts = tuple(self.texts[i] for i in order)
+        return result
 
 
 class Checklist():
@@ -62,7 +138,8 @@ class Checklist():
         message (str): The message to use when displaying the checklist.
         name (str): The name of the checklist, also used as an ID in some
         operations.
-        steps (list of ChecklistStep): The steps of the Checklist.
+        steps (list of ChecklistStep): The steps of the Checklist. After
+        compact() is called this is a StepColumns instead.
 
     Args:
         name: The name of the check list. Should be stored in the plane file.
@@ -73,6 +150,8 @@ class Checklist():
 
     """
 
+    __slots__ = ('message', 'name', 'steps', '__weakref__')
+
     def __init__(self, name: str,
                  message: str,
                  steps: List[ChecklistStep] = None):
@@ -83,6 +162,17 @@ class Checklist():
         if self.steps is None:
             self.steps = []
 
+    def _shown_steps(self):
+        """Return the steps listed by __str__ and __repr__.
+
+        Every step but the last is left out if it is None.
+
+        """
+        steps = list(self.steps)
+        shown = [step for step in steps[:-1] if step is not None]
+        shown.extend(steps[-1:])
+        return shown
+
     def __str__(self):
         """Turn class into a str.
 
@@ -90,19 +180,10 @@ class Checklist():
             A str representation of the Checklist.
 
         """
-        step_count = len(self.steps)
-        counter = 1
-        output = '{ name: ' + self.name + ' | message: ' + self.message
-        output += ' | steps: ['
-        for step in self.steps:
-            if counter < step_count:
-                if step is not None:
-                    output += str(step) + ', '
-                counter += 1
-            else:
-                output += str(step) + ']'
-        output += ' }'
-        return output
+        shown = self._shown_steps()
+        step_texts = ', '.join(map(str, shown)) + ']' if shown else ''
+        return ''.join(('{ name: ', self.name, ' | message: ', self.message,
+                        ' | steps: [', step_texts, ' }'))
 
     def __repr__(self):
         """Turn a class into a str for debugging purposes.
@@ -111,34 +192,32 @@ class Checklist():
             A str representation of the Checklist.
 
         """
-        step_count = len(self.steps)
-        counter = 1
-        output = '{ Checklist Object: name: ' + self.name
-        output += ' | message: ' + self.message
-        output += ' | count_of_steps: ' + str(step_count)
-        output += ' | step numbers: ['
-        for step in self.steps:
-            if counter < step_count:
-                if step is not None:
-                    output += str(step.step_number) + ', '
-                counter += 1
-            else:
-                output += str(step.step_number) + '] '
-        counter = 1
-        output += ' | steps: ['
-        for step in self.steps:
-            if counter < step_count:
-                if step is not None:
-                    output += str(step) + ', '
-                counter += 1
-            else:
-                output += str(step) + ']'
-        output = output + ' }'
-        return output
+        shown = self._shown_steps()
+        step_numbers = ''
+        step_texts = ''
+        if shown:
+            step_numbers = ', '.join([str(step.step_number)
+                                      for step in shown]) + '] '
+            step_texts = ', '.join(map(str, shown)) + ']'
+        return ''.join(('{ Checklist Object: name: ', self.name,
+                        ' | message: ', self.message,
+                        ' | count_of_steps: ', str(len(self.steps)),
+                        ' | step numbers: [', step_numbers,
+                        ' | steps: [', step_texts, ' }'))
 
     def sort_checklist(self):
         """Sort the checklist."""
-        self.steps = sorted(self.steps, key=lambda step: step.step_number)
+        with span('model.sort_checklist'):
+            if isinstance(self.steps, StepColumns):
+                self.steps = self.steps.sorted_by_number()
+            else:
+                self.steps = sorted(self.steps,
+                                    key=lambda step: step.step_number)
+
+    def compact(self):
+        """Switch the steps to the columnar StepColumns storage."""
+        if not isinstance(self.steps, StepColumns):
+            self.steps = StepColumns(self.steps)
 
 
 class Plane():
@@ -149,7 +228,11 @@ class Plane():
         plane_info (List of str): The additional information used in the plane.
         It will be expanded in a future releas.
         checklists (list of Checklist): The list containing all of the
-        checklists for the plane.
+        checklists for the plane. Assigning it rebuilds the name index, so
+        use add_checklist and remove_checklist rather than changing the list
+        in place.
+        duplicate_checklist_names (list of str): Names used by more than one
+        checklist. get_checklist returns the last of them.
 
     Args:
         plane_name: The name of the plane.
@@ -158,20 +241,85 @@ class Plane():
 
     """
 
+    __slots__ = ('plane_name', 'plane_info', '_checklists',
+                 '_checklist_index', 'duplicate_checklist_names',
+                 '__weakref__')
+
     def __init__(self, plane_name: str,
                  plane_info: List[Dict[str, str]] = None,
                  checklists: List[Checklist] = None):
         """Class Constructor."""
         self.plane_name = plane_name
         self.plane_info = plane_info
-        self.checklists = checklists
         if self.plane_info is None:
             self.plane_info = []
-        if self.checklists is None:
-            self.checklists = []
-            self.checklists.append(Checklist('blank_list',
-                                             'There are no checklists for '
-                                             'this plane'))
+        if checklists is None:
+            checklists = [Checklist('blank_list',
+                                    'There are no checklists for '
+                                    'this plane')]
+        self.checklists = checklists
+
+    @property
+    def checklists(self):
+        """list of Checklist: The checklists of the plane."""
+        return self._checklists
+
+    @checklists.setter
+    def checklists(self, value: List[Checklist]):
+        self._checklists = value
+        self._build_checklist_index()
+
+    def _build_checklist_index(self):
+        """Rebuild the name to Checklist index from the checklists."""
+        index = {}  # type: Dict[str, Checklist]
+        duplicates = set()
+        for checklist in self._checklists:
+            if checklist.name in index:
+                duplicates.add(checklist.name)
+            index[checklist.name] = checklist
+        self._checklist_index = index
+        self.duplicate_checklist_names = sorted(duplicates)
+        if duplicates:
+            warnings.warn('Plane ' + str(self.plane_name)
+                          + ' has more than one checklist named: '
+                          + ', '.join(self.duplicate_checklist_names),
+                          DuplicateNameWarning)
+
+    def get_checklist(self, name: str):
+        """Find a checklist by its name.
+
+        Args:
+            name: The name of the checklist.
+
+        Returns:
+            Checklist: The checklist, or None if there isn't one by that name.
+
+        """
+        return self._checklist_index.get(name)
+
+    def add_checklist(self, checklist: Checklist):
+        """Add a checklist to the plane and to the name index.
+
+        Args:
+            checklist: The Checklist to add.
+
+        """
+        checklists = self.checklists
+        checklists.append(checklist)
+        if checklist.name in self._checklist_index:
+            self.duplicate_checklist_names = sorted(
+                set(self.duplicate_checklist_names) | {checklist.name})
+        self._checklist_index[checklist.name] = checklist
+
+    def remove_checklist(self, name: str):
+        """Remove every checklist with a name from the plane.
+
+        Args:
+            name: The name of the checklist to remove.
+
+        """
+        self.checklists = [checklist for checklist in self.checklists
+                           if checklist.name != name]
 
     def __str__(self):
         """Turn class into a str.
@@ -180,19 +328,14 @@ class Plane():
             A str representation of the Plane.
 
         """
-        checklist_count = len(self.checklists)
-        counter = 1
-        output = '{ plane_name: ' + self.plane_name + ' | plane_info: '
-        output += str(self.plane_info)
-        output += ' | checklists: [' + '\n'
-        for checklist in self.checklists:
-            if counter < checklist_count:
-                output += str(checklist) + ',\n'
-                counter += 1
-            else:
-                output += str(checklist) + '\n]'
-        output += ' }'
-        return output
+        output = ['{ plane_name: ', self.plane_name, ' | plane_info: ',
+                  str(self.plane_info), ' | checklists: [\n']
+        if self.checklists:
+            output.append(',\n'.join(str(checklist)
+                                      for checklist in self.checklists))
+            output.append('\n]')
+        output.append(' }')
+        return ''.join(output)
 
     def __repr__(self):
         """Turn a class into a str for debugging purposes.
@@ -201,19 +344,519 @@ class Plane():
             A str representation of the Plane.
 
         """
-        checklist_count = len(self.checklists)
-        plane_info_count = len(self.plane_info)
-        counter = 1
-        output = '{ Plane Object: plane_name: ' + self.plane_name
-        output += ' | # of Plane Info Pairs: ' + str(plane_info_count)
-        output += ' | plane_info: ' + str(self.plane_info)
-        output += ' | # of Checklists: ' + str(checklist_count)
-        output += ' | checklists: [\n'
+        output = ['{ Plane Object: plane_name: ', self.plane_name,
+                  ' | # of Plane Info Pairs: ', str(len(self.plane_info)),
+                  ' | plane_info: ', str(self.plane_info),
+                  ' | # of Checklists: ', str(len(self.checklists)),
+                  ' | checklists: [\n']
+        if self.checklists:
+            output.append(',\n'.join(repr(checklist)
+                                      for checklist in self.checklists))
+            output.append('\n]')
+        output.append(' }')
+        return ''.join(output)
+
+    def compact(self):
+        """Switch every checklist to the columnar StepColumns storage."""
         for checklist in self.checklists:
-            if counter < checklist_count:
-                output += repr(checklist) + ',\n'
-                counter += 1
-            else:
-                output += repr(checklist) + '\n]'
-        output += ' }'
-        return output
+            checklist.compact()
+
+    def materialize(self):
+        """Make sure the plane's data is loaded. A Plane always is."""
+
+
+class LazyPlane(Plane):
+    """A Plane whose checklists are only built when they are first used.
+
+    Only the plane_name and plane_info are known up front. The first time
+    checklists is read the loader is called and the checklists are copied
+    in, so a library scan only pays for the planes that are actually
+    opened. The plane_info read with the name is kept, since a library may
+    already have indexed the plane by it.
+
+    Attributes:
+        plane_name (str): The name of the plane.
+        plane_info (List of str): The additional information used in the plane.
+        checklists (list of Checklist): The checklists of the plane. Reading
+        it loads the plane if it has not been loaded yet.
+        loader (Callable): Returns the fully loaded Plane.
+        filename (str): The file the plane is loaded from, if any.
+        cache (PlaneCache): Shared by every LazyPlane. When set, it is told
+        about each load and use so it can unload the least recently used
+        planes. None, the default, keeps every plane loaded once it is used.
+
+    Args:
+        plane_name: The name of the plane.
+        loader: A callable that returns the fully loaded Plane.
+        filename (Optional): The file the plane is loaded from.
+        plane_info (Optional): The additional info from the plane, if it was
+        read along with the name.
+
+    """
+
+    __slots__ = ('loader', 'filename')
+
+    cache = None
+
+    def __init__(self, plane_name: str,
+                 loader: Callable[[], Plane],
+                 filename: Optional[str] = None,
+                 plane_info: List[Dict[str, str]] = None):
+        """Class Constructor."""
+        # Plane.__init__ is not called because it would build a blank
+        # checklist and mark the plane as loaded.
+        self.plane_name = plane_name
+        self.plane_info = plane_info
+        if self.plane_info is None:
+            self.plane_info = []
+        self.loader = loader
+        self.filename = filename
+        self._checklists = None
+        self._checklist_index = {}
+        self.duplicate_checklist_names = []
+
+    @property
+    def checklists(self):
+        """list of Checklist: The checklists, loaded on first access."""
+        checklists = self._checklists
+        if checklists is None:
+            checklists = self._load()
+        return checklists
+
+    @checklists.setter
+    def checklists(self, value: List[Checklist]):
+        Plane.checklists.fset(self, value)
+
+    @property
+    def loaded(self):
+        """bool: True once the checklists have been built."""
+        return self._checklists is not None
+
+    def _load(self):
+        """Call the loader and copy the checklists in.
+
+        Returns:
+            list of Checklist: The loaded checklists. They are returned
+            rather than read back because the cache may unload the plane
+            again as soon as it is told about the load.
+
+        """
+        checklists = self.loader().checklists
+        self.checklists = checklists
+        cache = LazyPlane.cache
+        if cache is not None:
+            cache.loaded(self, checklists)
+        return checklists
+
+    def materialize(self):
+        """Load the plane's data if it has not been loaded yet.
+
+        This counts as a use of the plane, so with a cache it also becomes
+        the most recently used plane.
+
+        """
+        if self._checklists is None:
+            self._load()
+        else:
+            cache = LazyPlane.cache
+            if cache is not None:
+                cache.touch(self)
+
+    def __reduce__(self):
+        """Pickle only what a scan reads, never the loaded checklists.
+
+        The manifest pickles the same LazyPlanes the library holds, so a
+        plane that was opened would otherwise come back loaded after a
+        restart, and every save would grow with the planes used.
+
+        """
+        return (LazyPlane, (self.plane_name, self.loader, self.filename,
+                            self.plane_info))
+
+    def unload(self):
+        """Drop the checklists so the plane is only a name again.
+
+        The plane_info is kept. The next use of the checklists calls the
+        loader again.
+
+        """
+        self._checklists = None
+        self._checklist_index = {}
+        self.duplicate_checklist_names = []
+
+    def get_checklist(self, name: str):
+        """Find a checklist by its name, loading the plane if needed.
+
+        Args:
+            name: The name of the checklist.
+
+        Returns:
+            Checklist: The checklist, or None if there isn't one by that name.
+
+        """
+        self.materialize()
+        return Plane.get_checklist(self, name)
+
+    def __repr__(self):
+        """Turn a class into a str for debugging purposes.
+
+        Returns:
+            A str representation of the LazyPlane.
+
+        """
+        if not self.loaded:
+            return ('{ LazyPlane Object: plane_name: ' + self.plane_name
+                    + ' | filename: ' + str(self.filename)
+                    + ' | not loaded }')
+        return Plane.__repr__(self)
+
+
+class FacetIndex():
+    """Groups planes by the values of their plane_info keys.
+
+    PlaneLibrary keeps one up to date as planes are added and removed, so
+    filtering a library by platform, version or any other info key is
+    answered from the index instead of going through every plane.
+
+    Attributes:
+        facets (dict of str: dict of str: set of Plane): The planes with each
+        value, keyed by info key and then by value.
+
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self.facets = {}  # type: Dict[str, Dict[str, Set[Plane]]]
+        # The pairs each plane was indexed under, as a LazyPlane's
+        # plane_info may be replaced when it is loaded.
+        self._pairs = {}  # type: Dict[int, List[Tuple[str, str]]]
+
+    def add(self, plane: Plane):
+        """Index a plane under each of its plane_info pairs.
+
+        Args:
+            plane: The plane to index.
+
+        """
+        pairs = [(key, value) for info_pair in plane.plane_info
+                 for key, value in info_pair.items()]
+        self._pairs[id(plane)] = pairs
+        for key, value in pairs:
+            self.facets.setdefault(key, {}).setdefault(value,
+                                                       set()).add(plane)
+
+    def remove(self, plane: Plane):
+        """Stop indexing a plane.
+
+        Args:
+            plane: The plane to remove.
+
+        """
+        for key, value in self._pairs.pop(id(plane), []):
+            values = self.facets.get(key)
+            if values is None or value not in values:
+                continue
+            values[value].discard(plane)
+            if not values[value]:
+                del values[value]
+                if not values:
+                    del self.facets[key]
+
+    def keys(self):
+        """Return every info key, sorted.
+
+        Returns:
+            list of str: The keys.
+
+        """
+        return sorted(self.facets)
+
+    def matching(self, selection: Dict[str, str]):
+        """Find the planes that have every key and value of a selection.
+
+        Args:
+            selection: The value wanted for each key.
+
+        Returns:
+            set of Plane: The matching planes, or None for an empty
+            selection, which every plane matches.
+
+        """
+        if not selection:
+            return None
+        groups = sorted((self.facets.get(key, {}).get(value, set())
+                         for key, value in selection.items()), key=len)
+        return groups[0].intersection(*groups[1:])
+
+    def counts(self, key: str, selection: Optional[Dict[str, str]] = None):
+        """Count the planes with each value of a key.
+
+        Args:
+            key: The info key to count the values of.
+            selection (Optional): Only count the planes that match the rest
+            of this selection. Its own value for key is ignored, so the
+            counts show what choosing another value would give.
+
+        Returns:
+            dict of str: int: The number of planes with each value.
+
+        """
+        others = dict(selection or {})
+        others.pop(key, None)
+        matched = self.matching(others)
+        values = self.facets.get(key, {})
+        if matched is None:
+            return {value: len(planes) for value, planes in values.items()}
+        counts = {}
+        for value, planes in values.items():
+            count = len(planes & matched)
+            if count:
+                counts[value] = count
+        return counts
+
+
+class PlaneLibrary():
+    """A collection of planes indexed by name and by the file they came from.
+
+    It iterates, indexes and measures like the list of planes it holds, so
+    it can be used anywhere a list of Plane was used before.
+
+    Attributes:
+        planes (list of Plane): The planes in the order they were added.
+        duplicate_plane_names (list of str): Names used by more than one
+        plane. get_by_name returns the last one added.
+        diagnostics (list of LoadDiagnostic): The files that were found but
+        could not be loaded.
+        facets (FacetIndex): The planes grouped by their plane_info values.
+
+    Args:
+        planes (Optional): Planes to add, without paths.
+
+    """
+
+    def __init__(self, planes: Optional[Iterable[Plane]] = None):
+        """Class Constructor."""
+        # The planes keyed by their place in the library. The dict keeps
+        # them in order, and a replaced plane takes over its place, so
+        # adding and removing a plane never goes through the whole list.
+        self._slots = {}  # type: Dict[int, Plane]
+        # Built from _slots when planes is read after a change.
+        self._planes = []  # type: Optional[List[Plane]]
+        self.duplicate_plane_names = []  # type: List[str]
+        self.diagnostics = []
+        self._by_name = {}  # type: Dict[str, List[Plane]]
+        self._by_path = {}  # type: Dict[str, Plane]
+        self._paths = {}  # type: Dict[int, str]
+        self.facets = FacetIndex()
+        # Each plane's place in the library, so filtered planes can be put
+        # back in order without going through the whole list.
+        self._order = {}  # type: Dict[int, int]
+        self._next_order = 0
+        if planes is not None:
+            for plane in planes:
+                self.add(plane)
+
+    @property
+    def planes(self):
+        """list of Plane: The planes in the order they were added."""
+        if self._planes is None:
+            self._planes = list(self._slots.values())
+        return self._planes
+
+    def __iter__(self):
+        """Iterate over the planes."""
+        return iter(self.planes)
+
+    def __len__(self):
+        """Return the number of planes."""
+        return len(self._slots)
+
+    def __getitem__(self, index):
+        """Return the plane at a position in the library."""
+        return self.planes[index]
+
+    def __contains__(self, plane):
+        """Check whether a plane is in the library."""
+        return self._slots.get(self._order.get(id(plane))) is plane
+
+    def __repr__(self):
+        """Turn a class into a str for debugging purposes.
+
+        Returns:
+            A str representation of the PlaneLibrary.
+
+        """
+        return ('{ PlaneLibrary Object: # of Planes: ' + str(len(self.planes))
+                + ' | duplicate_plane_names: '
+                + str(self.duplicate_plane_names) + ' }')
+
+    def _update_duplicates(self, name: str):
+        """Recheck whether a plane name is used more than once."""
+        duplicates = set(self.duplicate_plane_names)
+        if len(self._by_name.get(name, [])) > 1:
+            if name not in duplicates:
+                warnings.warn('More than one plane is named: ' + str(name),
+                              DuplicateNameWarning)
+            duplicates.add(name)
+        else:
+            duplicates.discard(name)
+        self.duplicate_plane_names = sorted(duplicates)
+
+    def add(self, plane: Plane, path: Optional[str] = None):
+        """Add a plane to the library.
+
+        If a plane from the same path is already in the library it is
+        replaced, keeping its position.
+
+        Args:
+            plane: The plane to add.
+            path (Optional): The file the plane was loaded from.
+
+        """
+        order = None
+        if path is not None:
+            path = os.path.abspath(path)
+            replaced = self._by_path.get(path)
+            if replaced is not None:
+                order = self._forget(replaced)
+            self._by_path[path] = plane
+            self._paths[id(plane)] = path
+        if order is None:
+            order = self._next_order
+            self._next_order += 1
+        self._slots[order] = plane
+        self._planes = None
+        self._order[id(plane)] = order
+        self._by_name.setdefault(plane.plane_name, []).append(plane)
+        self._update_duplicates(plane.plane_name)
+        self.facets.add(plane)
+
+    def remove(self, plane: Plane):
+        """Remove a plane from the library.
+
+        Args:
+            plane: The plane to remove.
+
+        """
+        if plane in self:
+            del self._slots[self._forget(plane)]
+            self._planes = None
+
+    def _forget(self, plane: Plane):
+        """Drop a plane from every index but leave its place in the order.
+
+        Returns:
+            int: The place the plane had, for the plane that replaces it.
+
+        """
+        named = self._by_name.get(plane.plane_name, [])
+        named = [known_plane for known_plane in named
+                 if known_plane is not plane]
+        if named:
+            self._by_name[plane.plane_name] = named
+        else:
+            self._by_name.pop(plane.plane_name, None)
+        self._update_duplicates(plane.plane_name)
+        self.facets.remove(plane)
+        path = self._paths.pop(id(plane), None)
+        if path is not None:
+            del self._by_path[path]
+        return self._order.pop(id(plane))
+
+    def remove_path(self, path: str):
+        """Remove the plane that was loaded from a file.
+
+        Args:
+            path: The file the plane was loaded from.
+
+        Returns:
+            Plane: The plane that was removed, or None.
+
+        """
+        plane = self._by_path.get(os.path.abspath(path))
+        if plane is not None:
+            self.remove(plane)
+        return plane
+
+    def get_by_name(self, name: str):
+        """Find a plane by its name.
+
+        Args:
+            name: The name of the plane.
+
+        Returns:
+            Plane: The plane, or None if there isn't one by that name.
+
+        """
+        named = self._by_name.get(name)
+        if not named:
+            return None
+        return named[-1]
+
+    def get_by_path(self, path: str):
+        """Find the plane that was loaded from a file.
+
+        Args:
+            path: The file the plane was loaded from.
+
+        Returns:
+            Plane: The plane, or None if no plane came from that file.
+
+        """
+        return self._by_path.get(os.path.abspath(path))
+
+    def path_of(self, plane: Plane):
+        """Return the file a plane was loaded from.
+
+        Args:
+            plane: A plane in the library.
+
+        Returns:
+            str: The absolute path of the file, or None.
+
+        """
+        return self._paths.get(id(plane))
+
+    def paths(self):
+        """Return the paths of every plane that came from a file.
+
+        Returns:
+            list of str: The absolute paths.
+
+        """
+        return list(self._by_path)
+
+    def filter(self, selection: Dict[str, str]):
+        """Find the planes whose plane_info has every key and value given.
+
+        The planes come from the facet index, so only the matches are
+        looked at.
+
+        Args:
+            selection: The value wanted for each info key, for example
+            {'game_platform': 'FlightGear'}.
+
+        Returns:
+            list of Plane: The matching planes, in library order. Every plane
+            for an empty selection.
+
+        """
+        matched = self.facets.matching(selection)
+        if matched is None:
+            return list(self.planes)
+        return sorted(matched, key=lambda plane: self._order[id(plane)])
+
+    def facet_counts(self, selection: Optional[Dict[str, str]] = None):
+        """Count the planes with each value of every info key.
+
+        Args:
+            selection (Optional): Only count the planes that match it. See
+            FacetIndex.counts.
+
+        Returns:
+            dict of str: dict of str: int: The counts keyed by info key and
+            then by value.
+
+        """
+        return {key: self.facets.counts(key, selection)
+                for key in self.facets.keys()}
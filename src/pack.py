@@ -0,0 +1,462 @@
+"""Compiles plane data files into a binary pack and reads them back.
+
+A pack holds a whole directory of plane files in one file so that a
+library can be opened without decoding any JSON. The layout is:
+
+    header
+    string offsets    (string_count + 1) x uint32
+    string data       utf-8 bytes of every unique string
+    source records    source_count x (path sid, mtime_ns, size, error sid)
+    plane records     plane_count x (name sid, first checklist, checklist
+                      count, first info, info count, source index)
+    info records      (key sid, value sid)
+    checklist records (name sid, message sid, first step, step count)
+    step records      (step number, title sid, text sid)
+
+Every string is stored once and referred to by its index (sid) in the
+string table. All integers are little endian. Every plane file in the
+directory has a source record. A file that failed to load has no plane
+record and its error sid points at its errors, encoded as JSON; for the
+other files the error sid is NO_ERROR.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import json
+import mmap
+import os
+import struct
+from functools import partial
+from os import listdir
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from fileio import load_plane_or_diagnostic
+from fileio import validate_plane_file
+from interning import STRING_POOL
+from model import Checklist
+from model import ChecklistStep
+from model import LazyPlane
+from model import Plane
+from model import PlaneLibrary
+from validator import LoadDiagnostic
+from validator import ValidationError
+
+PACK_MAGIC = b'FSCPACK\x00'
+PACK_VERSION = 3
+HEADER = struct.Struct('<8sIIIIIIII')
+STRING_OFFSET = struct.Struct('<I')
+SOURCE_RECORD = struct.Struct('<IqqI')
+PLANE_RECORD = struct.Struct('<IIIIII')
+INFO_RECORD = struct.Struct('<II')
+CHECKLIST_RECORD = struct.Struct('<IIII')
+STEP_RECORD = struct.Struct('<iII')
+NO_ERROR = 0xFFFFFFFF
+
+
+class PackError(Exception):
+    """Raised when a file is not a readable plane pack."""
+
+
+def list_plane_files(directory: str):
+    """List the plane files in a directory in the order they are packed.
+
+    Args:
+        directory: The directory to list.
+
+    Returns:
+        list of str: The paths of the plane files.
+
+    """
+    return [str(directory) + '/' + str(plane_file)
+            for plane_file in sorted(listdir(str(directory)))
+            if validate_plane_file(plane_file)]
+
+
+class _StringTable():
+    """Assigns each unique string an index while a pack is being built."""
+
+    def __init__(self):
+        """Class Constructor."""
+        self.ids = {}  # type: Dict[str, int]
+        self.encoded = []  # type: List[bytes]
+
+    def add(self, value: str):
+        """Return the index of a string, adding it if it is new."""
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.encoded)
+            self.ids[value] = string_id
+            self.encoded.append(value.encode('utf-8'))
+        return string_id
+
+
+def compile_pack(directory: str, pack_path: str):
+    """Compile every plane file in a directory into a pack.
+
+    Args:
+        directory: The directory containing the plane JSON files.
+        pack_path: Where to write the pack.
+
+    Files that fail to load are recorded with their errors instead of
+    stopping the compile.
+
+    Returns:
+        int: The number of planes written to the pack.
+
+    """
+    strings = _StringTable()
+    sources = []
+    planes = []
+    infos = []
+    checklists = []
+    steps = []
+    for plane_path in list_plane_files(directory):
+        file_stat = os.stat(plane_path)
+        plane = load_plane_or_diagnostic(plane_path)
+        path_id = strings.add(os.path.abspath(plane_path))
+        if isinstance(plane, LoadDiagnostic):
+            sources.append(SOURCE_RECORD.pack(
+                path_id, file_stat.st_mtime_ns, file_stat.st_size,
+                strings.add(json.dumps([error.to_dict()
+                                        for error in plane.errors]))))
+            continue
+        sources.append(SOURCE_RECORD.pack(
+            path_id, file_stat.st_mtime_ns, file_stat.st_size, NO_ERROR))
+        first_info = len(infos)
+        for info_pair in plane.plane_info:
+            for key, value in info_pair.items():
+                infos.append(INFO_RECORD.pack(strings.add(str(key)),
+                                              strings.add(str(value))))
+        first_checklist = len(checklists)
+        for checklist in plane.checklists:
+            first_step = len(steps)
+            for step in checklist.steps:
+                steps.append(STEP_RECORD.pack(step.step_number,
+                                              strings.add(step.step_title),
+                                              strings.add(step.step_text)))
+            checklists.append(CHECKLIST_RECORD.pack(
+                strings.add(checklist.name), strings.add(checklist.message),
+                first_step, len(steps) - first_step))
+        planes.append(PLANE_RECORD.pack(
+            strings.add(plane.plane_name),
+            first_checklist, len(checklists) - first_checklist,
+            first_info, len(infos) - first_info, len(sources) - 1))
+
+    string_offsets = []
+    position = 0
+    for encoded in strings.encoded:
+        string_offsets.append(STRING_OFFSET.pack(position))
+        position += len(encoded)
+    string_offsets.append(STRING_OFFSET.pack(position))
+
+    offsets_start = HEADER.size
+    data_start = offsets_start + STRING_OFFSET.size * len(string_offsets)
+    sources_start = data_start + position
+    planes_start = sources_start + SOURCE_RECORD.size * len(sources)
+    infos_start = planes_start + PLANE_RECORD.size * len(planes)
+    checklists_start = infos_start + INFO_RECORD.size * len(infos)
+    steps_start = checklists_start + CHECKLIST_RECORD.size * len(checklists)
+    header = HEADER.pack(PACK_MAGIC, PACK_VERSION, len(strings.encoded),
+                         len(sources), len(planes), data_start, sources_start,
+                         checklists_start, steps_start)
+
+    pack_dir = os.path.dirname(pack_path)
+    if pack_dir:
+        os.makedirs(pack_dir, exist_ok=True)
+    temp_path = pack_path + '.tmp'
+    with open(temp_path, 'wb') as pack_file:
+        pack_file.write(header)
+        for section in (string_offsets, strings.encoded, sources, planes,
+                        infos, checklists, steps):
+            pack_file.write(b''.join(section))
+    os.replace(temp_path, pack_path)
+    return len(planes)
+
+
+class PlanePack():
+    """A read only view of a compiled plane pack.
+
+    The pack is memory mapped and records are only decoded when they are
+    asked for, so opening a pack costs the same no matter how many steps
+    it holds.
+
+    Attributes:
+        pack_path (str): The path of the pack file.
+        closed (bool): True once the pack has been unmapped.
+        source_count (int): The number of plane files the pack was compiled
+        from, including the ones that failed to load.
+        plane_count (int): The number of planes in the pack.
+
+    Args:
+        pack_path: The path of the pack file.
+
+    """
+
+    def __init__(self, pack_path: str):
+        """Class Constructor."""
+        self.pack_path = pack_path
+        self.closed = False
+        # The LazyPlanes made by planes(), so close can stop them reading
+        # the map after it is gone.
+        self._lazy_planes = []  # type: List[LazyPlane]
+        with open(pack_path, 'rb') as pack_file:
+            self._data = mmap.mmap(pack_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        if len(self._data) < HEADER.size:
+            raise PackError(str(pack_path) + ' is not a plane pack.')
+        (magic, version, self._string_count, self.source_count,
+         self.plane_count,
+         self._data_start, self._sources_start, self._checklists_start,
+         self._steps_start) = HEADER.unpack_from(self._data, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise PackError(str(pack_path) + ' is not a version '
+                            + str(PACK_VERSION) + ' plane pack.')
+        self._planes_start = (self._sources_start
+                              + SOURCE_RECORD.size * self.source_count)
+        self._infos_start = (self._planes_start
+                             + PLANE_RECORD.size * self.plane_count)
+
+    def __reduce__(self):
+        """Pickle the pack by its path so LazyPlanes can be pickled."""
+        return (PlanePack, (self.pack_path,))
+
+    def close(self):
+        """Unmap the pack file and release the LazyPlanes built from it.
+
+        Each LazyPlane drops its loader, which holds the pack, so the map
+        is not kept alive by a library that has been replaced. A plane that
+        is already loaded keeps its checklists; one that is not raises
+        PackError if it is used.
+
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for plane in self._lazy_planes:
+            plane.loader = partial(_closed_pack_loader, self.pack_path)
+        self._lazy_planes = []
+        self._data.close()
+
+    def string(self, string_id: int):
+        """Decode a string from the string table.
+
+        Args:
+            string_id: The index of the string.
+
+        Returns:
+            str: The decoded string.
+
+        """
+        start, end = struct.unpack_from(
+            '<II', self._data, HEADER.size + STRING_OFFSET.size * string_id)
+        return str(self._data[self._data_start + start:
+                              self._data_start + end], 'utf-8')
+
+    def source(self, source_index: int):
+        """Return a source file recorded in the pack.
+
+        Args:
+            source_index: The index of the source record.
+
+        Returns:
+            tuple of (str, int, int): The path, mtime_ns and size of the plane
+            file when the pack was compiled.
+
+        """
+        path_id, mtime_ns, size = SOURCE_RECORD.unpack_from(
+            self._data,
+            self._sources_start + SOURCE_RECORD.size * source_index)[:3]
+        return self.string(path_id), mtime_ns, size
+
+    def diagnostic(self, source_index: int):
+        """Return why a source file failed to load when the pack was compiled.
+
+        Args:
+            source_index: The index of the source record.
+
+        Returns:
+            LoadDiagnostic: The errors found in the file, or None if it loaded.
+
+        """
+        path_id, error_id = SOURCE_RECORD.unpack_from(
+            self._data,
+            self._sources_start + SOURCE_RECORD.size * source_index)[::3]
+        if error_id == NO_ERROR:
+            return None
+        return LoadDiagnostic(self.string(path_id),
+                              [ValidationError(error['path'], error['message'])
+                               for error in json.loads(self.string(error_id))])
+
+    def plane_name(self, plane_index: int):
+        """Return the name of a plane without building the plane.
+
+        Args:
+            plane_index: The index of the plane in the pack.
+
+        Returns:
+            str: The name of the plane.
+
+        """
+        name_id = PLANE_RECORD.unpack_from(
+            self._data, self._planes_start + PLANE_RECORD.size * plane_index)[0]
+        return self.string(name_id)
+
+    def plane_info(self, plane_index: int):
+        """Build the plane_info of one plane without its checklists.
+
+        Args:
+            plane_index: The index of the plane in the pack.
+
+        Returns:
+            list of dict: The plane's info pairs.
+
+        """
+        intern = STRING_POOL.intern
+        first_info, info_count = PLANE_RECORD.unpack_from(
+            self._data,
+            self._planes_start + PLANE_RECORD.size * plane_index)[3:5]
+        plane_info = []
+        for info_index in range(first_info, first_info + info_count):
+            key_id, value_id = INFO_RECORD.unpack_from(
+                self._data, self._infos_start + INFO_RECORD.size * info_index)
+            plane_info.append({intern(self.string(key_id)):
+                               intern(self.string(value_id))})
+        return plane_info
+
+    def build_plane(self, plane_index: int):
+        """Build a full Plane from the records of one plane in the pack.
+
+        Args:
+            plane_index: The index of the plane in the pack.
+
+        Returns:
+            Plane: The plane with all of its checklists.
+
+        """
+        intern = STRING_POOL.intern
+        name_id, first_checklist, checklist_count = PLANE_RECORD.unpack_from(
+            self._data,
+            self._planes_start + PLANE_RECORD.size * plane_index)[:3]
+        plane_info = self.plane_info(plane_index)
+        checklists = []
+        for checklist_index in range(first_checklist,
+                                     first_checklist + checklist_count):
+            (checklist_name_id, message_id, first_step,
+             step_count) = CHECKLIST_RECORD.unpack_from(
+                 self._data,
+                 self._checklists_start
+                 + CHECKLIST_RECORD.size * checklist_index)
+            steps = []
+            for step_number, title_id, text_id in STEP_RECORD.iter_unpack(
+                    self._data[self._steps_start
+                               + STEP_RECORD.size * first_step:
+                               self._steps_start
+                               + STEP_RECORD.size * (first_step
+                                                     + step_count)]):
+                steps.append(ChecklistStep(step_number,
+                                           intern(self.string(title_id)),
+                                           intern(self.string(text_id))))
+            checklists.append(Checklist(intern(self.string(checklist_name_id)),
+                                        intern(self.string(message_id)),
+                                        steps))
+        return Plane(intern(self.string(name_id)), plane_info, checklists)
+
+    def iter_planes(self):
+        """Build the planes in the pack one at a time.
+
+        Yields:
+            Plane: Each plane, built fresh from the pack.
+
+        """
+        for plane_index in range(self.plane_count):
+            yield self.build_plane(plane_index)
+
+    def planes(self):
+        """Create a LazyPlane for every plane in the pack.
+
+        Returns:
+            PlaneLibrary: The LazyPlanes, built from the pack on first use,
+            with a LoadDiagnostic for every file that failed to load.
+
+        """
+        library = PlaneLibrary()
+        for source_index in range(self.source_count):
+            diagnostic = self.diagnostic(source_index)
+            if diagnostic is not None:
+                library.diagnostics.append(diagnostic)
+        for plane_index in range(self.plane_count):
+            source_index = PLANE_RECORD.unpack_from(
+                self._data,
+                self._planes_start + PLANE_RECORD.size * plane_index)[5]
+            source_path = self.source(source_index)[0]
+            plane = LazyPlane(self.plane_name(plane_index),
+                              partial(self.build_plane, plane_index),
+                              source_path, self.plane_info(plane_index))
+            self._lazy_planes.append(plane)
+            library.add(plane, source_path)
+        return library
+
+    def is_stale(self, directory: str):
+        """Check whether the pack is out of date with a directory.
+
+        Args:
+            directory: The directory the pack was compiled from.
+
+        Returns:
+            bool: True if a plane file was added, removed or changed.
+
+        """
+        plane_paths = list_plane_files(directory)
+        if len(plane_paths) != self.source_count:
+            return True
+        for source_index, plane_path in enumerate(plane_paths):
+            source_path, mtime_ns, size = self.source(source_index)
+            if source_path != os.path.abspath(plane_path):
+                return True
+            try:
+                file_stat = os.stat(plane_path)
+            except OSError:
+                return True
+            if file_stat.st_mtime_ns != mtime_ns or file_stat.st_size != size:
+                return True
+        return False
+
+
+def _closed_pack_loader(pack_path: str):
+    """Stand in for the loader of a LazyPlane whose pack was closed."""
+    raise PackError(str(pack_path) + ' was closed before the plane was '
+                    'loaded.')
+
+
+def load_pack(directory: str, pack_path: str,
+              current: Optional[PlanePack] = None):
+    """Open the pack for a directory, compiling it first if it is stale.
+
+    The pack is closed before it is compiled again, because a file that
+    is still mapped cannot be replaced on every platform.
+
+    Args:
+        directory: The directory containing the plane JSON files.
+        pack_path: The path of the pack file.
+        current (Optional): The pack already open for the directory. It is
+        returned if it is up to date and closed, releasing its planes, if
+        it is not.
+
+    Returns:
+        PlanePack: An up to date pack for the directory.
+
+    """
+    pack = current
+    if pack is None:
+        try:
+            pack = PlanePack(pack_path)
+        except (OSError, ValueError, PackError):
+            pack = None
+    if pack is not None and not pack.is_stale(directory):
+        return pack
+    if pack is not None:
+        pack.close()
+    compile_pack(directory, pack_path)
+    return PlanePack(pack_path)
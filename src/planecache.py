@@ -0,0 +1,192 @@
+"""Keeps only the most recently used planes loaded.
+
+A LazyPlane stays loaded once it has been opened, so on a cockpit box that
+pages through a large library the memory used only ever grows. A
+PlaneCache installed on LazyPlane is told about every load and every use,
+and once the loaded planes go over its budget it unloads the least
+recently used ones back to their name and plane_info. A plane that was
+unloaded is loaded again by its loader, from its plane file or the pack,
+the next time it is used.
+
+The budget is a number of planes, an estimate of the bytes their
+checklists use, or both. The plane loaded or used last is never unloaded,
+even if it is over the budget by itself.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import List
+from typing import Optional
+
+from model import Checklist
+from model import LazyPlane
+from model import StepColumns
+
+
+def estimate_checklist_bytes(checklists: List[Checklist]):
+    """Estimate the memory used by a plane's checklists.
+
+    Every string is counted as if only this plane used it, so with the
+    string pool sharing them between planes the estimate errs high.
+
+    Args:
+        checklists: The checklists of a loaded plane.
+
+    Returns:
+        int: The estimated size in bytes.
+
+    """
+    size = sys.getsizeof
+    total = size(checklists)
+    for checklist in checklists:
+        total += (size(checklist) + size(checklist.name)
+                  + size(checklist.message))
+        steps = checklist.steps
+        total += size(steps)
+        if isinstance(steps, StepColumns):
+            total += (size(steps.numbers) + size(steps.titles)
+                      + size(steps.texts))
+            total += sum(size(title) for title in steps.titles)
+            total += sum(size(text) for text in steps.texts)
+        else:
+            for step in steps:
+                total += (size(step) + size(step.step_title)
+                          + size(step.step_text))
+    return total
+
+
+class PlaneCache():
+    """A least recently used cache of loaded LazyPlanes.
+
+    Only one cache is used at a time, since it is installed on the
+    LazyPlane class. The methods are locked so planes can be loaded from
+    other threads while the menus use them.
+
+    Attributes:
+        max_planes (int): The most planes kept loaded, or None for no limit.
+        max_bytes (int): The most estimated bytes kept loaded, or None for
+        no limit.
+        resident_bytes (int): The estimated bytes of the loaded planes.
+        hits (int): Uses of a plane that was already loaded.
+        misses (int): Uses that had to load the plane first.
+        evictions (int): Planes unloaded to stay within the budget.
+
+    Args:
+        max_planes (Optional): The most planes kept loaded.
+        max_bytes (Optional): The most estimated bytes kept loaded.
+
+    """
+
+    def __init__(self, max_planes: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """Class Constructor."""
+        self.max_planes = max_planes
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Loaded planes and their estimated sizes, least recently used
+        # first. Keyed by id because Planes are not hashable by value.
+        self._planes = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of planes the cache holds loaded."""
+        return len(self._planes)
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the PlaneCache.
+
+        """
+        return ('{ planes: ' + str(len(self._planes)) + ' | resident_bytes: '
+                + str(self.resident_bytes) + ' | hits: ' + str(self.hits)
+                + ' | misses: ' + str(self.misses) + ' | evictions: '
+                + str(self.evictions) + ' }')
+
+    def install(self):
+        """Make this the cache every LazyPlane reports to.
+
+        Returns:
+            PlaneCache: The cache, so it can be created and installed at
+            once.
+
+        """
+        LazyPlane.cache = self
+        return self
+
+    def uninstall(self):
+        """Stop caching. The planes loaded so far stay loaded."""
+        if LazyPlane.cache is self:
+            LazyPlane.cache = None
+        with self._lock:
+            self._planes.clear()
+            self.resident_bytes = 0
+
+    def loaded(self, plane: LazyPlane, checklists: List[Checklist]):
+        """Record that a plane was loaded and unload others if needed.
+
+        Args:
+            plane: The plane that was loaded.
+            checklists: Its checklists, to estimate its size from.
+
+        """
+        plane_bytes = estimate_checklist_bytes(checklists)
+        with self._lock:
+            self.misses += 1
+            self._add(plane, plane_bytes)
+
+    def touch(self, plane: LazyPlane):
+        """Record a use of a loaded plane, making it the most recent.
+
+        Args:
+            plane: The plane that was used.
+
+        """
+        with self._lock:
+            self.hits += 1
+            if id(plane) in self._planes:
+                self._planes.move_to_end(id(plane))
+                return
+        # The plane was loaded before the cache was installed.
+        plane_bytes = estimate_checklist_bytes(plane.checklists)
+        with self._lock:
+            self._add(plane, plane_bytes)
+
+    def _add(self, plane: LazyPlane, plane_bytes: int):
+        """Hold a loaded plane as the most recent and enforce the budget."""
+        previous = self._planes.pop(id(plane), None)
+        if previous is not None:
+            # Loaded twice by two threads at once.
+            self.resident_bytes -= previous[1]
+        self._planes[id(plane)] = (plane, plane_bytes)
+        self.resident_bytes += plane_bytes
+        self._evict()
+
+    def _evict(self):
+        """Unload the least recently used planes until within the budget."""
+        while len(self._planes) > 1 and self._over_budget():
+            plane, plane_bytes = self._planes.popitem(last=False)[1]
+            self.resident_bytes -= plane_bytes
+            self.evictions += 1
+            plane.unload()
+
+    def _over_budget(self):
+        """Check whether the loaded planes are over either limit."""
+        if (self.max_planes is not None
+                and len(self._planes) > self.max_planes):
+            return True
+        return (self.max_bytes is not None
+                and self.resident_bytes > self.max_bytes)
+
+    def reset(self):
+        """Zero all of the counters."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
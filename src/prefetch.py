@@ -0,0 +1,344 @@
+"""Uses the time spent waiting at a prompt to get the next screen ready.
+
+While PyInquirer waits for a key press the main thread has nothing to do,
+and picking a plane or a checklist then pays for loading it and building
+its prompt all at once. Before each prompt is shown the menus tell a
+PrefetchWorker what is likely to be picked next: the plane the cursor
+starts on, the planes used most recently and, on the checklist page, the
+plane's checklists. A background thread loads those planes and builds
+their checklists' prompt choices. When it has nothing queued it loads the
+plane files the DirectoryWatcher has seen change, so a broken file is
+already known about, and a fixed one already checked, when the menu comes
+back round.
+
+Every task is one plane or one checklist, and a new request drops what is
+still queued from the last one, so the worker never falls behind the
+user. Once a choice is made the checklist being built is abandoned and a
+plane being loaded is waited for, so nothing the worker does afterwards
+can make the plane cache unload the chosen plane.
+
+A running task only gives the GIL up every sys.getswitchinterval
+seconds when it is made to, so the worker gives it up itself between
+tasks and between chunks of a checklist's steps, which keeps the prompt
+thread's ticks on time.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import collections
+import os
+import threading
+import time
+from functools import partial
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+
+from fileio import load_plane_file
+from fileio import load_plane_or_diagnostic
+from manifest import LibraryManifest
+from manifest import hash_file
+from model import Checklist
+from model import LazyPlane
+from model import Plane
+from watcher import FILE_DELETED
+from watcher import DirectoryWatcher
+
+PREFETCH_PLANES = 4
+IDLE_INTERVAL = 0.5
+STOP_TIMEOUT = 5.0
+
+
+class _TaskCancelled(Exception):
+    """Raised between chunks of a task to abandon it after cancel."""
+
+
+class PrefetchWorker():
+    """Loads planes and builds prompt choices on a background thread.
+
+    The counters are only statistics. They are updated by the worker
+    thread without a lock.
+
+    Attributes:
+        max_planes (int): The most planes loaded for one prefetch_planes
+        call. With a PlaneCache installed it is kept below the cache's
+        plane budget, so prefetching never unloads the plane in use.
+        idle_interval (float): How often, in seconds, the watcher is checked
+        for changed files while nothing is queued.
+        planes_loaded (int): Planes loaded ahead of time.
+        payloads_built (int): Checklists whose prompt choices were built
+        ahead of time.
+        files_validated (int): Changed plane files checked ahead of time.
+        errors (int): Prefetched planes that failed to load. The error is
+        shown when the plane is picked.
+
+    Args:
+        warm_checklist (Optional): Builds the prompt choices for a
+        Checklist, normally CHECKLIST_PAYLOAD_CACHE.warm. It is given the
+        checklist and a function to call between chunks of the work, and
+        returns True if it built them. Without it only planes are loaded.
+        watcher (Optional): The watcher whose changed files are loaded
+        while the worker is idle.
+        max_planes (Optional): See max_planes.
+        idle_interval (Optional): See idle_interval.
+
+    """
+
+    def __init__(self,
+                 warm_checklist: Optional[Callable[[Checklist, Callable],
+                                                   bool]] = None,
+                 watcher: Optional[DirectoryWatcher] = None,
+                 max_planes: int = PREFETCH_PLANES,
+                 idle_interval: float = IDLE_INTERVAL):
+        """Class Constructor."""
+        self.max_planes = max_planes
+        self.idle_interval = idle_interval
+        self.planes_loaded = 0
+        self.payloads_built = 0
+        self.files_validated = 0
+        self.errors = 0
+        self._warm_checklist = warm_checklist
+        self._watcher = watcher
+        # (task, plane the task works on)
+        self._tasks = collections.deque()  # type: collections.deque
+        self._active = None  # type: Optional[Plane]
+        # Set by cancel so the running task stops at its next pause.
+        self._cancelled = False
+        # path: (stat before the load, content hash, LazyPlane or
+        # LoadDiagnostic)
+        self._validated = {}  # type: Dict[str, tuple]
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the PrefetchWorker.
+
+        """
+        return ('{ planes_loaded: ' + str(self.planes_loaded)
+                + ' | payloads_built: ' + str(self.payloads_built)
+                + ' | files_validated: ' + str(self.files_validated)
+                + ' | errors: ' + str(self.errors) + ' }')
+
+    def start(self):
+        """Start the background thread.
+
+        Returns:
+            PrefetchWorker: This worker, so it can be chained.
+
+        """
+        if self._thread is not None:
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='prefetch',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """Drop the queued tasks and wait for the running one to finish.
+
+        Args:
+            timeout (Optional): The longest time to wait, in seconds. The
+            thread is a daemon, so one stuck on a slow file does not keep
+            the program from exiting.
+
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._tasks.clear()
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def prefetch_planes(self, planes: Iterable[Plane]):
+        """Replace the queued tasks with loading planes that may be picked.
+
+        The first checklist of each plane, which the cursor starts on, has
+        its prompt choices built too.
+
+        Args:
+            planes: The planes, most likely first. Only the first
+            max_planes different ones are loaded.
+
+        """
+        limit = self.max_planes
+        cache = LazyPlane.cache
+        if cache is not None and cache.max_planes is not None:
+            limit = min(limit, cache.max_planes - 1)
+        tasks = []
+        seen = set()
+        for plane in planes:
+            if len(seen) >= limit:
+                break
+            if plane is None or id(plane) in seen:
+                continue
+            seen.add(id(plane))
+            tasks.append((self._load_plane, plane))
+        self._replace_tasks(tasks)
+
+    def prefetch_checklists(self, plane: Plane):
+        """Replace the queued tasks with building a plane's prompt choices.
+
+        Args:
+            plane: The plane whose checklist page is about to be shown. The
+            checklists are warmed in the order they are listed.
+
+        """
+        if self._warm_checklist is None:
+            self._replace_tasks([])
+            return
+        self._replace_tasks([(self._warm_payload, plane, checklist)
+                             for checklist in plane.checklists])
+
+    def cancel(self):
+        """Drop the queued tasks because the user has made a choice.
+
+        A checklist whose prompt choices are being built is abandoned at
+        the next chunk. A plane that is being loaded is waited for, so it
+        is not loaded a second time if it was the one picked, and so no
+        other plane's load can make the plane cache unload the one that
+        was.
+
+        """
+        with self._condition:
+            self._tasks.clear()
+            self._cancelled = True
+            while self._active is not None:
+                self._condition.wait()
+
+    def store_validated(self, manifest: LibraryManifest):
+        """Hand the changed files checked ahead of time to the manifest.
+
+        Call it before apply_file_changes, which then finds the files with
+        manifest.lookup instead of loading them again. A file that changed
+        again after it was checked is left for apply_file_changes. The
+        stat and hash taken by the worker are stored with each result, so
+        nothing is read again here, and the files are not counted as
+        reparsed.
+
+        Args:
+            manifest: The manifest apply_file_changes is given.
+
+        """
+        with self._condition:
+            validated = self._validated
+            self._validated = {}
+        for path, (loaded_stat, digest, result) in validated.items():
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            if ((file_stat.st_size, file_stat.st_mtime_ns)
+                    == (loaded_stat.st_size, loaded_stat.st_mtime_ns)):
+                manifest.store(path, result, loaded_stat, digest,
+                               reparsed=False)
+
+    def _replace_tasks(self, tasks: list):
+        """Swap the queued tasks for new ones and wake the worker."""
+        with self._condition:
+            self._tasks.clear()
+            self._tasks.extend(tasks)
+            self._condition.notify_all()
+
+    def _run(self):
+        """Run tasks until stopped, checking for changed files when idle."""
+        while True:
+            with self._condition:
+                if not self._tasks and not self._stopping:
+                    self._condition.wait(self.idle_interval)
+                if self._stopping:
+                    return
+                task = self._tasks.popleft() if self._tasks else None
+                if task is not None:
+                    self._active = task[1]
+                    self._cancelled = False
+            if task is None:
+                if self._watcher is not None:
+                    self._validate_changes()
+                continue
+            try:
+                task[0](*task[1:])
+            except _TaskCancelled:
+                pass
+            except Exception:  # pylint: disable=broad-except
+                # The same error is raised again, and shown, if the user
+                # picks this plane.
+                self.errors += 1
+            finally:
+                with self._condition:
+                    self._active = None
+                    self._condition.notify_all()
+            self._yield()
+
+    @staticmethod
+    def _yield():
+        """Give the GIL up so a waiting prompt thread can run now."""
+        time.sleep(0)
+
+    def _pause(self):
+        """Yield between chunks of a task, stopping it if it was cancelled.
+
+        Raises:
+            _TaskCancelled: If cancel was called since the task started.
+
+        """
+        self._yield()
+        if self._cancelled:
+            raise _TaskCancelled()
+
+    def _load_plane(self, plane: Plane):
+        """Load a plane and build the choices of its first checklist."""
+        if isinstance(plane, LazyPlane) and not plane.loaded:
+            plane.materialize()
+            self.planes_loaded += 1
+        if self._warm_checklist is not None and plane.checklists:
+            self._warm_payload(plane, plane.checklists[0])
+
+    def _warm_payload(self, plane: Plane, checklist: Checklist):
+        """Build the prompt choices for one checklist of a plane."""
+        if self._warm_checklist(checklist, self._pause):
+            self.payloads_built += 1
+
+    def _validate_changes(self):
+        """Load the changed plane files the watcher has seen settle."""
+        for path, change in self._watcher.peek().items():
+            with self._condition:
+                if self._tasks or self._stopping:
+                    # The user's next choice comes first.
+                    return
+            if change == FILE_DELETED or not path.endswith('.json'):
+                continue
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            file_key = (file_stat.st_size, file_stat.st_mtime_ns)
+            with self._condition:
+                previous = self._validated.get(path)
+            if (previous is not None
+                    and (previous[0].st_size, previous[0].st_mtime_ns)
+                    == file_key):
+                continue
+            # Loaded in full, not through a LazyPlane, so the plane cache
+            # never unloads the user's planes to make room for it. Only the
+            # outcome is kept: a good plane is handed over unloaded, as a
+            # lazy scan would.
+            result = load_plane_or_diagnostic(path)
+            if isinstance(result, Plane):
+                result = LazyPlane(result.plane_name,
+                                   partial(load_plane_file, path), path,
+                                   result.plane_info)
+            try:
+                digest = hash_file(path)
+            except OSError:
+                continue
+            with self._condition:
+                self._validated[path] = (file_stat, digest, result)
+            self.files_validated += 1
@@ -0,0 +1,241 @@
+"""Lightweight timing spans for finding where the time goes.
+
+Code marks the work it does with span():
+
+    with span('fileio.json_decode'):
+        plane_data = json.load(plane_data_file)
+
+While profiling is off span() hands back one shared object whose
+__enter__ and __exit__ do nothing, so the spans can stay in the hot paths.
+Once enable() has been called every span is timed, and at exit a summary
+table is printed, a Chrome trace-event file can be written (open it in
+chrome://tracing or https://ui.perfetto.dev) and the whole session can be
+run under cProfile.
+
+Profiling can also be turned on with environment variables:
+    FLYSIMCHK_PROFILE=1        print the summary table at exit
+    FLYSIMCHK_TRACE=FILE       also write a Chrome trace to FILE
+    FLYSIMCHK_CPROFILE=FILE    also write cProfile stats to FILE
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+
+PROFILE_VARIABLE = 'FLYSIMCHK_PROFILE'
+TRACE_VARIABLE = 'FLYSIMCHK_TRACE'
+CPROFILE_VARIABLE = 'FLYSIMCHK_CPROFILE'
+
+
+class Profiler():
+    """Collects the spans recorded while profiling is on.
+
+    Attributes:
+        trace_path (str): Where to write the Chrome trace, or None.
+        cprofile_path (str): Where to write the cProfile stats, or None.
+        totals (dict of str: list): The count, total and longest duration in
+        nanoseconds of each span name.
+
+    Args:
+        trace_path (Optional): See trace_path.
+        cprofile_path (Optional): See cprofile_path.
+
+    """
+
+    def __init__(self, trace_path: Optional[str] = None,
+                 cprofile_path: Optional[str] = None):
+        """Class Constructor."""
+        self.trace_path = trace_path
+        self.cprofile_path = cprofile_path
+        self.totals = {}  # type: Dict[str, List[int]]
+        self._events = []  # type: List[tuple]
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._cprofile = None
+        if cprofile_path is not None:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def record(self, name: str, start: int, end: int,
+               detail: Optional[str] = None):
+        """Record a finished span.
+
+        Args:
+            name: The name of the span.
+            start: When it started, from time.perf_counter_ns.
+            end: When it ended, from time.perf_counter_ns.
+            detail (Optional): Extra information, like a file name.
+
+        """
+        duration = end - start
+        with self._lock:
+            total = self.totals.get(name)
+            if total is None:
+                self.totals[name] = [1, duration, duration]
+            else:
+                total[0] += 1
+                total[1] += duration
+                if duration > total[2]:
+                    total[2] = duration
+            if self.trace_path is not None:
+                self._events.append((name, start, duration,
+                                     threading.get_ident(), detail))
+
+    def summary(self):
+        """Build the summary table of the recorded spans.
+
+        Returns:
+            str: One row per span name, the slowest in total first.
+
+        """
+        lines = ['{:<36} {:>8} {:>12} {:>10} {:>10}'.format(
+            'span', 'count', 'total ms', 'mean ms', 'max ms')]
+        for name, (count, total, longest) in sorted(
+                self.totals.items(), key=lambda item: -item[1][1]):
+            lines.append('{:<36} {:>8} {:>12.3f} {:>10.3f} {:>10.3f}'.format(
+                name, count, total / 1e6, total / count / 1e6, longest / 1e6))
+        return '\n'.join(lines)
+
+    def write_trace(self, trace_path: str):
+        """Write the recorded spans as a Chrome trace-event JSON file.
+
+        Args:
+            trace_path: Where to write the trace.
+
+        """
+        import json
+        process_id = os.getpid()
+        events = []
+        for name, start, duration, thread_id, detail in self._events:
+            event = {'name': name, 'cat': name.split('.')[0], 'ph': 'X',
+                     'ts': (start - self._origin) / 1000,
+                     'dur': duration / 1000,
+                     'pid': process_id, 'tid': thread_id}
+            if detail is not None:
+                event['args'] = {'detail': detail}
+            events.append(event)
+        with open(trace_path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                      trace_file)
+
+    def finish(self):
+        """Stop cProfile and write out and print everything collected."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+            print('cProfile stats written to ' + self.cprofile_path,
+                  file=sys.stderr)
+        if self.trace_path is not None:
+            self.write_trace(self.trace_path)
+            print('Chrome trace written to ' + self.trace_path,
+                  file=sys.stderr)
+        print(self.summary(), file=sys.stderr)
+
+
+class _Span():
+    """Times the code inside a with block."""
+
+    __slots__ = ('name', 'detail', 'start')
+
+    def __init__(self, name: str, detail: Optional[str]):
+        """Class Constructor."""
+        self.name = name
+        self.detail = detail
+        self.start = 0
+
+    def __enter__(self):
+        """Start the clock."""
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the clock and record the span."""
+        if _PROFILER is not None:
+            _PROFILER.record(self.name, self.start, time.perf_counter_ns(),
+                             self.detail)
+
+
+class _NullSpan():
+    """Stands in for a span while profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        """Do nothing."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Do nothing."""
+
+
+_NULL_SPAN = _NullSpan()
+_PROFILER = None  # type: Optional[Profiler]
+
+
+def span(name: str, detail: Optional[str] = None):
+    """Mark a piece of work to be timed while profiling is on.
+
+    Args:
+        name: The name of the span, as 'module.what'.
+        detail (Optional): Extra information for the trace, like a file
+        name. Left out of the summary table.
+
+    Returns:
+        A context manager that times its with block.
+
+    """
+    if _PROFILER is None:
+        return _NULL_SPAN
+    return _Span(name, detail)
+
+
+def is_enabled():
+    """Check whether profiling is on."""
+    return _PROFILER is not None
+
+
+def enable(trace_path: Optional[str] = None,
+           cprofile_path: Optional[str] = None):
+    """Turn profiling on for the rest of the process.
+
+    The summary is printed to stderr at exit, after the trace and cProfile
+    stats have been written.
+
+    Args:
+        trace_path (Optional): Also write a Chrome trace to this file.
+        cprofile_path (Optional): Also run cProfile and write its stats to
+        this file. They can be read with pstats or snakeviz.
+
+    Returns:
+        Profiler: The profiler collecting the spans.
+
+    """
+    global _PROFILER
+    if _PROFILER is None:
+        _PROFILER = Profiler(trace_path, cprofile_path)
+        atexit.register(_PROFILER.finish)
+    return _PROFILER
+
+
+def enable_from_environment():
+    """Turn profiling on if the environment variables ask for it.
+
+    Returns:
+        Profiler: The profiler, or None when profiling stays off.
+
+    """
+    trace_path = os.environ.get(TRACE_VARIABLE) or None
+    cprofile_path = os.environ.get(CPROFILE_VARIABLE) or None
+    wanted = os.environ.get(PROFILE_VARIABLE, '') not in ('', '0')
+    if wanted or trace_path or cprofile_path:
+        return enable(trace_path, cprofile_path)
+    return None
@@ -0,0 +1,578 @@
+"""Tracks which steps of a checklist have been completed.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import json
+import os
+import queue
+import threading
+import time
+import warnings
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the journal is not locked.
+    fcntl = None
+
+# How long the writer waits before retrying records it failed to write.
+RETRY_INTERVAL = 1.0
+
+
+class JournalWriteWarning(UserWarning):
+    """Warns that the progress journal could not be written."""
+
+
+class ChecklistProgress():
+    """The completion state of one checklist stored as a bitset.
+
+    Bit n is set when the step at index n of the checklist's steps is
+    checked. Steps are tracked by position rather than by text, so steps
+    that share text like "ON" or "CHECK" are kept apart.
+
+    Attributes:
+        step_count (int): The number of steps in the checklist.
+        checked_count (int): The number of steps that are checked.
+
+    Args:
+        step_count: The number of steps in the checklist.
+
+    """
+
+    def __init__(self, step_count: int):
+        """Class Constructor."""
+        self.step_count = step_count
+        self.checked_count = 0
+        self._bits = bytearray((step_count + 7) // 8)
+
+    def __len__(self):
+        """Return the number of steps."""
+        return self.step_count
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the ChecklistProgress.
+
+        """
+        return (str(self.checked_count) + ' of ' + str(self.step_count)
+                + ' complete')
+
+    def is_checked(self, index: int):
+        """Check whether a step is checked.
+
+        Args:
+            index: The position of the step.
+
+        Returns:
+            bool: True if the step is checked.
+
+        """
+        return bool(self._bits[index >> 3] & (1 << (index & 7)))
+
+    def set_checked(self, index: int, checked: bool = True):
+        """Check or uncheck a step.
+
+        Args:
+            index: The position of the step.
+            checked (Optional): The new state of the step.
+
+        Returns:
+            bool: True if the state of the step changed.
+
+        """
+        if not 0 <= index < self.step_count:
+            raise IndexError('Step index out of range: ' + str(index))
+        mask = 1 << (index & 7)
+        was_checked = bool(self._bits[index >> 3] & mask)
+        if was_checked == checked:
+            return False
+        self._bits[index >> 3] ^= mask
+        self.checked_count += 1 if checked else -1
+        return True
+
+    def toggle(self, index: int):
+        """Flip the state of a step.
+
+        Args:
+            index: The position of the step.
+
+        Returns:
+            bool: The new state of the step.
+
+        """
+        checked = not self.is_checked(index)
+        self.set_checked(index, checked)
+        return checked
+
+    def is_complete(self):
+        """Check whether every step is checked.
+
+        Returns:
+            bool: True if every step is checked.
+
+        """
+        return self.checked_count == self.step_count
+
+    def next_unchecked(self, start: int = 0):
+        """Find the first unchecked step at or after a position.
+
+        Args:
+            start (Optional): The position to start looking from.
+
+        Returns:
+            int: The position of the step, or None if they are all checked.
+
+        """
+        index = start
+        # Walk bit by bit up to the next byte boundary, then skip whole
+        # bytes that are fully checked.
+        while index < self.step_count and index & 7:
+            if not self.is_checked(index):
+                return index
+            index += 1
+        if index >= self.step_count:
+            return None
+        byte_index = index >> 3
+        remaining = self._bits[byte_index:]
+        byte_index += len(remaining) - len(remaining.lstrip(b'\xff'))
+        index = byte_index << 3
+        while index < self.step_count:
+            if not self.is_checked(index):
+                return index
+            index += 1
+        return None
+
+    def checked_indexes(self):
+        """Iterate over the positions of the checked steps.
+
+        Yields:
+            int: The position of each checked step, in order.
+
+        """
+        for byte_index, byte in enumerate(self._bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (byte_index << 3) | bit
+
+    def update_from(self, checked_indexes: Optional[Iterable[int]]):
+        """Make the checked steps exactly the ones given.
+
+        Args:
+            checked_indexes: The positions of every step that is now checked.
+
+        Returns:
+            list of int: The positions of the steps whose state changed.
+
+        """
+        wanted = set(checked_indexes or [])
+        changed = []
+        for index in list(self.checked_indexes()):
+            if index not in wanted:
+                self.set_checked(index, False)
+                changed.append(index)
+        for index in sorted(wanted):
+            if self.set_checked(index, True):
+                changed.append(index)
+        return changed
+
+    def clear(self):
+        """Uncheck every step."""
+        self._bits = bytearray(len(self._bits))
+        self.checked_count = 0
+
+    def to_bytes(self):
+        """Return the bitset as bytes.
+
+        Returns:
+            bytes: The bitset, one bit per step.
+
+        """
+        return bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, step_count: int, data: bytes):
+        """Create a ChecklistProgress from bytes made by to_bytes.
+
+        Args:
+            step_count: The number of steps in the checklist.
+            data: The bitset. Extra bits are ignored and missing bits are
+            unchecked.
+
+        Returns:
+            ChecklistProgress: The progress.
+
+        """
+        progress = cls(step_count)
+        size = len(progress._bits)
+        progress._bits[:] = bytes(data[:size]).ljust(size, b'\x00')
+        if step_count & 7 and size:
+            progress._bits[-1] &= (1 << (step_count & 7)) - 1
+        progress.checked_count = sum(bin(byte).count('1')
+                                     for byte in progress._bits)
+        return progress
+
+
+class ProgressJournal():
+    """Keeps checklist progress on disk so it survives restarts and crashes.
+
+    Each change to a step is appended to a journal file as one JSON line
+    holding the step's new state. Writes happen on a background thread so
+    recording a change never blocks the prompt loop, and the journal is
+    fsynced in batches. When the journal grows past compact_threshold
+    records it is folded into a snapshot file and truncated.
+
+    Because every record stores the new state of a step rather than a
+    toggle, replaying a record twice is harmless. That keeps recovery
+    correct even if a crash happens between writing a snapshot and
+    truncating the journal, and a torn last line is simply skipped. It
+    also lets the writer simply retry records it failed to write.
+
+    More than one process may have the same journal open, as when serve
+    runs alongside the interactive menus. Records are appended under a
+    shared lock on a lock file and compaction takes it exclusively,
+    rebuilding the snapshot from what is on disk so no process's records
+    are lost. Where fcntl is not available the journal is not locked.
+
+    Attributes:
+        directory (str): The directory holding the journal and snapshot.
+        progress (dict of tuple: ChecklistProgress): The progress of each
+        checklist keyed by (plane name, checklist name).
+        error (OSError): The last error writing the journal, or None once
+        the records have been written. The records are kept and retried.
+
+    Args:
+        directory: The directory to keep the journal and snapshot in.
+        fsync_batch (Optional): fsync after this many records.
+        fsync_interval (Optional): fsync pending records after this many
+        seconds even if the batch is not full.
+        compact_threshold (Optional): Compact the journal into the snapshot
+        after this many records.
+
+    """
+
+    JOURNAL_NAME = 'progress.journal'
+    SNAPSHOT_NAME = 'progress.snapshot'
+    LOCK_NAME = 'progress.lock'
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, directory: str, fsync_batch: int = 32,
+                 fsync_interval: float = 1.0,
+                 compact_threshold: int = 4096):
+        """Class Constructor."""
+        self.directory = directory
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.progress = {}  # type: Dict[Tuple[str, str], ChecklistProgress]
+        self.error = None  # type: Optional[OSError]
+        self._journal_path = os.path.join(directory, self.JOURNAL_NAME)
+        self._snapshot_path = os.path.join(directory, self.SNAPSHOT_NAME)
+        self._lock_path = os.path.join(directory, self.LOCK_NAME)
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._writer = None  # type: Optional[threading.Thread]
+        self._journal_file = None
+        self._lock_file = None
+        self._journal_records = 0
+
+    def open(self):
+        """Recover the saved progress and start the background writer.
+
+        Returns:
+            ProgressJournal: This journal, so it can be used in a with block.
+
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.load()
+        self._lock_file = open(self._lock_path, 'a')
+        self._journal_file = open(self._journal_path, 'a', encoding='utf-8')
+        if self._journal_records >= self.compact_threshold:
+            self._compact()
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name='progress-journal', daemon=True)
+        self._writer.start()
+        return self
+
+    def load(self):
+        """Recover the saved progress without starting the writer.
+
+        This is enough for reading progress. Use open to record changes.
+
+        Returns:
+            ProgressJournal: This journal.
+
+        """
+        self._replay()
+        return self
+
+    def flush(self):
+        """Wait until every record queued so far is written and fsynced.
+
+        Raises:
+            OSError: If the writer could not write them. They are kept
+            and retried.
+
+        """
+        if self._writer is not None:
+            written = threading.Event()
+            self._queue.put(written)
+            written.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Write any queued records, fsync them and stop the writer.
+
+        Raises:
+            OSError: If the last records could not be written, so they
+            were lost.
+
+        """
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        for open_file in (self._journal_file, self._lock_file):
+            if open_file is not None:
+                try:
+                    open_file.close()
+                except OSError:
+                    pass
+        self._journal_file = None
+        self._lock_file = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        """Open the journal."""
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the journal."""
+        self.close()
+
+    def get_progress(self, plane_name: str, checklist_name: str,
+                     step_count: int):
+        """Return the progress of a checklist, creating it if needed.
+
+        Saved progress for a checklist whose number of steps has changed
+        is discarded, since its positions no longer line up.
+
+        Args:
+            plane_name: The name of the plane.
+            checklist_name: The name of the checklist.
+            step_count: The number of steps in the checklist.
+
+        Returns:
+            ChecklistProgress: The progress of the checklist.
+
+        """
+        key = (plane_name, checklist_name)
+        progress = self.progress.get(key)
+        if progress is None or progress.step_count != step_count:
+            progress = ChecklistProgress(step_count)
+            self.progress[key] = progress
+        return progress
+
+    def record(self, plane_name: str, checklist_name: str,
+               progress: ChecklistProgress, changed_indexes: Iterable[int]):
+        """Queue the new state of some steps to be written to the journal.
+
+        Args:
+            plane_name: The name of the plane.
+            checklist_name: The name of the checklist.
+            progress: The checklist's progress, already updated.
+            changed_indexes: The positions of the steps that changed.
+
+        """
+        for index in changed_indexes:
+            self._queue.put((plane_name, checklist_name, progress.step_count,
+                             index, int(progress.is_checked(index))))
+
+    def _replay(self):
+        """Load the snapshot and apply the journal on top of it."""
+        self.progress, self._journal_records = self._read_saved()
+
+    def _read_saved(self):
+        """Read the snapshot and the journal as they are on disk.
+
+        Returns:
+            tuple of (dict, int): The progress of each checklist, and the
+            number of records in the journal.
+
+        """
+        state = {}  # type: Dict[Tuple[str, str], ChecklistProgress]
+        journal_records = 0
+        try:
+            with open(self._snapshot_path, encoding='utf-8') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            if snapshot.get('version') == self.SNAPSHOT_VERSION:
+                for (plane_name, checklist_name, step_count,
+                     bits) in snapshot['checklists']:
+                    state[(plane_name, checklist_name)] = \
+                        ChecklistProgress.from_bytes(step_count,
+                                                     bytes.fromhex(bits))
+        except (OSError, ValueError, KeyError, TypeError):
+            state = {}
+        try:
+            with open(self._journal_path, encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        (plane_name, checklist_name, step_count, index,
+                         checked) = json.loads(line)
+                        self._apply(state, plane_name, checklist_name,
+                                    step_count, index, checked)
+                    except (ValueError, TypeError, IndexError):
+                        continue
+                    journal_records += 1
+        except OSError:
+            pass
+        return state, journal_records
+
+    @staticmethod
+    def _apply(state: dict, plane_name: str, checklist_name: str,
+               step_count: int, index: int, checked: int):
+        """Apply one journal record to a progress dictionary."""
+        key = (plane_name, checklist_name)
+        progress = state.get(key)
+        if progress is None or progress.step_count != step_count:
+            progress = ChecklistProgress(step_count)
+            state[key] = progress
+        progress.set_checked(index, bool(checked))
+
+    def _write_loop(self):
+        """Write queued records to the journal until close is called.
+
+        Records that fail to write are kept and tried again every
+        RETRY_INTERVAL seconds, with the error reported once as a
+        JournalWriteWarning and kept in error until they are written.
+
+        """
+        unwritten = []
+        waiting = []  # type: List[threading.Event]
+        pending = 0
+        last_sync = time.monotonic()
+        running = True
+        while running:
+            timeout = RETRY_INTERVAL if self.error else self.fsync_interval
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = ()
+            if record is None:
+                running = False
+            elif isinstance(record, threading.Event):
+                waiting.append(record)
+            elif record:
+                unwritten.append(record)
+                # Drain anything else that is already waiting so a burst of
+                # changes goes out in a single write.
+                if not self._queue.empty():
+                    continue
+            try:
+                if unwritten:
+                    self._write(unwritten)
+                    pending += len(unwritten)
+                    unwritten = []
+                if pending and (not running or waiting
+                                or pending >= self.fsync_batch
+                                or time.monotonic() - last_sync
+                                >= self.fsync_interval):
+                    self._sync()
+                    pending = 0
+                    last_sync = time.monotonic()
+                elif pending:
+                    self._journal_file.flush()
+                if self._journal_records >= self.compact_threshold:
+                    self._compact()
+                self.error = None
+            except OSError as error:
+                self._write_failed(error)
+            for written in waiting:
+                written.set()
+            waiting = []
+
+    def _write(self, records: List[tuple]):
+        """Append records to the journal under the shared lock."""
+        self._lock(shared=True)
+        try:
+            self._journal_file.write(''.join(json.dumps(record) + '\n'
+                                             for record in records))
+            self._journal_file.flush()
+        finally:
+            self._unlock()
+        self._journal_records += len(records)
+
+    def _write_failed(self, error: OSError):
+        """Report a write error and reopen the journal for the retry."""
+        if self.error is None:
+            warnings.warn('Could not write the progress journal, retrying: '
+                          + str(error), JournalWriteWarning)
+        self.error = error
+        # Whatever is left in the old file's buffer is written again with
+        # the retry, which is harmless.
+        try:
+            self._journal_file.close()
+        except OSError:
+            pass
+        try:
+            self._journal_file = open(self._journal_path, 'a',
+                                      encoding='utf-8')
+        except OSError:
+            pass
+
+    def _lock(self, shared: bool):
+        """Take the lock shared by every process using this journal."""
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(),
+                        fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+    def _unlock(self):
+        """Release the lock taken by _lock."""
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Flush and fsync the journal."""
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def _compact(self):
+        """Fold the journal into a new snapshot and truncate the journal.
+
+        The exclusive lock keeps other processes from appending meanwhile,
+        and the snapshot is built from the files so their records are kept.
+
+        """
+        self._sync()
+        self._lock(shared=False)
+        try:
+            state = self._read_saved()[0]
+            snapshot = {'version': self.SNAPSHOT_VERSION,
+                        'checklists': [[plane_name, checklist_name,
+                                        progress.step_count,
+                                        progress.to_bytes().hex()]
+                                       for (plane_name, checklist_name),
+                                       progress in state.items()
+                                       if progress.checked_count]}
+            temp_path = self._snapshot_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(temp_path, self._snapshot_path)
+            # Truncated in place, so the other processes' append handles
+            # keep writing to the same file.
+            self._journal_file.truncate(0)
+            self._sync()
+        finally:
+            self._unlock()
+        self._journal_records = 0
@@ -0,0 +1,323 @@
+"""Full text search across the checklist steps of loaded planes.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import bisect
+import heapq
+import math
+import re
+import weakref
+from operator import itemgetter
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from model import LazyPlane
+from model import Plane
+from validator import PlaneLoadError
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+FIELD_WEIGHTS = {'step_title': 3.0,
+                 'step_text': 2.0,
+                 'checklist_name': 1.0,
+                 'checklist_message': 0.5}
+PREFIX_MATCH_WEIGHT = 0.5
+
+
+def tokenize(text: str):
+    """Split text into lower case search tokens.
+
+    Args:
+        text: The text to split.
+
+    Returns:
+        list of str: The tokens, in the order they appear.
+
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchResult():
+    """A checklist step that matched a search.
+
+    Attributes:
+        plane_key (str): The key the plane was indexed under.
+        plane_name (str): The name of the plane.
+        checklist_name (str): The name of the checklist holding the step.
+        step_number (int): The number of the step.
+        step_title (str): The title of the step.
+        step_text (str): The text of the step.
+        score (float): How well the step matched. Higher is better.
+
+    """
+
+    def __init__(self, document: tuple, score: float):
+        """Class Constructor."""
+        (self.plane_key, self.plane_name, self.checklist_name,
+         self.step_number, self.step_title, self.step_text) = document[:6]
+        self.score = score
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the SearchResult.
+
+        """
+        return (self.plane_name + ' / ' + self.checklist_name + ' / '
+                + str(self.step_number) + ': ' + self.step_title + ' - '
+                + self.step_text)
+
+    def __repr__(self):
+        """Turn a class into a str for debugging purposes.
+
+        Returns:
+            A str representation of the SearchResult.
+
+        """
+        return ('{ SearchResult Object: plane_key: ' + str(self.plane_key)
+                + ' | score: ' + '{:.3f}'.format(self.score)
+                + ' | step: ' + str(self) + ' }')
+
+
+class SearchIndex():
+    """An inverted index over the steps of a set of planes.
+
+    Every step is a document made of its step_title, step_text and the
+    name and message of its checklist. Each field has a weight in
+    FIELD_WEIGHTS. Queries are split into terms and a step must match every
+    term. A term matches any token that starts with it, with exact matches
+    scoring higher, and rarer tokens score higher than common ones.
+
+    Planes are indexed under a key, normally the path of their file, so a
+    reloaded plane replaces the old copy without touching the others. The
+    index only keeps weak references to the planes, and a LazyPlane that
+    is not loaded is indexed without loading it.
+
+    Attributes:
+        document_count (int): The number of steps in the index.
+
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self.document_count = 0
+        self._postings = {}  # type: Dict[str, Dict[int, float]]
+        self._documents = []  # type: List[Optional[tuple]]
+        self._free_ids = []  # type: List[int]
+        self._plane_documents = {}  # type: Dict[str, List[int]]
+        # The Plane each key was indexed from, so ensure_plane can tell
+        # when it has been replaced.
+        self._planes = weakref.WeakValueDictionary()
+        self._sorted_tokens = None  # type: Optional[List[str]]
+
+    def __contains__(self, plane_key: str):
+        """Check whether a plane key is in the index."""
+        return plane_key in self._plane_documents
+
+    def add_plane(self, plane: Plane, plane_key: Optional[str] = None):
+        """Index every step of a plane, replacing any plane with the same key.
+
+        A LazyPlane that is not loaded is read through its loader and left
+        unloaded, so searching a library does not keep every plane in
+        memory.
+
+        Args:
+            plane: The plane to index.
+            plane_key (Optional): The key to index the plane under. Defaults
+            to the plane's name.
+
+        Raises:
+            PlaneLoadError: If a LazyPlane's file can't be loaded.
+
+        """
+        if plane_key is None:
+            plane_key = plane.plane_name
+        if plane_key in self._plane_documents:
+            self.remove_plane(plane_key)
+        if isinstance(plane, LazyPlane) and not plane.loaded:
+            checklists = plane.loader().checklists
+        else:
+            checklists = plane.checklists
+        document_ids = []
+        for checklist in checklists:
+            checklist_weights = {}  # type: Dict[str, float]
+            for field, text in (('checklist_name', checklist.name),
+                                ('checklist_message', checklist.message)):
+                for token in tokenize(text):
+                    checklist_weights[token] = (checklist_weights.get(token, 0)
+                                                + FIELD_WEIGHTS[field])
+            for step in checklist.steps:
+                weights = dict(checklist_weights)
+                for field, text in (('step_title', step.step_title),
+                                    ('step_text', step.step_text)):
+                    for token in tokenize(text):
+                        weights[token] = (weights.get(token, 0)
+                                          + FIELD_WEIGHTS[field])
+                document = (plane_key, plane.plane_name, checklist.name,
+                            step.step_number, step.step_title, step.step_text,
+                            tuple(weights))
+                if self._free_ids:
+                    document_id = self._free_ids.pop()
+                    self._documents[document_id] = document
+                else:
+                    document_id = len(self._documents)
+                    self._documents.append(document)
+                document_ids.append(document_id)
+                for token, weight in weights.items():
+                    posting = self._postings.get(token)
+                    if posting is None:
+                        posting = self._postings[token] = {}
+                        self._sorted_tokens = None
+                    posting[document_id] = weight
+        self._plane_documents[plane_key] = document_ids
+        self._planes[plane_key] = plane
+        self.document_count += len(document_ids)
+
+    def remove_plane(self, plane_key: str):
+        """Remove a plane's steps from the index.
+
+        Args:
+            plane_key: The key the plane was indexed under.
+
+        """
+        document_ids = self._plane_documents.pop(plane_key, [])
+        self._planes.pop(plane_key, None)
+        for document_id in document_ids:
+            for token in self._documents[document_id][6]:
+                posting = self._postings[token]
+                del posting[document_id]
+                if not posting:
+                    del self._postings[token]
+                    self._sorted_tokens = None
+            self._documents[document_id] = None
+            self._free_ids.append(document_id)
+        self.document_count -= len(document_ids)
+
+    def sync(self, planes: Iterable[Plane]):
+        """Bring the index up to date with a library of planes.
+
+        Planes are keyed by their path when the library knows it. Only
+        planes that are new, or were replaced by a different Plane object
+        since the last sync, are indexed again, and planes that are gone
+        are dropped. Lazy planes whose file turns out to be broken are left
+        out.
+
+        Args:
+            planes: A PlaneLibrary, or any iterable of Plane.
+
+        """
+        path_of = getattr(planes, 'path_of', lambda plane: None)
+        current = {}
+        for plane in planes:
+            plane_key = path_of(plane) or plane.plane_name
+            current[plane_key] = plane
+        for plane_key in list(self._plane_documents):
+            if plane_key not in current:
+                self.remove_plane(plane_key)
+        for plane_key, plane in current.items():
+            try:
+                self.ensure_plane(plane, plane_key)
+            except PlaneLoadError:
+                continue
+
+    def ensure_plane(self, plane: Plane, plane_key: str):
+        """Index a plane unless that same Plane is already indexed.
+
+        Args:
+            plane: The plane to index.
+            plane_key: The key to index the plane under.
+
+        """
+        if self._planes.get(plane_key) is not plane:
+            self.add_plane(plane, plane_key)
+
+    def _expand(self, term: str):
+        """Find every indexed token that starts with a term."""
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        tokens = self._sorted_tokens
+        position = bisect.bisect_left(tokens, term)
+        while position < len(tokens) and tokens[position].startswith(term):
+            yield tokens[position]
+            position += 1
+
+    def _term_postings(self, term: str):
+        """Return the postings and idf of every token matching a term."""
+        postings = []
+        for token in self._expand(term):
+            posting = self._postings[token]
+            idf = math.log(1.0 + self.document_count / len(posting))
+            if token != term:
+                idf *= PREFIX_MATCH_WEIGHT
+            postings.append((posting, idf))
+        return postings
+
+    def search(self, query: str, limit: int = 20,
+               plane_key: Optional[str] = None):
+        """Find the steps that best match a query.
+
+        Args:
+            query: The words to search for.
+            limit (Optional): The most results to return.
+            plane_key (Optional): Only return steps from this plane.
+
+        Returns:
+            list of SearchResult: The matches, best first.
+
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        term_postings = [self._term_postings(term) for term in terms]
+        if not all(term_postings):
+            return []
+        documents = self._documents
+        plane_documents = None
+        if plane_key is not None:
+            plane_documents = self._plane_documents.get(plane_key)
+            if not plane_documents:
+                return []
+        if len(term_postings) == 1 and len(term_postings[0]) == 1:
+            # A single token ranks in the same order as its weights, so
+            # there is no need to build a score for every document.
+            posting, idf = term_postings[0][0]
+            if plane_documents is None:
+                items = posting.items()
+            else:
+                # Only the plane's own steps are looked up, however common
+                # the token is across the other planes.
+                items = [(document_id, posting[document_id])
+                         for document_id in plane_documents
+                         if document_id in posting]
+            best = heapq.nlargest(limit, items, key=itemgetter(1))
+            return [SearchResult(documents[document_id], weight * idf)
+                    for document_id, weight in best]
+        candidate_sets = []
+        if plane_documents is not None:
+            candidate_sets.append(set(plane_documents))
+        for postings in term_postings:
+            if len(postings) == 1:
+                candidate_sets.append(postings[0][0].keys())
+            else:
+                candidate_sets.append(set().union(
+                    *[posting.keys() for posting, idf in postings]))
+        candidate_sets.sort(key=len)
+        candidates = set(candidate_sets[0])
+        for candidate_set in candidate_sets[1:]:
+            candidates &= candidate_set
+        flat_postings = [item for postings in term_postings
+                         for item in postings]
+        scores = []
+        for document_id in candidates:
+            score = 0.0
+            for posting, idf in flat_postings:
+                weight = posting.get(document_id)
+                if weight is not None:
+                    score += weight * idf
+            scores.append((score, document_id))
+        best = heapq.nlargest(limit, scores)
+        return [SearchResult(documents[document_id], score)
+                for score, document_id in best]
@@ -0,0 +1,605 @@
+"""Serves the plane library and checklist progress as a JSON API over HTTP.
+
+Several tablets can read the same checklists and follow each other's
+check and uncheck updates. The server runs on one asyncio event loop and
+uses only the standard library. The API is:
+
+    GET  /api/planes                                 names of every plane
+    GET  /api/planes/PLANE                           a plane, as dumped
+    GET  /api/planes/PLANE/checklists/CHECKLIST/progress
+    POST /api/planes/PLANE/checklists/CHECKLIST/progress
+         {"index": 3, "checked": true} or {"checked": [0, 1, 2]}
+    GET  /api/updates?since=VERSION&timeout=SECONDS  long-poll for updates
+    GET  /api/events                                 server-sent events
+
+Names in paths are URL encoded. Plane responses are cached with an ETag
+and answer If-None-Match with 304 Not Modified. Every progress change gets
+the next version number. Long-poll and server-sent event clients get
+every update after the last version they saw. If they have fallen so far
+behind that the backlog has been dropped, or saw a version from before the
+server restarted, they are told to resync.
+
+Loading a plane, building its JSON and reloading changed plane files run
+on the event loop's executor, so a large plane does not hold up the other
+clients.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import traceback
+from typing import Deque
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from fileio import apply_loaded_changes
+from fileio import load_file_changes
+from fileio import plane_to_dict
+from fileio import record_load_failure
+from manifest import LibraryManifest
+from model import Plane
+from model import PlaneLibrary
+from progress import ProgressJournal
+from validator import PlaneLoadError
+from watcher import DirectoryWatcher
+
+MAX_HEADER_BYTES = 16384
+MAX_BODY_BYTES = 65536
+EVENT_BACKLOG = 4096
+LONG_POLL_TIMEOUT = 30.0
+SSE_KEEPALIVE_INTERVAL = 15.0
+WATCH_INTERVAL = 0.5
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request',
+           404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    """Raised by a route to answer with an error status.
+
+    Attributes:
+        status (int): The HTTP status code.
+
+    Args:
+        status: The HTTP status code.
+        message: The reason, sent back in the JSON body.
+
+    """
+
+    def __init__(self, status: int, message: str):
+        """Class Constructor."""
+        super().__init__(message)
+        self.status = status
+
+
+def make_etag(body: bytes):
+    """Build a strong ETag from the content of a response."""
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    """Check an If-None-Match header against the current ETag.
+
+    Args:
+        if_none_match: The header value, or None if it wasn't sent.
+        etag: The ETag of the current response.
+
+    Returns:
+        bool: True if the client's copy is still current.
+
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate in ('*', etag):
+            return True
+    return False
+
+
+class ChecklistServer():
+    """Answers HTTP requests for a plane library and its progress.
+
+    Attributes:
+        library (PlaneLibrary): The planes being served.
+        journal (ProgressJournal): Where the progress is kept. It must be
+        open so the changes are written.
+        version (int): The version of the latest progress update.
+        port (int): The port the server is listening on, once started.
+
+    Args:
+        library: The planes to serve.
+        journal: An open ProgressJournal.
+        watcher (Optional): A started DirectoryWatcher for the library's
+        directory. Its changes are applied to the library while serving.
+        manifest (Optional): The LibraryManifest to keep up to date when the
+        watcher reloads files.
+
+    """
+
+    def __init__(self, library: PlaneLibrary, journal: ProgressJournal,
+                 watcher: Optional[DirectoryWatcher] = None,
+                 manifest: Optional[LibraryManifest] = None):
+        """Class Constructor."""
+        self.library = library
+        self.journal = journal
+        self.version = 0
+        self.port = None  # type: Optional[int]
+        self._watcher = watcher
+        self._manifest = manifest
+        self._events = collections.deque(
+            maxlen=EVENT_BACKLOG)  # type: Deque[Tuple[int, bytes]]
+        # Replaced by a new Event every time an update is published, so
+        # every waiting client wakes once.
+        self._update_signal = None  # type: Optional[asyncio.Event]
+        self._cache = {}  # type: Dict[str, Tuple[bytes, str]]
+        # The load running on the executor for each plane, keyed by id, so
+        # clients asking for the same plane share one load.
+        self._loading = {}  # type: Dict[int, asyncio.Future]
+        # Held while the manifest is used off the loop.
+        self._manifest_lock = None  # type: Optional[asyncio.Lock]
+        self._server = None
+        self._watch_task = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080):
+        """Start listening for connections.
+
+        Args:
+            host (Optional): The address to listen on. Use 0.0.0.0 to accept
+            connections from the LAN.
+            port (Optional): The port to listen on. 0 picks a free port.
+
+        """
+        self._update_signal = asyncio.Event()
+        self._manifest_lock = asyncio.Lock()
+        self._server = await asyncio.start_server(
+            self._handle_connection, host, port, backlog=1024,
+            limit=MAX_HEADER_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self._watcher is not None:
+            self._watch_task = asyncio.ensure_future(self._watch_library())
+
+    async def serve_forever(self):
+        """Serve until the task is cancelled."""
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Stop accepting connections and stop watching the library."""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _publish(self, update: dict):
+        """Give an update the next version and wake the waiting clients."""
+        self.version += 1
+        update['version'] = self.version
+        self._events.append((self.version, json.dumps(update).encode()))
+        self._update_signal.set()
+        self._update_signal = asyncio.Event()
+
+    def _updates_since(self, since: int):
+        """Return the updates after a version, and whether some were lost.
+
+        Returns:
+            tuple of (list, bool): The version and JSON of each update, and
+            True if the backlog no longer reaches back to since, or since
+            is newer than any update, as after the server restarted.
+
+        """
+        if since > self.version:
+            return [], True
+        if not self._events or since == self.version:
+            return [], False
+        lost = since < self._events[0][0] - 1
+        # Clients are usually only a few updates behind, so walk back from
+        # the newest update.
+        updates = []
+        for event in reversed(self._events):
+            if event[0] <= since:
+                break
+            updates.append(event)
+        updates.reverse()
+        return updates, lost
+
+    async def _watch_library(self):
+        """Apply the watcher's changes to the library as they settle.
+
+        The files are loaded on the executor and the library is only
+        updated back on the loop, so requests never see it half changed.
+
+        """
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            changes = self._watcher.drain()
+            if changes:
+                async with self._manifest_lock:
+                    loaded = await asyncio.get_event_loop().run_in_executor(
+                        None, load_file_changes, changes, self._manifest,
+                        True)
+                apply_loaded_changes(self.library, loaded)
+                self._cache.clear()
+                self._publish({'type': 'library',
+                               'files': sorted(changes)})
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        """Answer requests on one connection until it is closed."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError):
+                    break
+                try:
+                    method, target, headers = self._parse_head(head)
+                except HttpError as error:
+                    self._write_error(writer, error)
+                    break
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_BYTES:
+                    self._write_error(writer, HttpError(
+                        413, 'Request body is too large or malformed.'))
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if not await self._dispatch(method, target, headers, body,
+                                            writer, keep_alive):
+                    break
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes):
+        """Split a request head into its method, target and headers."""
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, 'Malformed request line.')
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, headers
+
+    async def _dispatch(self, method: str, target: str, headers: dict,
+                        body: bytes, writer: asyncio.StreamWriter,
+                        keep_alive: bool):
+        """Route one request and write its response.
+
+        Returns:
+            bool: False once the connection has been taken over, by the
+            server-sent event stream, and must not be reused.
+
+        """
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        query = parse_qs(url.query)
+        head_only = method == 'HEAD'
+        if head_only:
+            method = 'GET'
+        try:
+            if parts[:1] != ['api'] or len(parts) < 2:
+                raise HttpError(404, 'Not found.')
+            if parts[1] == 'events' and len(parts) == 2:
+                self._require_method(method, 'GET')
+                await self._stream_events(headers, writer)
+                return False
+            if parts[1] == 'updates' and len(parts) == 2:
+                self._require_method(method, 'GET')
+                payload = await self._long_poll(query)
+                self._write_json(writer, 200, payload, keep_alive, head_only)
+            elif parts[1] == 'planes' and len(parts) == 2:
+                self._require_method(method, 'GET')
+                cached = self._cache.get('planes')
+                if cached is None:
+                    body = self._planes_body()
+                    cached = self._cache['planes'] = (body, make_etag(body))
+                self._write_cached(writer, cached, headers, keep_alive,
+                                   head_only)
+            elif parts[1] == 'planes' and len(parts) == 3:
+                self._require_method(method, 'GET')
+                cached = await self._cached_plane_body(parts[2])
+                self._write_cached(writer, cached, headers, keep_alive,
+                                   head_only)
+            elif (parts[1] == 'planes' and len(parts) == 6
+                  and parts[3] == 'checklists' and parts[5] == 'progress'):
+                if method == 'POST':
+                    payload = await self._update_progress(parts[2], parts[4],
+                                                          body)
+                else:
+                    self._require_method(method, 'GET')
+                    payload = await self._progress_payload(parts[2],
+                                                           parts[4])
+                self._write_json(writer, 200, payload, keep_alive, head_only)
+            else:
+                raise HttpError(404, 'Not found.')
+        except HttpError as error:
+            self._write_error(writer, error, keep_alive, head_only)
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            self._write_error(writer, HttpError(500, 'Internal error.'),
+                              head_only=head_only)
+            return False
+        return True
+
+    @staticmethod
+    def _require_method(method: str, allowed: str):
+        """Raise a 405 unless the request used the allowed method."""
+        if method != allowed:
+            raise HttpError(405, 'Use ' + allowed + '.')
+
+    async def _find_plane(self, plane_name: str):
+        """Find a plane by name and make sure its checklists are loaded."""
+        plane = self.library.get_by_name(plane_name)
+        if plane is None:
+            raise HttpError(404, 'No plane named: ' + plane_name)
+        try:
+            await self._materialize(plane)
+        except PlaneLoadError as load_error:
+            # The watcher may have replaced the plane while it loaded, and
+            # every client that waited on the load gets the same error.
+            if plane in self.library:
+                async with self._manifest_lock:
+                    record_load_failure(self.library, plane, load_error,
+                                        self._manifest)
+                self._cache.clear()
+            raise HttpError(500, str(load_error))
+        return plane
+
+    async def _materialize(self, plane: Plane):
+        """Load a plane on the executor, once for all the clients waiting.
+
+        A client that goes away stops waiting without cancelling the load
+        for the others.
+
+        """
+        key = id(plane)
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = asyncio.get_event_loop().run_in_executor(
+                None, plane.materialize)
+            self._loading[key] = loading
+            loading.add_done_callback(
+                lambda _: self._loading.pop(key, None))
+        await asyncio.shield(loading)
+
+    async def _cached_plane_body(self, plane_name: str):
+        """Return the cached JSON of a plane, building it off the loop.
+
+        Returns:
+            tuple of (bytes, str): The body and its ETag.
+
+        """
+        key = 'plane:' + plane_name
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        plane = await self._find_plane(plane_name)
+        body = await asyncio.get_event_loop().run_in_executor(
+            None, self._plane_body, plane)
+        cached = (body, make_etag(body))
+        # A plane the watcher replaced while its JSON was built is only
+        # good for this response.
+        if self.library.get_by_name(plane_name) is plane:
+            self._cache[key] = cached
+        return cached
+
+    async def _find_checklist(self, plane_name: str, checklist_name: str):
+        """Find a checklist and its progress."""
+        plane = await self._find_plane(plane_name)
+        checklist = plane.get_checklist(checklist_name)
+        if checklist is None:
+            raise HttpError(404, 'No checklist named: ' + checklist_name)
+        progress = self.journal.get_progress(plane.plane_name, checklist.name,
+                                             len(checklist.steps))
+        return plane, checklist, progress
+
+    def _planes_body(self):
+        """Build the JSON listing every plane."""
+        return json.dumps({'planes': [plane.plane_name
+                                      for plane in self.library]}).encode()
+
+    @staticmethod
+    def _plane_body(plane):
+        """Build the JSON of one plane."""
+        return json.dumps(plane_to_dict(plane)).encode()
+
+    async def _progress_payload(self, plane_name: str, checklist_name: str):
+        """Build the progress of a checklist as a dict."""
+        plane, checklist, progress = await self._find_checklist(
+            plane_name, checklist_name)
+        return {'plane': plane.plane_name, 'checklist': checklist.name,
+                'step_count': progress.step_count,
+                'checked': list(progress.checked_indexes()),
+                'version': self.version}
+
+    async def _update_progress(self, plane_name: str, checklist_name: str,
+                               body: bytes):
+        """Apply a check or uncheck from a client and publish it."""
+        plane, checklist, progress = await self._find_checklist(
+            plane_name, checklist_name)
+        try:
+            request = json.loads(body.decode('utf-8'))
+            if 'index' in request:
+                index = request['index']
+                if (not isinstance(index, int) or isinstance(index, bool)
+                        or not 0 <= index < progress.step_count):
+                    raise HttpError(400, 'index must be a step position.')
+                checked = request.get('checked', True)
+                if not isinstance(checked, bool):
+                    raise HttpError(400, 'checked must be true or false.')
+                changed = []
+                if progress.set_checked(index, checked):
+                    changed.append(index)
+            else:
+                checked = request['checked']
+                if not isinstance(checked, list) or not all(
+                        isinstance(index, int)
+                        and not isinstance(index, bool)
+                        and 0 <= index < progress.step_count
+                        for index in checked):
+                    raise HttpError(400, 'checked must list step positions.')
+                changed = progress.update_from(checked)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise HttpError(400, 'Send {"index": N, "checked": true} or '
+                            '{"checked": [N, ...]}.')
+        if changed:
+            self.journal.record(plane.plane_name, checklist.name, progress,
+                                changed)
+            self._publish({'type': 'progress', 'plane': plane.plane_name,
+                           'checklist': checklist.name,
+                           'step_count': progress.step_count,
+                           'checked': list(progress.checked_indexes())})
+        return await self._progress_payload(plane.plane_name,
+                                            checklist.name)
+
+    async def _wait_for_update(self, since: int, timeout: float):
+        """Wait until there is an update after since, or the timeout."""
+        if self.version != since:
+            # Either there are updates already or the client must resync.
+            return
+        try:
+            await asyncio.wait_for(self._update_signal.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _long_poll(self, query: dict):
+        """Answer a long-poll request once there are updates after since."""
+        try:
+            since = int(query.get('since', ['0'])[0])
+            timeout = min(float(query.get('timeout', [LONG_POLL_TIMEOUT])[0]),
+                          LONG_POLL_TIMEOUT)
+        except ValueError:
+            raise HttpError(400, 'since and timeout must be numbers.')
+        await self._wait_for_update(since, timeout)
+        updates, lost = self._updates_since(since)
+        return {'version': self.version, 'resync': lost,
+                'updates': [json.loads(update) for _, update in updates]}
+
+    async def _stream_events(self, headers: dict,
+                             writer: asyncio.StreamWriter):
+        """Send updates as server-sent events until the client goes away."""
+        try:
+            since = int(headers.get('last-event-id', self.version))
+        except ValueError:
+            since = self.version
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'Connection: keep-alive\r\n\r\n'
+                     b'retry: 2000\n\n')
+        while True:
+            updates, lost = self._updates_since(since)
+            if lost:
+                writer.write(b'event: resync\ndata: {}\n\n')
+                # A client ahead of the server starts again from now.
+                since = min(since, self.version)
+            for version, update in updates:
+                since = version
+                writer.write(b'id: ' + str(version).encode() + b'\ndata: '
+                             + update + b'\n\n')
+            if not updates:
+                writer.write(b': keep-alive\n\n')
+            await writer.drain()
+            await self._wait_for_update(since, SSE_KEEPALIVE_INTERVAL)
+
+    def _write_cached(self, writer: asyncio.StreamWriter, cached: tuple,
+                      headers: dict, keep_alive: bool, head_only: bool):
+        """Write a cached JSON body, or 304 if the client's copy is current.
+        """
+        body, etag = cached
+        if etag_matches(headers.get('if-none-match'), etag):
+            self._write_response(writer, 304, b'', keep_alive,
+                                 {'ETag': etag})
+        else:
+            self._write_response(writer, 200, body, keep_alive,
+                                 {'ETag': etag}, head_only)
+
+    def _write_json(self, writer: asyncio.StreamWriter, status: int,
+                    payload: dict, keep_alive: bool, head_only: bool = False):
+        """Write a JSON response that isn't cached."""
+        self._write_response(writer, status, json.dumps(payload).encode(),
+                             keep_alive, {'Cache-Control': 'no-store'},
+                             head_only)
+
+    def _write_error(self, writer: asyncio.StreamWriter, error: HttpError,
+                     keep_alive: bool = False, head_only: bool = False):
+        """Write an error as a JSON response."""
+        self._write_json(writer, error.status, {'error': str(error)},
+                         keep_alive, head_only)
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int,
+                        body: bytes, keep_alive: bool,
+                        extra_headers: Optional[dict] = None,
+                        head_only: bool = False):
+        """Write a complete HTTP response."""
+        lines = ['HTTP/1.1 ' + str(status) + ' ' + REASONS.get(status, ''),
+                 'Content-Type: application/json',
+                 'Content-Length: ' + str(len(body)),
+                 'Access-Control-Allow-Origin: *',
+                 'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+        if status == 200 and 'Cache-Control' not in (extra_headers or {}):
+            lines.append('Cache-Control: no-cache')
+        for name, value in (extra_headers or {}).items():
+            lines.append(name + ': ' + value)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body and not head_only and status != 304:
+            writer.write(body)
+
+
+def serve(library: PlaneLibrary, journal: ProgressJournal,
+          host: str = '127.0.0.1', port: int = 8080,
+          watcher: Optional[DirectoryWatcher] = None,
+          manifest: Optional[LibraryManifest] = None):
+    """Run a ChecklistServer until interrupted.
+
+    Args:
+        library: The planes to serve.
+        journal: An open ProgressJournal.
+        host (Optional): The address to listen on.
+        port (Optional): The port to listen on.
+        watcher (Optional): A started DirectoryWatcher for the library.
+        manifest (Optional): The manifest to update on reloads.
+
+    """
+    server = ChecklistServer(library, journal, watcher, manifest)
+
+    async def run():
+        await server.start(host, port)
+        print('Serving ' + str(len(library)) + ' planes on http://'
+              + host + ':' + str(server.port) + '/api/planes', flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
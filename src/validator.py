@@ -0,0 +1,322 @@
+"""Validates the structure of plane data files.
+
+The schema is written as nested rule tuples and compiled once into a tree
+of checking functions, which is then reused for every file.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import json
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+STRING = ('string',)
+STEP_NUMBER = ('step_number',)
+# Step numbers are stored as 32 bit signed integers by StepColumns and in
+# plane packs.
+STEP_NUMBER_MIN = -2 ** 31
+STEP_NUMBER_MAX = 2 ** 31 - 1
+
+
+def array_of(items: tuple):
+    """Build a rule for a list whose items all follow a rule."""
+    return ('array', items)
+
+
+def object_with(required: Dict[str, tuple],
+                optional: Optional[Dict[str, tuple]] = None):
+    """Build a rule for an object with required and optional keys."""
+    return ('object', required, optional or {})
+
+
+def string_map():
+    """Build a rule for an object whose values are all strings."""
+    return ('string_map',)
+
+
+STEP_RULE = object_with({'step_number': STEP_NUMBER,
+                         'step_title': STRING,
+                         'step_text': STRING})
+CHECKLIST_RULE = object_with({'checklist_name': STRING,
+                              'checklist_message': STRING,
+                              'checklist_steps': array_of(STEP_RULE)})
+PLANE_RULE = object_with({'plane_name': STRING,
+                          'checklists': array_of(CHECKLIST_RULE)},
+                         {'plane_info': array_of(string_map())})
+
+
+class ValidationError():
+    """A problem found in a plane data file.
+
+    Attributes:
+        path (str): Where the problem is, as a JSON path like
+        $.checklists[0].checklist_steps[2].step_number
+        message (str): What is wrong.
+
+    """
+
+    def __init__(self, path: str, message: str):
+        """Class Constructor."""
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the ValidationError.
+
+        """
+        return self.path + ': ' + self.message
+
+    def __repr__(self):
+        """Turn a class into a str for debugging purposes.
+
+        Returns:
+            A str representation of the ValidationError.
+
+        """
+        return ('{ ValidationError Object: path: ' + self.path
+                + ' | message: ' + self.message + ' }')
+
+    def to_dict(self):
+        """Return the error as a dict for machine-readable reports."""
+        return {'path': self.path, 'message': self.message}
+
+
+class LoadDiagnostic():
+    """Describes why a plane file could not be loaded.
+
+    Attributes:
+        filename (str): The path of the plane file.
+        errors (list of ValidationError): What is wrong with the file.
+
+    Args:
+        filename: The path of the plane file.
+        errors: What is wrong with the file.
+
+    """
+
+    def __init__(self, filename: str, errors: List[ValidationError]):
+        """Class Constructor."""
+        self.filename = filename
+        self.errors = errors
+
+    def __str__(self):
+        """Turn class into a str.
+
+        Returns:
+            A str representation of the LoadDiagnostic.
+
+        """
+        return '\n'.join(str(self.filename) + ': ' + str(error)
+                         for error in self.errors)
+
+    def __repr__(self):
+        """Turn a class into a str for debugging purposes.
+
+        Returns:
+            A str representation of the LoadDiagnostic.
+
+        """
+        return ('{ LoadDiagnostic Object: filename: ' + str(self.filename)
+                + ' | # of errors: ' + str(len(self.errors)) + ' }')
+
+    def to_dict(self):
+        """Return the diagnostic as a dict for machine-readable reports."""
+        return {'file': self.filename,
+                'errors': [error.to_dict() for error in self.errors]}
+
+
+class PlaneLoadError(Exception):
+    """Raised when a plane file can't be turned into a Plane.
+
+    Attributes:
+        diagnostic (LoadDiagnostic): The details of what went wrong.
+
+    Args:
+        filename: The path of the plane file.
+        errors: What is wrong with the file.
+
+    """
+
+    def __init__(self, filename: str, errors: List[ValidationError]):
+        """Class Constructor."""
+        self.diagnostic = LoadDiagnostic(filename, errors)
+        super().__init__(str(self.diagnostic))
+
+
+def decode_error(error: json.JSONDecodeError):
+    """Turn a JSONDecodeError into a ValidationError.
+
+    Args:
+        error: The error raised by the json module.
+
+    Returns:
+        ValidationError: The error, reported at the root of the file.
+
+    """
+    return ValidationError('$', 'invalid JSON at line ' + str(error.lineno)
+                           + ' column ' + str(error.colno) + ': '
+                           + error.msg)
+
+
+def _type_name(value):
+    """Name the JSON type of a decoded value."""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, list):
+        return 'array'
+    return 'object'
+
+
+def parse_step_number(value):
+    """Turn the step_number of a plane file into an int.
+
+    The loaders use it too, so a file passes lint exactly when its step
+    numbers load.
+
+    Args:
+        value: The step_number, a string or an integer. Floats are refused
+        rather than rounded.
+
+    Returns:
+        int: The step number.
+
+    Raises:
+        TypeError: If value is not a string or an integer.
+        ValueError: If value is not a whole number or does not fit in 32
+        bits.
+
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise TypeError('expected numeric string, found '
+                        + _type_name(value))
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError('expected numeric string, found '
+                         + json.dumps(value))
+    if not STEP_NUMBER_MIN <= number <= STEP_NUMBER_MAX:
+        raise ValueError('step number out of range, found '
+                         + json.dumps(value))
+    return number
+
+
+def compile_rule(rule: tuple):
+    """Compile a rule into a checking function.
+
+    Args:
+        rule: The rule to compile.
+
+    Returns:
+        Callable: A function taking (value, path, errors) that appends a
+        ValidationError to errors for every problem it finds.
+
+    """
+    kind = rule[0]
+    if kind == 'string':
+        def check_string(value, path, errors):
+            if not isinstance(value, str):
+                errors.append(ValidationError(
+                    path, 'expected string, found ' + _type_name(value)))
+        return check_string
+    if kind == 'step_number':
+        def check_step_number(value, path, errors):
+            try:
+                parse_step_number(value)
+            except (TypeError, ValueError) as step_number_error:
+                errors.append(ValidationError(path, str(step_number_error)))
+        return check_step_number
+    if kind == 'string_map':
+        def check_string_map(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(ValidationError(
+                    path, 'expected object, found ' + _type_name(value)))
+                return
+            for key, item in value.items():
+                if not isinstance(item, str):
+                    errors.append(ValidationError(
+                        path + '.' + key,
+                        'expected string, found ' + _type_name(item)))
+        return check_string_map
+    if kind == 'array':
+        check_item = compile_rule(rule[1])
+
+        def check_array(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(ValidationError(
+                    path, 'expected array, found ' + _type_name(value)))
+                return
+            for index, item in enumerate(value):
+                check_item(item, path + '[' + str(index) + ']', errors)
+        return check_array
+    if kind == 'object':
+        required = [(key, compile_rule(key_rule))
+                    for key, key_rule in rule[1].items()]
+        optional = [(key, compile_rule(key_rule))
+                    for key, key_rule in rule[2].items()]
+
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(ValidationError(
+                    path, 'expected object, found ' + _type_name(value)))
+                return
+            for key, check_key in required:
+                if key in value:
+                    check_key(value[key], path + '.' + key, errors)
+                else:
+                    errors.append(ValidationError(
+                        path, 'missing required key "' + key + '"'))
+            for key, check_key in optional:
+                if key in value:
+                    check_key(value[key], path + '.' + key, errors)
+        return check_object
+    raise ValueError('Unknown rule: ' + str(kind))
+
+
+_CHECK_PLANE = compile_rule(PLANE_RULE)  # type: Callable
+
+
+def validate_plane_data(plane_data):
+    """Validate decoded plane data against the plane file schema.
+
+    Args:
+        plane_data: The decoded JSON of a plane file.
+
+    Returns:
+        list of ValidationError: Every problem found. Empty when valid.
+
+    """
+    errors = []  # type: List[ValidationError]
+    _CHECK_PLANE(plane_data, '$', errors)
+    return errors
+
+
+def validate_plane_path(filename: str):
+    """Read and validate a plane data file.
+
+    Args:
+        filename: The path of the plane file.
+
+    Returns:
+        list of ValidationError: Every problem found. Empty when valid.
+
+    """
+    try:
+        with open(filename, encoding='utf-8') as plane_data_file:
+            plane_data = json.load(plane_data_file)
+    except json.JSONDecodeError as json_error:
+        return [decode_error(json_error)]
+    except (OSError, UnicodeDecodeError) as read_error:
+        return [ValidationError('$', 'could not read file: '
+                                + str(read_error))]
+    return validate_plane_data(plane_data)
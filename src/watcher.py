@@ -0,0 +1,356 @@
+"""Watches the plane data directory for files being added, changed or removed.
+
+On Linux the kernel's inotify interface is used through ctypes. Anywhere
+else, or if inotify can't be set up, the directory is polled with
+os.scandir and the size and mtime of every file are compared between polls.
+If the watched directory itself is deleted or moved, its inotify watch is
+gone, so the watcher reports its files as deleted and goes on polling for
+the directory to come back.
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from archive import is_plane_archive
+
+FILE_ADDED = 'added'
+FILE_MODIFIED = 'modified'
+FILE_DELETED = 'deleted'
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+INOTIFY_EVENT = struct.Struct('iIII')
+READ_SIZE = 65536
+
+
+def _is_plane_source(filename: str):
+    """Check whether a file name is a plane data file or archive name."""
+    return filename.endswith('.json') or is_plane_archive(filename)
+
+
+def _open_inotify(directory: str):
+    """Start an inotify watch on a directory.
+
+    Args:
+        directory: The directory to watch.
+
+    Returns:
+        int: The inotify file descriptor, or None if inotify isn't available.
+
+    """
+    library_name = ctypes.util.find_library('c')
+    try:
+        libc = ctypes.CDLL(library_name, use_errno=True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                  ctypes.c_uint32]
+    inotify_fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if inotify_fd < 0:
+        return None
+    if inotify_add_watch(inotify_fd, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(inotify_fd)
+        return None
+    return inotify_fd
+
+
+class DirectoryWatcher():
+    """Collects changes to the plane files in a directory.
+
+    A background thread records an event for every file that is added,
+    modified or deleted. Events for the same file are merged until the file
+    has been quiet for debounce seconds, so an editor that saves in several
+    writes produces a single change.
+
+    Attributes:
+        directory (str): The absolute path of the watched directory.
+        debounce (float): How long, in seconds, a file must go without
+        events before its change is handed out.
+        poll_interval (float): How often, in seconds, the directory is
+        scanned when inotify isn't used.
+        backend (str): 'inotify' or 'polling' once the watcher is started.
+        It changes to 'polling' if the directory is deleted or moved.
+
+    Args:
+        directory: The directory to watch.
+        debounce (Optional): See debounce.
+        poll_interval (Optional): See poll_interval.
+        file_filter (Optional): Called with a file name, returns True for
+        the files to watch. Defaults to JSON files and archives.
+        use_inotify (Optional): Set to False to always poll.
+
+    """
+
+    def __init__(self, directory: str, debounce: float = 0.25,
+                 poll_interval: float = 1.0,
+                 file_filter: Callable[[str], bool] = _is_plane_source,
+                 use_inotify: bool = True):
+        """Class Constructor."""
+        self.directory = os.path.abspath(directory)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None  # type: Optional[str]
+        self._file_filter = file_filter
+        self._use_inotify = use_inotify
+        self._inotify_fd = None  # type: Optional[int]
+        self._snapshot = {}  # type: Dict[str, Optional[Tuple[int, int]]]
+        # path: (first event kind, time of the last event)
+        self._pending = {}  # type: Dict[str, Tuple[str, float]]
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def __enter__(self):
+        """Start the watcher when used as a context manager."""
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the watcher at the end of a with block."""
+        self.stop()
+
+    def start(self):
+        """Start watching the directory in a background thread.
+
+        Returns:
+            DirectoryWatcher: This watcher, so it can be chained.
+
+        """
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        if self._use_inotify:
+            self._inotify_fd = _open_inotify(self.directory)
+        # Taken for inotify too, so the files can be reported as deleted if
+        # the watch on the directory is lost.
+        self._snapshot = self._scan()
+        if self._inotify_fd is not None:
+            self.backend = 'inotify'
+            target = self._inotify_loop
+        else:
+            self.backend = 'polling'
+            target = self._poll_loop
+        self._thread = threading.Thread(target=target,
+                                        name='directory-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background thread and release the inotify watch."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def drain(self):
+        """Take the changes whose files have settled.
+
+        Returns:
+            dict of str: str: The kind of change (FILE_ADDED, FILE_MODIFIED
+            or FILE_DELETED) keyed by the absolute path of the file. Files
+            that are still changing are kept for a later call.
+
+        """
+        return self._settled(take=True)
+
+    def peek(self):
+        """Return the changes whose files have settled without taking them.
+
+        Returns:
+            dict of str: str: The changes, as returned by drain. They are
+            still handed out by the next drain.
+
+        """
+        return self._settled(take=False)
+
+    def _settled(self, take: bool):
+        """Collect the settled changes for drain and peek."""
+        settled_before = time.monotonic() - self.debounce
+        changes = {}
+        with self._lock:
+            for path, (first_kind, last_event) in list(self._pending.items()):
+                if last_event > settled_before:
+                    continue
+                if take:
+                    del self._pending[path]
+                if not os.path.exists(path):
+                    changes[path] = FILE_DELETED
+                elif first_kind == FILE_ADDED:
+                    changes[path] = FILE_ADDED
+                else:
+                    changes[path] = FILE_MODIFIED
+        return changes
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until a change has settled, then take it.
+
+        Args:
+            timeout (Optional): The longest time to wait, in seconds. None
+            waits forever.
+
+        Returns:
+            dict of str: str: The changes, as returned by drain. Empty if
+            nothing settled in time.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = self.drain()
+            if changes:
+                return changes
+            with self._lock:
+                if self._pending:
+                    next_due = (min(last_event for kind, last_event
+                                    in self._pending.values())
+                                + self.debounce - time.monotonic())
+                else:
+                    next_due = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return {}
+                    next_due = (remaining if next_due is None
+                                else min(next_due, remaining))
+                if next_due is None or next_due > 0:
+                    self._changed.wait(next_due)
+
+    def _record(self, path: str, kind: str):
+        """Merge an event for a file into the pending changes."""
+        now = time.monotonic()
+        with self._lock:
+            previous = self._pending.get(path)
+            if previous is not None:
+                kind = previous[0]
+            self._pending[path] = (kind, now)
+            self._changed.notify_all()
+
+    def _scan(self):
+        """Read the size and mtime of every watched file in the directory."""
+        snapshot = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not self._file_filter(entry.name):
+                        continue
+                    try:
+                        file_stat = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (file_stat.st_mtime_ns,
+                                            file_stat.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def _rescan(self):
+        """Compare the directory with the last snapshot and record changes."""
+        snapshot = self._scan()
+        for path, file_state in snapshot.items():
+            previous = self._snapshot.get(path)
+            if previous is None:
+                self._record(path, FILE_ADDED)
+            elif previous != file_state:
+                self._record(path, FILE_MODIFIED)
+        for path in self._snapshot:
+            if path not in snapshot:
+                self._record(path, FILE_DELETED)
+        self._snapshot = snapshot
+
+    def _poll_loop(self):
+        """Scan the directory every poll_interval until stopped."""
+        while not self._stop.wait(self.poll_interval):
+            self._rescan()
+
+    def _inotify_loop(self):
+        """Read inotify events until stopped."""
+        # The stop flag is checked at least this often.
+        wake_interval = min(self.poll_interval, 0.5)
+        while not self._stop.is_set():
+            readable = select.select([self._inotify_fd], [], [],
+                                     wake_interval)[0]
+            if not readable:
+                continue
+            try:
+                data = os.read(self._inotify_fd, READ_SIZE)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            if not self._read_events(data):
+                # The directory was deleted or moved away, which removes
+                # the watch, so fall back to polling for it.
+                os.close(self._inotify_fd)
+                self._inotify_fd = None
+                self.backend = 'polling'
+                self._rescan()
+                self._poll_loop()
+                return
+
+    def _read_events(self, data: bytes):
+        """Record the changes described by a buffer of inotify events.
+
+        The snapshot only tracks which files are there, with no size or
+        mtime, so that they can be reported as deleted if the watch is
+        lost.
+
+        Returns:
+            bool: False if the directory itself was deleted or moved.
+
+        """
+        watching = True
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            mask, name_length = INOTIFY_EVENT.unpack_from(data, offset)[1::2]
+            start = offset + INOTIFY_EVENT.size
+            name = os.fsdecode(data[start:start + name_length].rstrip(b'\0'))
+            offset = start + name_length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so every file has to be looked at again.
+                self._snapshot = {}
+                self._rescan()
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                watching = False
+                continue
+            if not name or not self._file_filter(name):
+                continue
+            path = os.path.join(self.directory, name)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._snapshot[path] = None
+                self._record(path, FILE_ADDED)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._snapshot.pop(path, None)
+                self._record(path, FILE_DELETED)
+            else:
+                self._snapshot[path] = None
+                self._record(path, FILE_MODIFIED)
+        return watching
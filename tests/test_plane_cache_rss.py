@@ -0,0 +1,71 @@
+"""Checks that a PlaneCache keeps the RSS of a large library under budget.
+
+Each run is measured in a fresh process by benchmarks/plane_cache_rss.py,
+so the memory of one run or of the test runner can't hide another's.
+Run from the repository root with:
+
+    python -m unittest discover tests
+
+Copyright 2019 Jacqueline Button.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+BENCHMARKS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+
+from generate_library import generate_library  # noqa: E402
+from plane_cache_rss import RSS_ALLOWANCE  # noqa: E402
+from plane_cache_rss import measure  # noqa: E402
+
+PLANES = 1200
+CHECKLISTS = 10
+STEPS = 30
+CYCLES = 2
+BUDGET_BYTES = 2 * 1024 * 1024
+BUDGET_PLANES = 20
+
+
+class PlaneCacheRssTest(unittest.TestCase):
+    """Cycles through a generated library with and without a cache."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Generate the library shared by every test."""
+        cls.directory = tempfile.mkdtemp(prefix='flysimchk_test_')
+        generate_library(cls.directory, PLANES, CHECKLISTS, STEPS)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the generated library."""
+        shutil.rmtree(cls.directory)
+
+    def growth(self, result: dict):
+        """Return how far the RSS grew above what it was after the scan."""
+        return result['peak'] - result['baseline']
+
+    def test_without_cache_grows_past_budget(self):
+        """The library is large enough for the budget to matter."""
+        result = measure(self.directory, 0, 0, CYCLES)
+        self.assertGreater(self.growth(result), BUDGET_BYTES + RSS_ALLOWANCE)
+
+    def test_byte_budget_bounds_rss(self):
+        """RSS stays within the byte budget, plus the allowance."""
+        result = measure(self.directory, 0, BUDGET_BYTES, CYCLES)
+        self.assertLessEqual(result['resident_bytes'], BUDGET_BYTES)
+        self.assertLessEqual(self.growth(result),
+                             BUDGET_BYTES + RSS_ALLOWANCE)
+
+    def test_plane_budget_bounds_planes(self):
+        """No more planes than the budget are ever loaded at once."""
+        result = measure(self.directory, BUDGET_PLANES, 0, CYCLES)
+        self.assertLessEqual(result['most_planes'], BUDGET_PLANES)
+
+
+if __name__ == '__main__':
+    unittest.main()